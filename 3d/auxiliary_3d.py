@@ -1,21 +1,64 @@
-def draw_road(ind: Component3D, name: str):
-    svg_name = "img/img-" + str(name).zfill(2) + ".svg".format(name)
-    # Generating drawing in SVG format
-    with open(svg_name, "w") as f:
-        x_offset = 8000
-        z_offset = 4000
-        color = "(250, 216, 22)"
-        f.write('<svg width="{0}" height="{1}">\n'.format(16000, 8000))
-        f.write('<rect width="{0}" height="{1}" fill="black"/>\n'.format(16000, 8000))
-        for ray in ind.original_rays:
-            array = ray.ray_array
-            alpha = str(round(ray.intensity, 3))
-            color = "(250, 216, 22)"
-            if ray.road_intersection:
-                #print(float(ray.road_intersection[0]), float(ray.road_intersection[1]), float(ray.road_intersection[2]))
-                x_int = (float(ray.road_intersection[0]))
-                y_int = (float(ray.road_intersection[1]))
-                z_int = (float(ray.road_intersection[2]))
-                f.write(f"<circle cx = \"{x_int+x_offset}\" cy = \"{z_int+z_offset}\" r = \"40\" style=\"fill:rgb{color};fill-opacity:{alpha};\" />\n")
-
-        f.write('</svg>')
+from typing import List
+
+import numpy as np
+
+from auxiliary import write_png, write_pgm
+from component_3d import Component3D
+
+
+def draw_road(ind: Component3D, name: str, image_format: str = "png", image_width: int = 1200):
+    """
+    Create image of illuminance of road grid of an individual. Columns of cells go along the road, rows across it,
+    color of each cell is proportional to its intensity relative to the brightest cell.
+
+    :param ind: Individual evaluated with road grid
+    :param name: File name
+    :param image_format: png or pgm
+    :param image_width: Width of the image in pixels
+    """
+    grid = ind.grid_intensity.T
+    max_intensity = grid.max()
+    alpha = grid / max_intensity if max_intensity > 0 else np.zeros(grid.shape)
+    cells = (1 - alpha[:, :, None]) * 128 + alpha[:, :, None] * np.array([250, 6, 22])
+    cell_size = max(1, image_width // grid.shape[1])
+    image = np.round(np.repeat(np.repeat(cells, cell_size, axis=0), cell_size, axis=1)).astype(np.uint8)
+    file_name = "img/img-" + str(name).zfill(2) + "." + image_format
+    if image_format == "png":
+        write_png(file_name, image)
+    else:
+        write_pgm(file_name, image)
+
+
+def check_parameters_3d(road_start: int, road_end: int, road_width: int, road_depth: int, road_sections: int,
+                        crosswise_sections: int, criterion: str, cosine_error: str, reflective_factor: float,
+                        reflections_timeout: int, configuration: str) -> List[str]:
+    """
+    Check all parameters for environment of 3D model if their values are valid.
+    """
+    invalid = []
+    # Operators of 3D model work only with reflective facets
+    if configuration != "multiple free":
+        invalid.append("configuration")
+    if criterion not in ["efficiency", "illuminance uniformity", "obtrusive light elimination"]:
+        invalid.append("criterion")
+    if cosine_error not in ["yes", "no"]:
+        invalid.append("cosine error")
+
+    if type(road_start) != int:
+        invalid.append("road start")
+    if type(road_end) != int or road_end <= road_start:
+        invalid.append("road end")
+    if type(road_width) != int or road_width <= 0:
+        invalid.append("road width")
+    if type(road_depth) != int or road_depth >= 0:
+        invalid.append("road depth")
+    if type(road_sections) != int or road_sections <= 0:
+        invalid.append("road sections")
+    if type(crosswise_sections) != int or crosswise_sections <= 0:
+        invalid.append("road crosswise sections")
+
+    if type(reflective_factor) != float or reflective_factor <= 0 or reflective_factor > 1:
+        invalid.append("reflective factor")
+    if type(reflections_timeout) != int or reflections_timeout <= 2:
+        invalid.append("reflections timeout")
+    return invalid
@@ -1,71 +1,129 @@
+import copy
+import math
 import random
 from typing import List
 
-from numpy import arccos
-from sympy.geometry import Ray, Point, Segment
-from sympy import pi, sin, cos, Plane
+import numpy as np
+from sympy.geometry import Point
 
-from custom_ray import MyRay
-from custom_ray_3d import MyRay3D
-from environment import Environment
+from custom_ray_3d import MyRay3D, RayBundle3D, sample_ray_fan_3d
 
 
 class Component3D:
 
-    def __init__(self, number_of_rays: int, ray_distribution: str,  base_length: int, base_width: int):
+    def __init__(self, number_of_rays: int, ray_distribution: str,  base_length: int, base_width: int,
+                 no_of_reflective_facets: int = 0, distance_limit: int = 0, length_limit: int = 0):
 
         self.origin = Point(0, 0, 0)
 
         # Sampling light rays for given base slope
-        self.original_rays = self.sample_rays_3d(number_of_rays, ray_distribution)
+        self.ray_fan = None
+        self.rays = None
+        self._original_rays = None
+        self.sample_rays_3d(number_of_rays, ray_distribution)
 
-        self.reflective_segments = generate_reflective_segments(1, base_length, base_width)
+        # Reflective facets (facets x 4 x 3) are the genotype, triangles repeat their last vertex
+        if no_of_reflective_facets > 0:
+            self.reflective_facets = generate_reflective_facets(no_of_reflective_facets, distance_limit,
+                                                                length_limit)
+        else:
+            self.reflective_facets = generate_reflective_segments(1, base_length, base_width)
+        # Bounding volume hierarchy of reflective facets, built when the individual is evaluated
+        self.facet_bvh = None
 
         self.road_intersections = []
         self.intersections_on = []
         self.intersections_on_intensity = 0
         self.no_of_reflections = 0
         self.segments_intensity = []
+        # Intensity of incident rays of road grid cells and criteria computed from it
+        self.grid_intensity = None
+        self.fitness_array = []
 
-    def sample_rays_3d(self, number_of_rays: int, distribution: str) -> List[MyRay]:
+    def sample_rays_3d(self, number_of_rays: int, distribution: str):
         """
-        Sample given number of rays from LED according to base angle and distribution parameter.
+        Sample number_of_rays x number_of_rays rays from LED according to distribution parameter.
 
-        :param number_of_rays: Number of rays going from LED
+        :param number_of_rays: Square root of number of rays going from LED
         :param distribution: random vs uniform distribution - random is default
-        :param base_angle: Angle of base for LED
-        :return: List of rays from LED
         """
-        ray_array = []
-        for a in range(number_of_rays):
-            for b in range(number_of_rays):
-                if distribution == "uniform":
-                    theta = pi * 1/number_of_rays*a
-                    phi = pi * 1/number_of_rays*b
-
-                    u = 1/number_of_rays*a
-                    v = 1/number_of_rays*b
-                    phi = pi * u
-                    theta = arccos(2*v - 1)
-                else:
-                    u = random.random()
-                    v = random.random()
-                    phi = pi * u
-                    theta = arccos(2*v - 1)
-                    #theta = random.random()*pi
-                    #phi = random.random()*pi
-                #print(float(theta), float(phi))
-                new_ray = MyRay3D(self.origin, phi, theta)
-                ray_array.append(new_ray)
-        return ray_array
-
-
-def generate_reflective_segments(number_of_segments: int, base_length: int, base_width: int):
-    reflective_segments = []
-    reflective_plane = Plane(Point(10, 0, base_length / 2),
-                             Point(10, 0, -base_length / 2),
-                             Point(10, 10, -base_length / 2)
-                             )
-    reflective_segments.append(reflective_plane)
-    return reflective_segments
+        self.ray_fan = sample_ray_fan_3d(number_of_rays, distribution)
+        self.rays = RayBundle3D(self.ray_fan, self.origin)
+        self._original_rays = None
 
+    @property
+    def original_rays(self) -> List[MyRay3D]:
+        """
+        Rays from LED as MyRay3D objects used by SymPy functions. They are created on first use.
+        """
+        if self._original_rays is None:
+            self._original_rays = [MyRay3D(self.origin, phi, theta, intensity)
+                                   for (phi, theta), intensity in zip(self.ray_fan.angles, self.ray_fan.intensities)]
+        return self._original_rays
+
+    def clone(self) -> "Component3D":
+        """
+        Copy the individual. Ray fan and bounding volume hierarchy are never modified, so they are shared with
+        the copy. Facets, lists and trace of rays are copied.
+
+        :return: Copy of the individual
+        """
+        clone = copy.copy(self)
+        clone._original_rays = None
+        clone.rays = copy.deepcopy(self.rays)
+        clone.reflective_facets = self.reflective_facets.copy()
+        for name in ("road_intersections", "intersections_on", "segments_intensity"):
+            setattr(clone, name, list(getattr(self, name)))
+        if hasattr(self, "fitness"):
+            clone.fitness = copy.deepcopy(self.fitness)
+        return clone
+
+    def __deepcopy__(self, memo) -> "Component3D":
+        return self.clone()
+
+
+def generate_reflective_segments(number_of_segments: int, base_length: int, base_width: int) -> np.ndarray:
+    """
+    Generate reflective facets of the default lamp - rectangles in plane x = 10 of base length (z-axis)
+    and base width (y-axis)
+
+    :param number_of_segments: Number of reflective facets
+    :param base_length: Length of base
+    :param base_width: Width of base
+    :return: Array (facets x 4 x 3)
+    """
+    facet = [[10, -base_width / 2, -base_length / 2], [10, base_width / 2, -base_length / 2],
+             [10, base_width / 2, base_length / 2], [10, -base_width / 2, base_length / 2]]
+    return np.array([facet] * number_of_segments, dtype=float)
+
+
+def generate_reflective_facets(number_of_facets: int, distance_limit: int, length_limit: int) -> np.ndarray:
+    """
+    Generate random reflective facets for one individual according to given parameters. Each facet is
+    a rectangle or a triangle with random orientation.
+
+    :param number_of_facets: Number of reflective facets
+    :param distance_limit: Max distance of center of a facet from origin (for one axis)
+    :param length_limit: Max size of a facet
+    :return: Array (facets x 4 x 3)
+    """
+    facets = np.empty((number_of_facets, 4, 3))
+    for index in range(number_of_facets):
+        center = np.array([random.randint(-distance_limit, distance_limit) for _ in range(3)], dtype=float)
+        normal = np.array([random.gauss(0, 1) for _ in range(3)])
+        # Two orthogonal unit vectors in plane of the facet
+        helper = np.eye(3)[np.argmin(np.abs(normal))]
+        u = np.cross(normal, helper)
+        u /= np.linalg.norm(u)
+        v = np.cross(normal, u)
+        v /= np.linalg.norm(v)
+        a = random.uniform(1, length_limit / 2)
+        b = random.uniform(1, length_limit / 2)
+        if random.random() < 0.5:
+            vertices = [center - a * u - b * v, center + a * u - b * v, center + a * u + b * v, center - a * u + b * v]
+        else:
+            angles = [math.radians(120 * corner) for corner in range(3)]
+            vertices = [center + a * math.cos(angle) * u + b * math.sin(angle) * v for angle in angles]
+            vertices.append(vertices[-1])
+        facets[index] = vertices
+    return facets
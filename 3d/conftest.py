@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 3D model uses modules of 2D model from the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
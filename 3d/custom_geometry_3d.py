@@ -4,10 +4,9 @@ from typing import List, Tuple
 from sympy import Rational, sin, cos, Plane
 from sympy.geometry import Ray, Point, Segment
 
-from auxiliary import print_ray, print_point_3d
 from component import Component
 from custom_ray import MyRay
-from custom_ray_3d import MyRay3D, print_ray_3d
+from custom_ray_3d import MyRay3D, print_point_3d, print_ray_3d
 
 
 def compute_intersections_3d(rays: List[MyRay3D], road: Plane) -> List[Tuple[Rational, float]]:
@@ -0,0 +1,494 @@
+import copy
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+from sympy import Plane
+
+from component_3d import Component3D
+
+# Float backend of 3D model. Planes are stored as a point and unit normal, convex polygons as arrays of vertices
+# (polygons x vertices x 3) in order along their boundary. Polygons with fewer vertices are padded by repeating
+# their last vertex, zero length edges do not restrict anything.
+
+# Intersections closer than this to the ray origin are the point the ray has just been reflected from
+EPSILON = 1e-7
+
+# Boxes of bounding volume hierarchy are enlarged by TOLERANCE, so that facets parallel to an axis have boxes
+# with non-zero volume
+TOLERANCE = 1e-6
+
+# Bounding volume hierarchy is used for individuals with at least this many facets, leaves hold BVH_LEAF_SIZE
+# facets
+BVH_MIN_FACETS = 16
+BVH_LEAF_SIZE = 4
+
+
+def plane_to_array(plane: Plane) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert SymPy Plane into float point and unit normal
+
+    :param plane: SymPy Plane
+    :return: Tuple (point [x, y, z], unit normal [x, y, z])
+    """
+    point = np.array([float(coordinate) for coordinate in plane.p1])
+    normal = np.array([float(coordinate) for coordinate in plane.normal_vector])
+    return point, normal / np.linalg.norm(normal)
+
+
+def polygon_planes(polygons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute planes of convex polygons. Normal is computed by Newell's method, so it does not depend on padding and
+    the polygon lies on the left side of each edge when looking against the normal.
+
+    :param polygons: Array (polygons x vertices x 3)
+    :return: Tuple (points (polygons x 3), unit normals (polygons x 3))
+    """
+    normals = np.sum(np.cross(polygons, np.roll(polygons, -1, axis=1)), axis=1)
+    return polygons[:, 0], normals / np.linalg.norm(normals, axis=1)[:, None]
+
+
+def ray_plane_distances(origins: np.ndarray, directions: np.ndarray, points: np.ndarray,
+                        normals: np.ndarray) -> np.ndarray:
+    """
+    Compute distances from ray origins to intersections with planes. Rays parallel to plane and planes behind
+    the ray do not intersect.
+
+    :param origins: Array (rays x 3) of ray origins
+    :param directions: Array (rays x 3) of unit ray directions
+    :param points: Array (planes x 3) of points on planes
+    :param normals: Array (planes x 3) of unit plane normals
+    :return: Array (rays x planes) of distances, inf where there is no intersection
+    """
+    denominator = directions @ normals.T
+    numerator = np.sum(points * normals, axis=1)[None, :] - origins @ normals.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = numerator / denominator
+    return np.where((np.abs(denominator) > EPSILON) & (distance > EPSILON), distance, np.inf)
+
+
+def inside_polygons(points: np.ndarray, polygons: np.ndarray, normals: np.ndarray) -> np.ndarray:
+    """
+    Check whether points lying in planes of convex polygons are inside of the polygons (boundary included)
+
+    :param points: Array (rays x polygons x 3), point in plane of each polygon
+    :param polygons: Array (polygons x vertices x 3)
+    :param normals: Array (polygons x 3) of unit normals computed by polygon_planes
+    :return: Array (rays x polygons) of booleans
+    """
+    edges = np.roll(polygons, -1, axis=1) - polygons
+    relative = points[:, :, None, :] - polygons[None]
+    side = np.einsum("rpvk,pk->rpv", np.cross(edges[None], relative), normals)
+    return np.all(side >= -EPSILON * np.linalg.norm(edges, axis=2)[None], axis=2)
+
+
+def ray_polygon_distances(origins: np.ndarray, directions: np.ndarray, polygons: np.ndarray, points: np.ndarray,
+                          normals: np.ndarray) -> np.ndarray:
+    """
+    Compute distances from ray origins to intersections with convex polygons
+
+    :param origins: Array (rays x 3) of ray origins
+    :param directions: Array (rays x 3) of unit ray directions
+    :param polygons: Array (polygons x vertices x 3)
+    :param points: Array (polygons x 3) of points on polygon planes
+    :param normals: Array (polygons x 3) of unit normals computed by polygon_planes
+    :return: Array (rays x polygons) of distances, inf where there is no intersection
+    """
+    distance = ray_plane_distances(origins, directions, points, normals)
+    finite = np.where(np.isfinite(distance), distance, 0)
+    hit_points = origins[:, None, :] + finite[:, :, None] * directions[:, None, :]
+    return np.where(inside_polygons(hit_points, polygons, normals), distance, np.inf)
+
+
+def reflect(directions: np.ndarray, normals: np.ndarray) -> np.ndarray:
+    """
+    Reflect directions from surfaces with given normals, d - 2(d.n)n
+
+    :param directions: Array (rays x 3) of directions
+    :param normals: Array (rays x 3) of unit normals
+    :return: Array (rays x 3) of reflected directions
+    """
+    return directions - 2 * np.sum(directions * normals, axis=1)[:, None] * normals
+
+
+def trace_rays_3d(origins: np.ndarray, directions: np.ndarray, intensities: np.ndarray, points: np.ndarray,
+                  normals: np.ndarray, r_factor: float, r_timeout: int, polygons: Optional[np.ndarray] = None,
+                  last_reflection: Optional[np.ndarray] = None) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trace all rays at once. In each bounce compute matrix of distances (rays x surfaces) to intersections, choose
+    the closest surface for each ray and reflect the rays that hit something. A ray is never reflected from the
+    surface it was reflected from last time. Rays reaching reflections timeout are terminated.
+
+    :param origins: Array (rays x 3) of ray origins
+    :param directions: Array (rays x 3) of ray directions
+    :param intensities: Array of ray intensities
+    :param points: Array (surfaces x 3) of points on surfaces
+    :param normals: Array (surfaces x 3) of unit surface normals
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    :param polygons: Array (surfaces x vertices x 3) if surfaces are convex polygons, None for infinite planes
+    :param last_reflection: Array of indices of surface each ray starts on (-1 for none)
+    :return: Tuple (reflection points (bounces x rays x 3, NaN when the ray has no more reflections),
+     final directions, final intensities, terminated mask, number of reflections of each ray, indices of hit
+     surfaces (bounces x rays, -1 when the ray has no more reflections))
+    """
+    origins = np.array(origins, dtype=float)
+    directions = np.array(directions, dtype=float)
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    intensities = np.array(intensities, dtype=float)
+    if last_reflection is None:
+        last_reflection = np.full(len(origins), -1)
+    else:
+        last_reflection = np.array(last_reflection)
+    no_of_reflections = np.zeros(len(origins), dtype=int)
+    hit_points = np.full((r_timeout, len(origins), 3), np.nan)
+    hit_surfaces = np.full((r_timeout, len(origins)), -1)
+    surface_indices = np.arange(len(points))
+
+    active = np.arange(len(origins))
+    bounces = r_timeout
+    for bounce in range(r_timeout):
+        if len(active) == 0 or len(points) == 0:
+            bounces = bounce
+            break
+        origin = origins[active]
+        direction = directions[active]
+        if polygons is None:
+            distance = ray_plane_distances(origin, direction, points, normals)
+        else:
+            distance = ray_polygon_distances(origin, direction, polygons, points, normals)
+        distance[surface_indices[None, :] == last_reflection[active][:, None]] = np.inf
+        closest = np.argmin(distance, axis=1)
+        closest_distance = distance[np.arange(len(active)), closest]
+        hit = np.isfinite(closest_distance)
+
+        active = active[hit]
+        closest = closest[hit]
+        reflection_points = origin[hit] + closest_distance[hit][:, None] * direction[hit]
+        hit_points[bounce, active] = reflection_points
+        hit_surfaces[bounce, active] = closest
+        origins[active] = reflection_points
+        directions[active] = reflect(direction[hit], normals[closest])
+        intensities[active] *= r_factor
+        last_reflection[active] = closest
+        no_of_reflections[active] += 1
+    terminated = no_of_reflections == r_timeout
+    return hit_points[:bounces], directions, intensities, terminated, no_of_reflections, hit_surfaces[:bounces]
+
+
+def road_hits_3d(origins: np.ndarray, directions: np.ndarray, road_point: np.ndarray, road_normal: np.ndarray) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute intersections of rays with road plane
+
+    :param origins: Array (rays x 3) of ray origins
+    :param directions: Array (rays x 3) of unit ray directions
+    :param road_point: Point on road plane
+    :param road_normal: Unit normal of road plane
+    :return: Tuple (intersection points (rays x 3, NaN if there is none), cosine of angle between ray and normal)
+    """
+    distance = ray_plane_distances(origins, directions, road_point[None], road_normal[None])[:, 0]
+    hit = np.isfinite(distance)
+    points = np.full(origins.shape, np.nan)
+    points[hit] = origins[hit] + distance[hit, None] * directions[hit]
+    return points, np.abs(directions @ road_normal)
+
+
+def cross_3d(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Compute cross products of 3D vectors along the last axis (faster than np.cross for small arrays)
+    """
+    return np.stack([a[..., 1] * b[..., 2] - a[..., 2] * b[..., 1],
+                     a[..., 2] * b[..., 0] - a[..., 0] * b[..., 2],
+                     a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]], axis=-1)
+
+
+def polygon_hits(origins: np.ndarray, directions: np.ndarray, polygons: np.ndarray, normals: np.ndarray,
+                 edges: np.ndarray) -> np.ndarray:
+    """
+    Compute distances from ray origins to intersections with convex polygons for pairs of rays and polygons
+
+    :param origins: Array (pairs x 3) of ray origins
+    :param directions: Array (pairs x 3) of unit ray directions
+    :param polygons: Array (pairs x vertices x 3) of polygons
+    :param normals: Array (pairs x 3) of unit normals computed by polygon_planes
+    :param edges: Array (pairs x vertices x 3) of polygon edges, vertex i to vertex i + 1
+    :return: Array of distances, inf where there is no intersection
+    """
+    denominator = np.einsum("pk,pk->p", directions, normals)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = np.einsum("pk,pk->p", polygons[:, 0] - origins, normals) / denominator
+    valid = (np.abs(denominator) > EPSILON) & (distance > EPSILON)
+    hit_points = origins + np.where(valid, distance, 0)[:, None] * directions
+    side = np.einsum("pvk,pk->pv", cross_3d(edges, hit_points[:, None, :] - polygons), normals)
+    valid &= np.all(side >= -EPSILON * np.sqrt(np.einsum("pvk,pvk->pv", edges, edges)), axis=1)
+    return np.where(valid, distance, np.inf)
+
+
+class FacetBVH:
+    """
+    Bounding volume hierarchy over reflective facets of one individual. It is a complete binary tree stored by
+    levels, levels[k] holds boxes (nodes x [min, max] x 3) of 2^k nodes, children of node i are nodes 2i and 2i + 1.
+    Leaf i holds facets order[i * BVH_LEAF_SIZE:(i + 1) * BVH_LEAF_SIZE], -1 marks an empty slot.
+    The tree is never modified after it is built, update returns a new tree, so it can be shared by clones.
+    """
+
+    def __init__(self, facets: np.ndarray):
+        self.facets = facets.astype(float)
+        self._facet_geometry()
+        number_of_leaves = 2 ** math.ceil(math.log2(max(1, math.ceil(len(facets) / BVH_LEAF_SIZE))))
+        self.depth = int(math.log2(number_of_leaves))
+        self.order = np.full(number_of_leaves * BVH_LEAF_SIZE, -1)
+        self._split(np.arange(len(facets)), 0, number_of_leaves)
+        # Slot of each facet in order
+        self.position = np.empty(len(facets), dtype=int)
+        self.position[self.order[self.order >= 0]] = np.flatnonzero(self.order >= 0)
+        self.levels = [np.full((2 ** level, 2, 3), np.nan) for level in range(self.depth + 1)]
+        self._refit(np.arange(number_of_leaves))
+
+    def _facet_geometry(self):
+        """
+        Compute normals and edges of facets used by intersection tests
+        """
+        _, self.normals = polygon_planes(self.facets)
+        self.edges = np.roll(self.facets, -1, axis=1) - self.facets
+
+    def _split(self, indices: np.ndarray, first_leaf: int, number_of_leaves: int):
+        """
+        Distribute facets into leaves, facets are split in half by their centers along the longest axis
+
+        :param indices: Indices of facets
+        :param first_leaf: First leaf of the subtree
+        :param number_of_leaves: Number of leaves of the subtree
+        """
+        if number_of_leaves == 1:
+            self.order[first_leaf * BVH_LEAF_SIZE:first_leaf * BVH_LEAF_SIZE + len(indices)] = indices
+            return
+        if len(indices) > 1:
+            centers = self.facets[indices].mean(axis=1)
+            axis = np.argmax(np.ptp(centers, axis=0))
+            indices = indices[np.argsort(centers[:, axis], kind="stable")]
+        half = (len(indices) + 1) // 2
+        self._split(indices[:half], first_leaf, number_of_leaves // 2)
+        self._split(indices[half:], first_leaf + number_of_leaves // 2, number_of_leaves // 2)
+
+    def _refit(self, leaves: np.ndarray):
+        """
+        Recompute boxes of given leaves and of all their ancestors
+
+        :param leaves: Indices of leaves
+        """
+        slots = self.order[leaves[:, None] * BVH_LEAF_SIZE + np.arange(BVH_LEAF_SIZE)]
+        points = np.where((slots >= 0)[:, :, None, None], self.facets[slots], np.nan).reshape(len(leaves), -1, 3)
+        self.levels[self.depth][leaves, 0] = np.fmin.reduce(points, axis=1) - TOLERANCE
+        self.levels[self.depth][leaves, 1] = np.fmax.reduce(points, axis=1) + TOLERANCE
+        nodes = leaves
+        for level in range(self.depth - 1, -1, -1):
+            nodes = np.unique(nodes // 2)
+            children = self.levels[level + 1]
+            self.levels[level][nodes, 0] = np.fmin(children[2 * nodes, 0], children[2 * nodes + 1, 0])
+            self.levels[level][nodes, 1] = np.fmax(children[2 * nodes, 1], children[2 * nodes + 1, 1])
+
+    def update(self, facets: np.ndarray) -> "FacetBVH":
+        """
+        Get tree for modified facets. If only few facets changed (e.g. after shift, rotation or resizing of one
+        facet), only boxes on their paths to the root are recomputed, otherwise the tree is built again.
+
+        :param facets: Array (facets x vertices x 3) of current facets
+        :return: Tree for given facets
+        """
+        if facets.shape != self.facets.shape:
+            return FacetBVH(facets)
+        changed = np.flatnonzero(np.any(facets != self.facets, axis=(1, 2)))
+        if len(changed) == 0:
+            return self
+        if len(changed) > len(facets) // 4:
+            return FacetBVH(facets)
+        bvh = copy.copy(self)
+        bvh.facets = facets.astype(float)
+        bvh._facet_geometry()
+        bvh.levels = [level.copy() for level in self.levels]
+        bvh._refit(np.unique(self.position[changed] // BVH_LEAF_SIZE))
+        return bvh
+
+    def closest_hits(self, origins: np.ndarray, directions: np.ndarray, last_reflection: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest facet hit by each ray. The tree is traversed level by level for all rays at once,
+        only facets in leaves whose boxes are hit by the ray are tested.
+
+        :param origins: Array (rays x 3) of ray origins
+        :param directions: Array (rays x 3) of unit ray directions
+        :param last_reflection: Array of indices of facet each ray starts on (-1 for none)
+        :return: Tuple (distance to the closest hit, inf if there is none; index of the closest facet, -1 if
+         there is none)
+        """
+        with np.errstate(divide="ignore", over="ignore"):
+            inverse = 1 / np.where(directions == 0, 1e-300, directions)
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=int)
+        for level in range(self.depth + 1):
+            boxes = self.levels[level][nodes]
+            with np.errstate(invalid="ignore", over="ignore"):
+                lower = (boxes[:, 0] - origins[rays]) * inverse[rays]
+                upper = (boxes[:, 1] - origins[rays]) * inverse[rays]
+                near = np.max(np.minimum(lower, upper), axis=1)
+                far = np.min(np.maximum(lower, upper), axis=1)
+                hit = (near <= far) & (far > EPSILON)
+            rays, nodes = rays[hit], nodes[hit]
+            if level < self.depth:
+                rays = np.repeat(rays, 2)
+                nodes = (2 * nodes[:, None] + np.arange(2)).ravel()
+
+        facet = self.order[nodes[:, None] * BVH_LEAF_SIZE + np.arange(BVH_LEAF_SIZE)].ravel()
+        rays = np.repeat(rays, BVH_LEAF_SIZE)
+        keep = (facet >= 0) & (facet != last_reflection[rays])
+        rays, facet = rays[keep], facet[keep]
+        distance = polygon_hits(origins[rays], directions[rays], self.facets[facet], self.normals[facet],
+                                self.edges[facet])
+        valid = np.isfinite(distance)
+        rays, facet, distance = rays[valid], facet[valid], distance[valid]
+
+        # The closest hit of each ray, ties are resolved by facet index as in trace_rays_3d
+        closest_distance = np.full(len(origins), np.inf)
+        closest = np.full(len(origins), -1)
+        order = np.lexsort((facet, distance, rays))
+        first = order[np.r_[True, rays[order][1:] != rays[order][:-1]]] if len(order) else order
+        closest_distance[rays[first]] = distance[first]
+        closest[rays[first]] = facet[first]
+        return closest_distance, closest
+
+
+def trace_rays_bvh_3d(origins: np.ndarray, directions: np.ndarray, intensities: np.ndarray, bvh: FacetBVH,
+                      last_reflection: np.ndarray, r_factor: float, r_timeout: int) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trace all rays at once like trace_rays_3d, closest facets are found with bounding volume hierarchy.
+
+    :param origins: Array (rays x 3) of ray origins
+    :param directions: Array (rays x 3) of ray directions
+    :param intensities: Array of ray intensities
+    :param bvh: Bounding volume hierarchy of reflective facets
+    :param last_reflection: Array of indices of facet each ray starts on (-1 for none)
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    :return: Tuple (reflection points (bounces x rays x 3, NaN when the ray has no more reflections),
+     final directions, final intensities, terminated mask, number of reflections of each ray, indices of hit
+     facets (bounces x rays, -1 when the ray has no more reflections))
+    """
+    origins = np.array(origins, dtype=float)
+    directions = np.array(directions, dtype=float)
+    directions /= np.linalg.norm(directions, axis=1)[:, None]
+    intensities = np.array(intensities, dtype=float)
+    last_reflection = np.array(last_reflection)
+    no_of_reflections = np.zeros(len(origins), dtype=int)
+    hit_points = np.full((r_timeout, len(origins), 3), np.nan)
+    hit_facets = np.full((r_timeout, len(origins)), -1)
+
+    active = np.arange(len(origins))
+    bounces = r_timeout
+    for bounce in range(r_timeout):
+        if len(active) == 0:
+            bounces = bounce
+            break
+        distance, closest = bvh.closest_hits(origins[active], directions[active], last_reflection[active])
+        hit = closest >= 0
+        active, closest, distance = active[hit], closest[hit], distance[hit]
+        direction = directions[active]
+        reflection_points = origins[active] + distance[:, None] * direction
+        hit_points[bounce, active] = reflection_points
+        hit_facets[bounce, active] = closest
+        origins[active] = reflection_points
+        directions[active] = reflect(direction, bvh.normals[closest])
+        intensities[active] *= r_factor
+        last_reflection[active] = closest
+        no_of_reflections[active] += 1
+    terminated = no_of_reflections == r_timeout
+    return hit_points[:bounces], directions, intensities, terminated, no_of_reflections, hit_facets[:bounces]
+
+
+def compute_reflections_facets(ind: Component3D, r_factor: float, r_timeout: int):
+    """
+    Trace rays of individual reflected from its reflective facets and store the trace in its ray bundle.
+    Individuals with at least BVH_MIN_FACETS facets use bounding volume hierarchy kept by the individual,
+    the hierarchy is refitted when only few facets changed since the last evaluation.
+
+    :param ind: Individual
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    """
+    bundle = ind.rays
+    number_of_rays = len(bundle)
+    origins = bundle.path[bundle.path_offsets[:-1]]
+    facets = ind.reflective_facets
+    if len(facets) >= BVH_MIN_FACETS:
+        if ind.facet_bvh is None:
+            ind.facet_bvh = FacetBVH(facets)
+        else:
+            ind.facet_bvh = ind.facet_bvh.update(facets)
+        trace = trace_rays_bvh_3d(origins, ind.ray_fan.directions, ind.ray_fan.intensities, ind.facet_bvh,
+                                  np.full(number_of_rays, -1), r_factor, r_timeout)
+    else:
+        points, normals = polygon_planes(facets)
+        trace = trace_rays_3d(origins, ind.ray_fan.directions, ind.ray_fan.intensities, points, normals,
+                              r_factor, r_timeout, polygons=facets)
+    hit_points, bundle.directions, bundle.intensities, bundle.terminated, bundle.no_of_reflections, _ = trace
+
+    # Paths are origin followed by reflection points of each ray
+    all_points = np.concatenate([origins[None], hit_points]).transpose(1, 0, 2)
+    keep = ~np.isnan(all_points[:, :, 0])
+    bundle.path = all_points[keep]
+    bundle.path_offsets = np.concatenate([[0], np.cumsum(keep.sum(axis=1))])
+    bundle.origins = bundle.path[bundle.path_offsets[1:] - 1]
+    bundle.road_intersections = np.full((number_of_rays, 3), np.nan)
+    ind.no_of_reflections = int(bundle.no_of_reflections.sum())
+
+
+def rotate_facet(facet: np.ndarray, axis: np.ndarray, angle: int) -> np.ndarray:
+    """
+    Rotate facet around given axis going through its center
+
+    :param facet: Array (vertices x 3)
+    :param axis: Direction of rotation axis
+    :param angle: Angle of rotation (in degrees)
+    :return: Rotated facet
+    """
+    axis = axis / np.linalg.norm(axis)
+    radians = math.radians(angle)
+    center = facet.mean(axis=0)
+    relative = facet - center
+    # Rodrigues' rotation formula
+    rotated = relative * math.cos(radians) + np.cross(axis, relative) * math.sin(radians) + \
+        np.outer(relative @ axis, axis) * (1 - math.cos(radians))
+    return rotated + center
+
+
+def change_size_facet(facet: np.ndarray, coefficient: float) -> np.ndarray:
+    """
+    Scale facet by given coefficient, its center stays in place
+
+    :param facet: Array (vertices x 3)
+    :param coefficient: Scale coefficient
+    :return: Scaled facet
+    """
+    center = facet.mean(axis=0)
+    return center + coefficient * (facet - center)
+
+
+def compute_intersections_3d(ind: Component3D, road: Plane) -> np.ndarray:
+    """
+    Compute intersections of traced rays of individual with road plane and store them in its ray bundle.
+    Terminated rays never reach the road.
+
+    :param ind: Individual with traced rays
+    :param road: Plane of road
+    :return: Array (hits x 3) of x, y coordinates of road intersection and intensity of incident ray
+    """
+    bundle = ind.rays
+    road_point, road_normal = plane_to_array(road)
+    points, _ = road_hits_3d(bundle.origins, bundle.directions, road_point, road_normal)
+    points[bundle.terminated] = np.nan
+    bundle.road_intersections = points
+    hit = ~np.isnan(points[:, 0])
+    return np.stack([points[hit, 0], points[hit, 1], bundle.intensities[hit]], axis=1)
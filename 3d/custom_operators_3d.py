@@ -0,0 +1,71 @@
+import random
+
+import numpy as np
+
+from component_3d import Component3D
+from custom_geometry_3d_numpy import rotate_facet, change_size_facet
+
+
+def shift_one_facet(reflective_facets: np.ndarray, axis: str) -> np.ndarray:
+    """
+    Shift one facet from array of reflective facets of an individual
+
+    :param reflective_facets: Array of all reflective facets of one individual
+    :param axis: Indicator whether to use X-axis, Y-axis or Z-axis
+    :return: Array of all reflective facets with one shifted
+    """
+    chosen_facet_index = random.randint(0, len(reflective_facets)-1)
+    shift_amount = random.randint(-100, 100)
+    modified_facets = reflective_facets.copy()
+    modified_facets[chosen_facet_index, :, "xyz".index(axis)] += shift_amount
+    return modified_facets
+
+
+def rotate_one_facet(reflective_facets: np.ndarray) -> np.ndarray:
+    """
+    Rotate one facet from array of reflective facets of an individual around random axis going through its center
+
+    :param reflective_facets: Array of all reflective facets of one individual
+    :return: Array of all reflective facets with one rotated
+    """
+    chosen_facet_index = random.randint(0, len(reflective_facets)-1)
+    axis = np.array([random.gauss(0, 1) for _ in range(3)])
+    shift_amount = random.randint(-30, 30)
+    modified_facets = reflective_facets.copy()
+    modified_facets[chosen_facet_index] = rotate_facet(reflective_facets[chosen_facet_index], axis, shift_amount)
+    return modified_facets
+
+
+def resize_one_facet(reflective_facets: np.ndarray) -> np.ndarray:
+    """
+    Resize one facet from array of reflective facets of an individual
+
+    :param reflective_facets: Array of all reflective facets of one individual
+    :return: Array of all reflective facets with one resized
+    """
+    chosen_facet_index = random.randint(0, len(reflective_facets)-1)
+    change_size_coefficient = random.random()*2
+    if change_size_coefficient < 0.5:
+        change_size_coefficient = 0.5
+    modified_facets = reflective_facets.copy()
+    modified_facets[chosen_facet_index] = change_size_facet(reflective_facets[chosen_facet_index],
+                                                            change_size_coefficient)
+    return modified_facets
+
+
+def x_over_multiple_facets(ind1: Component3D, ind2: Component3D) -> (Component3D, Component3D):
+    """
+    Perform crossover of two individuals. Split the arrays of reflective facets at randomly selected point
+    and concatenate two parts from two individuals.
+
+    :param ind1: First individual
+    :param ind2: Second individual
+    :return: Tuple of individuals with crossover of reflective facets
+    """
+    length = len(ind1.reflective_facets)
+    x_over_point = random.randint(1, length-1)
+    new_facets_1 = np.concatenate([ind1.reflective_facets[:x_over_point], ind2.reflective_facets[x_over_point:]])
+    new_facets_2 = np.concatenate([ind2.reflective_facets[:x_over_point], ind1.reflective_facets[x_over_point:]])
+    ind1.reflective_facets = new_facets_1
+    ind2.reflective_facets = new_facets_2
+    return ind1, ind2
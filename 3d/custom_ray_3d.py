@@ -1,12 +1,109 @@
 import math
+import random
+from typing import NamedTuple, Tuple
 
+import numpy as np
 from sympy import Point, Ray
 
+from custom_ray import halton_sequence, sobol_sequence
+
+# Mean intensity of random rays, (1/pi + pi/8), intensity of every importance sampled ray
+LAMBERTIAN_MEAN_3D = 1 / math.pi + math.pi / 8
+
+
+class RayFan3D(NamedTuple):
+    """
+    Angles, directions and intensities of rays sampled from LED in 3D. Angles (phi, theta) are the angles the rays
+    are sampled with, MyRay3D(origin, phi, theta) is the same ray as directions[i].
+    """
+    angles: np.ndarray
+    directions: np.ndarray
+    intensities: np.ndarray
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def sample_ray_fan_3d(number_of_rays: int, distribution: str) -> RayFan3D:
+    """
+    Sample number_of_rays x number_of_rays rays from LED. Points u, v of unit square are either uniform grid,
+    random, stratified (random point in each cell of the grid), Sobol or Halton points, phi = pi * u and
+    theta = arccos(2v - 1). Importance sampled rays have density proportional to their intensity.
+
+    :param number_of_rays: Square root of number of rays going from LED
+    :param distribution: random, uniform, stratified, sobol, halton or importance - random is default
+    :return: Ray fan
+    """
+    count = number_of_rays * number_of_rays
+    if distribution == "uniform":
+        steps = np.arange(number_of_rays) / number_of_rays
+        u, v = np.meshgrid(steps, steps, indexing="ij")
+        u = u.ravel()
+        v = v.ravel()
+    elif distribution == "sobol":
+        u, v = sobol_sequence(count, 2).T
+    elif distribution == "halton":
+        u = halton_sequence(count, 2)
+        v = halton_sequence(count, 3)
+    elif distribution in ["stratified", "importance"]:
+        steps = np.arange(number_of_rays)
+        u, v = np.meshgrid(steps, steps, indexing="ij")
+        u = (u.ravel() + np.array([random.random() for _ in range(count)])) / number_of_rays
+        v = (v.ravel() + np.array([random.random() for _ in range(count)])) / number_of_rays
+    else:
+        u = np.empty(count)
+        v = np.empty(count)
+        for index in range(len(u)):
+            u[index] = random.random()
+            v[index] = random.random()
+    if distribution == "importance":
+        phi, theta = importance_angles_3d(u, v)
+    else:
+        phi = np.pi * u
+        theta = np.arccos(2 * v - 1)
+    # The same formulas as in MyRay3D, which gets phi as its theta and theta as its phi
+    directions = np.stack([np.sin(theta) * np.cos(phi), -np.sin(theta) * np.sin(phi), np.cos(theta)], axis=1)
+    if distribution == "importance":
+        intensities = np.full(count, LAMBERTIAN_MEAN_3D)
+    else:
+        intensities = (np.abs(np.sin(phi)) + np.abs(np.sin(theta))) / 2
+    angles = np.stack([phi, theta], axis=1)
+    for array in (angles, directions, intensities):
+        array.flags.writeable = False
+    return RayFan3D(angles, directions, intensities)
+
+
+def importance_angles_3d(u: np.ndarray, v: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Map points of unit square to angles with density proportional to intensity of rays, (sin(phi) + sin(theta)) / 2
+    relative to density of random rays (sin(theta) / 2pi). The density is mixture of sin(phi) sin(theta) / 4 and
+    sin(theta)^2 / (pi^2 / 2) in ratio of their integrals, component of each ray is chosen at random.
+
+    :param u: Array of points in [0, 1)
+    :param v: Array of points in [0, 1)
+    :return: Tuple (phi, theta)
+    """
+    first = np.array([random.random() for _ in range(len(u))]) < 4 / (4 + np.pi ** 2 / 2)
+    phi = np.where(first, np.arccos(1 - 2 * u), np.pi * u)
+    theta = np.arccos(2 * v - 1)
+    # Inverse of cumulative distribution function (theta - sin(theta) cos(theta)) / pi found by bisection
+    lower = np.zeros(len(v))
+    upper = np.full(len(v), np.pi)
+    for _ in range(50):
+        middle = (lower + upper) / 2
+        below = middle - np.sin(middle) * np.cos(middle) < np.pi * v
+        lower = np.where(below, middle, lower)
+        upper = np.where(below, upper, middle)
+    theta = np.where(first, theta, (lower + upper) / 2)
+    return phi, theta
+
 
 class MyRay3D:
 
-    def __init__(self, origin: Point, theta: float, phi: float):
-        self.intensity = (abs(math.sin(abs(theta))) + abs(math.sin(abs(phi)))) / 2
+    def __init__(self, origin: Point, theta: float, phi: float, intensity: float = None):
+        if intensity is None:
+            intensity = (abs(math.sin(abs(theta))) + abs(math.sin(abs(phi)))) / 2
+        self.intensity = intensity
         x = math.sin(phi) * math.cos(theta)
         y = math.sin(phi) * math.sin(theta)
         z = math.cos(phi)
@@ -15,6 +112,46 @@ class MyRay3D:
         self.ray_array = [Ray(origin, Point(x, -y, z))]
         self.road_intersection = []
 
+
+class RayBundle3D:
+    """
+    Trace state of all rays of one 3D individual stored as arrays. Path of ray i (origin and all reflection points)
+    is path[path_offsets[i]:path_offsets[i + 1]], the last part of the ray starts at origins[i] and goes in
+    direction directions[i]. road_intersections holds point where each ray hits the road (NaN if it does not).
+    """
+    __slots__ = ("origins", "directions", "intensities", "terminated", "no_of_reflections", "path", "path_offsets",
+                 "road_intersections")
+
+    def __init__(self, fan: RayFan3D, origin: Point):
+        number_of_rays = len(fan.angles)
+        self.origins = np.tile(np.array([float(origin.x), float(origin.y), float(origin.z)]), (number_of_rays, 1))
+        self.directions = fan.directions
+        self.intensities = fan.intensities
+        self.terminated = np.zeros(number_of_rays, dtype=bool)
+        self.no_of_reflections = np.zeros(number_of_rays, dtype=int)
+        self.path = self.origins
+        self.path_offsets = np.arange(number_of_rays + 1)
+        self.road_intersections = np.full((number_of_rays, 3), np.nan)
+
+    def __len__(self) -> int:
+        return len(self.origins)
+
+    def __deepcopy__(self, memo) -> "RayBundle3D":
+        bundle = RayBundle3D.__new__(RayBundle3D)
+        for name in self.__slots__:
+            setattr(bundle, name, getattr(self, name).copy())
+        return bundle
+
+    def ray_path(self, index: int) -> np.ndarray:
+        """
+        Points of polyline of given ray - origin and all reflection points
+
+        :param index: Index of the ray
+        :return: Array (points x 3)
+        """
+        return self.path[self.path_offsets[index]:self.path_offsets[index + 1]]
+
+
 def print_ray_3d(ray: Ray):
     point1 = ray.p1
     x = round(float(point1.x), 2)
@@ -26,3 +163,9 @@ def print_ray_3d(ray: Ray):
     z2 = round(float(point2.z), 2)
     print("X: ", x, "Y: ", y, " Z: ", z, "      -- X: ", x2, "        Y: ", y2, "       Z: ", z2)
 
+
+def print_point_3d(point: Point):
+    x = round(float(point.x), 2)
+    y = round(float(point.y), 2)
+    z = round(float(point.z), 2)
+    print("X: ", x, "Y: ", y, " Z: ", z)
@@ -1,16 +1,15 @@
 import random
-import math
+from functools import lru_cache
 
+import numpy as np
 from sympy import Plane, Point
 
-from auxiliary import draw, log_stats_init, log_stats_append, draw_road
+from auxiliary import log_stats_init, log_stats_append
+from auxiliary_3d import check_parameters_3d, draw_road
 from component_3d import Component3D
-from custom_geometry import compute_intersections, compute_reflections_two_segments, \
-    compute_reflection_multiple_segments
-from custom_geometry_3d import compute_intersections_3d, compute_reflections_multiple_planes
-from custom_operators import mate, mutate_angle, mutate_length, shift_one_segment, rotate_one_segment, \
-    resize_one_segment
-from quality_assessment import glare_reduction, efficiency, illuminance_uniformity, light_pollution
+from custom_geometry_3d_numpy import compute_intersections_3d, compute_reflections_facets, plane_to_array
+from custom_operators_3d import shift_one_facet, rotate_one_facet, resize_one_facet, x_over_multiple_facets
+from quality_assessment_3d import compute_grid_intensity, road_grid_criteria
 
 from deap import base
 from deap import creator
@@ -18,51 +17,65 @@ from deap import tools
 from deap.tools import HallOfFame
 from python_json_config import ConfigBuilder
 
-from component import Component
 from environment import Environment
-from quality_precalculations import compute_segments_intensity, compute_proportional_intensity
-
-
-def evaluate(individual: Component, env: Environment):
-
-    road = Plane(Point(0, -500, 0), Point(1, -500, 1), Point(4, -500, -4))
-    road_intersections = compute_intersections_3d(individual.original_rays, road)
-    print(len(road_intersections))
-    compute_reflections_multiple_planes(individual)
-    road_intersections = compute_intersections_3d(individual.original_rays, road)
-    print(len(road_intersections))
-    return len(road_intersections)
-    if env.configuration == "two connected":
-        compute_reflections_two_segments(individual, env.reflective_factor)
-    if env.configuration == "multiple free":
-        compute_reflection_multiple_segments(individual)
-    if env.quality_criterion == "light pollution":
-        return light_pollution(individual.original_rays)
-    if env.quality_criterion == "glare reduction":
-        return glare_reduction(individual)
-    road_intersections = compute_intersections(individual.original_rays, env.road, env.cosine_error)
-    if env.quality_criterion == "efficiency":
-        return efficiency(road_intersections, individual.original_rays)
+
+
+@lru_cache(maxsize=None)
+def road_plane(road_depth: int) -> Plane:
+    """
+    Road is horizontal plane below the lamp, road grid goes along x-axis and across z-axis
+
+    :param road_depth: Y coordinate of the road
+    :return: Plane of the road
+    """
+    return Plane(Point(0, road_depth, 0), Point(1, road_depth, 1), Point(4, road_depth, -4))
+
+
+def evaluate(individual: Component3D, env: Environment, road_width: int, crosswise_sections: int) -> float:
+    """
+    Evaluate individual of 3D model. Rays are traced, their road intersections are binned into road grid and all
+    criteria of the grid are stored in fitness array of the individual.
+
+    :param individual: Individual
+    :param env: Environment
+    :param road_width: Width of the road
+    :param crosswise_sections: Number of road grid cells across the road
+    :return: Value of quality criterion from environment
+    """
+    compute_reflections_facets(individual, env.reflective_factor, env.reflections_timeout)
+    road = road_plane(env.road_depth)
+    compute_intersections_3d(individual, road)
+    intensities = individual.rays.intensities
+    if env.cosine_error == "yes":
+        _, road_normal = plane_to_array(road)
+        intensities = intensities * np.abs(individual.rays.directions @ road_normal)
+    individual.grid_intensity, spill = compute_grid_intensity(individual.rays.road_intersections, intensities,
+                                                              env.road_start, env.road_length, road_width,
+                                                              env.road_sections, crosswise_sections)
+    individual.fitness_array = road_grid_criteria(individual.grid_intensity, spill,
+                                                  float(individual.ray_fan.intensities.sum()))
     if env.quality_criterion == "illuminance uniformity":
-        segments_intensity = compute_segments_intensity(road_intersections, env.road_sections, env.road_start, env.road_length)
-        individual.segments_intensity_proportional = compute_proportional_intensity(segments_intensity)
-        return illuminance_uniformity(segments_intensity)
-    return efficiency(individual)
+        return float(individual.fitness_array[1])
+    if env.quality_criterion == "obtrusive light elimination":
+        return float(1 - individual.fitness_array[3])
+    return float(individual.fitness_array[0])
 
 
 def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
-              angle_lower_bound: int, angle_upper_bound: int, length_lower_bound: int, length_upper_bound: int,
               no_of_reflective_segments: int, distance_limit: int, length_limit: int,
-              population_size: int, number_of_generations: int,
-              xover_prob: float, mut_angle_prob: float, mut_length_prob: float,
-              shift_segment_prob: float, rotate_segment_prob: float, resize_segment_prob: float):
+              population_size: int, number_of_generations: int, xover_prob: float,
+              shift_segment_prob: float, rotate_segment_prob: float, resize_segment_prob: float,
+              base_length: int, base_width: int, road_width: int, crosswise_sections: int = 1):
 
     # Initiating evolutionary algorithm
-    creator.create("Fitness", base.Fitness, weights=(1.0,))
-    creator.create("Individual", Component3D, fitness=creator.Fitness)
+    # Classes have own names, so that they do not replace classes of 2D model created by evolution module
+    creator.create("Fitness3D", base.Fitness, weights=(1.0,))
+    creator.create("Individual3D", Component3D, fitness=creator.Fitness3D)
     toolbox = base.Toolbox()
-    toolbox.register("individual", creator.Individual, number_of_rays=number_of_rays,
-                     ray_distribution=ray_distribution, base_length=env.road_length, base_width=env.road_width)
+    toolbox.register("individual", creator.Individual3D, number_of_rays=number_of_rays,
+                     ray_distribution=ray_distribution, base_length=base_length, base_width=base_width,
+                     no_of_reflective_facets=no_of_reflective_segments, distance_limit=distance_limit,
+                     length_limit=length_limit)
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
     toolbox.register("select", tools.selTournament, tournsize=2)
 
@@ -72,7 +85,7 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
     # Evaluating fitness
     fitnesses = []
     for item in pop:
-        fitnesses.append(evaluate(item, env))
+        fitnesses.append(evaluate(item, env, road_width, crosswise_sections))
     for ind, fit in zip(pop, fitnesses):
         ind.fitness = fit
 
@@ -103,40 +116,28 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
         for child1, child2 in zip(offspring[::2], offspring[1::2]):
             # cross two individuals with probability xover_prob
             if random.random() < xover_prob:
-                mate(child1, child2)
+                x_over_multiple_facets(child1, child2)
                 # fitness values of the children must be recalculated later
                 child1.fitness = 0
                 child2.fitness = 0
 
         for mutant in offspring:
-            if env.configuration == "multiple free":
-                if random.random() < shift_segment_prob:
-                    mutant.reflective_segments = shift_one_segment(mutant.reflective_segments, "x")
-                    mutant.fitness = 0
+            for axis in ["x", "y", "z"]:
                 if random.random() < shift_segment_prob:
-                    mutant.reflective_segments = shift_one_segment(mutant.reflective_segments, "y")
-                    mutant.fitness = 0
-                if random.random() < rotate_segment_prob:
-                    mutant.reflective_segments = rotate_one_segment(mutant.reflective_segments)
-                    mutant.fitness = 0
-                if random.random() < resize_segment_prob:
-                    mutant.reflective_segments = resize_one_segment(mutant.reflective_segments)
-                    mutant.fitness = 0
-
-
-            if env.configuration == "two connected":
-                if random.random() < mut_angle_prob:
-                    mutate_angle(mutant)
-                    mutant.fitness = 0
-                if random.random() < mut_length_prob:
-                    mutate_length(mutant, length_upper_bound, length_lower_bound)
+                    mutant.reflective_facets = shift_one_facet(mutant.reflective_facets, axis)
                     mutant.fitness = 0
+            if random.random() < rotate_segment_prob:
+                mutant.reflective_facets = rotate_one_facet(mutant.reflective_facets)
+                mutant.fitness = 0
+            if random.random() < resize_segment_prob:
+                mutant.reflective_facets = resize_one_facet(mutant.reflective_facets)
+                mutant.fitness = 0
 
         # Evaluate the individuals with an invalid fitness
         invalid_ind = [ind for ind in offspring if ind.fitness == 0]
         fitnesses = []
         for item in invalid_ind:
-            fitnesses.append(evaluate(item, env))
+            fitnesses.append(evaluate(item, env, road_width, crosswise_sections))
         for ind, fit in zip(invalid_ind, fitnesses):
             ind.fitness = fit
 
@@ -150,13 +151,13 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
 
         fitnesses = []
         for item in pop:
-            fitnesses.append(evaluate(item, env))
+            fitnesses.append(evaluate(item, env, road_width, crosswise_sections))
         print(fitnesses)
 
         stats_line = f"{g+1}, {best_ind.fitness}, {sum(fitnesses) / population_size}"
         log_stats_append(f"stats", stats_line)
         print(f"Best individual has fitness: {best_ind.fitness}")
-        draw(best_ind, f"best{g}", env)
+        draw_road(best_ind, f"best{g}")
 
     print("-- End of (successful) evolution --")
     print("--")
@@ -165,41 +166,44 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
 def main():
     # create config parser
     builder = ConfigBuilder()
-    # parse configuration from file parameters.json
+    # parse configuration from file parameters_3d.json
     config = builder.parse_config('parameters_3d.json')
 
     # Load parameters for environment
-    dimensions = config.dimensions
     base_length = config.lamp.base_length
     base_width = config.lamp.base_width
-    base_slope = config.lamp.base_slope
     road_start = config.road.start
     road_end = config.road.end
     road_width = config.road.width
     road_depth = config.road.depth
     road_sections = config.road.sections
+    road_crosswise_sections = config.road.crosswise_sections
     configuration = config.lamp.configuration
 
     # Load parameters for evaluation
     criterion = config.evaluation.criterion
     cosine_error = config.evaluation.cosine_error
     reflective_factor = config.evaluation.reflective_factor
-
-    # Init environment
-    env = Environment(dimensions, base_length, base_width, base_slope,
-                      road_start, road_end, road_width, road_depth, road_sections,
-                      criterion, cosine_error, reflective_factor, configuration)
+    reflections_timeout = config.evaluation.reflections_timeout
+
+    invalid_parameters = check_parameters_3d(road_start, road_end, road_width, road_depth, road_sections,
+                                             road_crosswise_sections, criterion, cosine_error, reflective_factor,
+                                             reflections_timeout, configuration)
+    if invalid_parameters:
+        print(f"Invalid value for parameters {invalid_parameters}")
+        return
+    else:
+        print(f" Environment parameters: ok")
+    # Init environment, 3D model has one LED and does not use weights of weighted sum
+    env = Environment(road_start=road_start, road_end=road_end, road_depth=road_depth, road_sections=road_sections,
+                      criterion=criterion, cosine_error=cosine_error, reflective_factor=reflective_factor,
+                      configuration=configuration, number_of_led=1, separating_distance=0, modification="shift",
+                      weights=[1, 1, 1, 1], reflections_timeout=reflections_timeout, backend="numpy")
 
     # Load parameters for LED
     sqrt_of_number_of_rays = config.lamp.sqrt_of_number_of_rays
     ray_distribution = config.lamp.ray_distribution
 
-    # Load limits for two connected reflective surfaces
-    angle_lower_bound = config.lamp.two_connected.angle_lower_bound
-    angle_upper_bound = config.lamp.two_connected.angle_upper_bound
-    length_lower_bound = config.lamp.two_connected.length_lower_bound
-    length_upper_bound = config.lamp.two_connected.length_upper_bound
-
     # Load limits for multiple free reflective surfaces
     no_of_reflective_segments = config.lamp.multiple_free.no_of_reflective_segments
     distance_limit = config.lamp.multiple_free.distance_limit
@@ -212,18 +216,15 @@ def main():
     # Load parameters for evolution
     operators = config.evolution.operators
     xover_prob = operators.xover_prob
-    angle_mut_prob = operators.mutation.angle_mutation_prob
-    length_mut_prob = operators.mutation.length_mutation_prob
     shift_segment_prob = operators.mutation.segment_shift_prob
     rotate_segment_prob = operators.mutation.segment_rotation_prob
     resize_segment_prob = operators.mutation.segment_resizing_prob
 
 
     # Run evolution algorithm
-    evolution(env, sqrt_of_number_of_rays, ray_distribution, angle_lower_bound, angle_upper_bound,
-              length_lower_bound, length_upper_bound, no_of_reflective_segments, distance_limit, length_limit,
-              population_size, number_of_generations, xover_prob, angle_mut_prob, length_mut_prob,
-              shift_segment_prob, rotate_segment_prob, resize_segment_prob)
+    evolution(env, sqrt_of_number_of_rays, ray_distribution, no_of_reflective_segments, distance_limit, length_limit,
+              population_size, number_of_generations, xover_prob, shift_segment_prob, rotate_segment_prob,
+              resize_segment_prob, base_length, base_width, road_width, road_crosswise_sections)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def compute_grid_intensity(points: np.ndarray, intensities: np.ndarray, road_start: int, road_length: int,
+                           road_width: int, road_sections: int, crosswise_sections: int) -> Tuple[np.ndarray, float]:
+    """
+    Compute sum of intensity of incident rays for each cell of road grid. Road goes along x-axis from road start,
+    it is road width wide along z-axis centered on the lamp. Hits are binned by weighted 2D histogram in one pass.
+
+    :param points: Array (rays x 3) of road intersections, NaN if there is none
+    :param intensities: Array of intensities of incident rays
+    :param road_start: X coordinate of start of the road
+    :param road_length: Length of the road
+    :param road_width: Width of the road
+    :param road_sections: Number of cells along the road
+    :param crosswise_sections: Number of cells across the road
+    :return: Tuple (array (road sections x crosswise sections) of intensity of incident rays of each cell,
+     intensity of incident rays that missed the grid)
+    """
+    # Borders of cells are accumulated the same way as borders of road sections in 2D model
+    borders_x = np.cumsum(np.concatenate([[road_start], np.full(road_sections, road_length / road_sections)]))
+    borders_z = np.cumsum(np.concatenate([[-road_width / 2], np.full(crosswise_sections,
+                                                                     road_width / crosswise_sections)]))
+    section = np.searchsorted(borders_x, points[:, 0], side="right") - 1
+    crosswise = np.searchsorted(borders_z, points[:, 2], side="right") - 1
+    hit = ~np.isnan(points[:, 0])
+    valid = hit & (section >= 0) & (section < road_sections) & (crosswise >= 0) & (crosswise < crosswise_sections)
+    index = section[valid] * crosswise_sections + crosswise[valid]
+    grid = np.bincount(index, weights=intensities[valid], minlength=road_sections * crosswise_sections)
+    spill = float(intensities[hit & ~valid].sum())
+    return grid.reshape(road_sections, crosswise_sections), spill
+
+
+def road_grid_criteria(grid: np.ndarray, spill: float, total_intensity: float) -> np.ndarray:
+    """
+    Compute quality criteria of 3D model from intensity of road grid cells
+
+    :param grid: Array (road sections x crosswise sections) of intensity of incident rays
+    :param spill: Intensity of incident rays that missed the grid
+    :param total_intensity: Total intensity of all rays from LED
+    :return: Array of efficiency (fraction of intensity of all rays that falls on the road), illuminance
+     uniformity min/avg, illuminance uniformity min/max and spill (fraction of light reaching the road plane
+     that falls outside of the road)
+    """
+    on_road = grid.sum()
+    min_illuminance = grid.min()
+    max_illuminance = grid.max()
+    average_illuminance = on_road / grid.size
+    return np.array([on_road / total_intensity if total_intensity else 0,
+                     min_illuminance / average_illuminance if average_illuminance else 0,
+                     min_illuminance / max_illuminance if max_illuminance else 0,
+                     spill / (on_road + spill) if on_road + spill else 0])
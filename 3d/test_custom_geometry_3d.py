@@ -0,0 +1,257 @@
+import json
+import random
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+from sympy import Plane, Point, Ray
+
+import custom_geometry_3d
+import custom_geometry_3d_numpy
+import evolution_3d
+from component_3d import Component3D
+from custom_geometry_3d_numpy import TOLERANCE, FacetBVH, compute_reflections_facets, inside_polygons, \
+    plane_to_array, polygon_planes, ray_plane_distances, reflect, road_hits_3d, trace_rays_3d, trace_rays_bvh_3d
+from custom_operators_3d import resize_one_facet, rotate_one_facet, shift_one_facet
+from custom_ray_3d import MyRay3D, sample_ray_fan_3d
+
+ROAD = Plane(Point(0, -500, 0), Point(1, -500, 1), Point(4, -500, -4))
+SQUARE = [[10, -5, -5], [10, 5, -5], [10, 5, 5], [10, -5, 5]]
+# Triangle is padded by repeating its last vertex
+TRIANGLE = [[0, 0, 20], [10, 0, 20], [0, 10, 20], [0, 10, 20]]
+
+
+def to_float(point: Point) -> np.ndarray:
+    return np.array([float(coordinate) for coordinate in point])
+
+
+@pytest.mark.parametrize(
+    ['origin', 'direction', 'plane'],
+    [
+        [[0, 0, 0], [1, 2, 3], Plane(Point(10, 0, 0), normal_vector=(1, 0, 0))],
+        [[0, 0, 0], [-1, 2, 3], Plane(Point(10, 0, 0), normal_vector=(1, 0, 0))],
+        [[1, -2, 3], [0.5, -1, 0.25], ROAD],
+        [[0, 0, 0], [1, 0, 1], Plane(Point(0, 5, 0), normal_vector=(0, 1, 0))],
+        [[3, 1, -2], [1, 1, 1], Plane(Point(10, 0, 0), normal_vector=(1, 1, 0))],
+    ]
+)
+def test_ray_plane_distances(origin: List[float], direction: List[float], plane: Plane):
+    point, normal = plane_to_array(plane)
+    unit = np.array(direction, dtype=float) / np.linalg.norm(direction)
+    distance = ray_plane_distances(np.array([origin], dtype=float), unit[None], point[None], normal[None])
+    expected = plane.intersection(Ray(Point(*origin), Point(*(np.array(origin) + np.array(direction)))))
+    if expected:
+        assert np.allclose(origin + distance[0, 0] * unit, to_float(expected[0]), atol=TOLERANCE)
+    else:
+        assert distance[0, 0] == np.inf
+
+
+@pytest.mark.parametrize(
+    ['point', 'expected'],
+    [
+        [[10, 1, 0], [True, False]],
+        [[10, 5, 5], [True, False]],
+        [[10, 5.1, 0], [False, False]],
+        [[2, 2, 20], [False, True]],
+        [[5, 5, 20], [False, True]],
+        [[6, 6, 20], [False, False]],
+        [[-0.1, 5, 20], [False, False]],
+    ]
+)
+def test_inside_polygons(point: List[float], expected: List[bool]):
+    polygons = np.array([SQUARE, TRIANGLE], dtype=float)
+    _, normals = polygon_planes(polygons)
+    # Point is projected to the plane of each polygon along its normal
+    points = np.array([np.array(point) - (np.array(point) - polygons[index, 0]) @ normals[index] * normals[index]
+                       for index in range(len(polygons))])
+    assert inside_polygons(points[None], polygons, normals)[0].tolist() == expected
+    # Orientation of the polygon does not matter
+    flipped = polygons[:, ::-1]
+    _, flipped_normals = polygon_planes(flipped)
+    assert inside_polygons(points[None], flipped, flipped_normals)[0].tolist() == expected
+
+
+@pytest.mark.parametrize(
+    ['direction', 'plane_x'],
+    [
+        [[1, 2, 3], 10],
+        [[1, -0.5, 0.25], 4],
+        [[-2, 1, -1], -7],
+    ]
+)
+def test_reflect(direction: List[float], plane_x: int):
+    plane = Plane(Point(plane_x, 0, 0), normal_vector=(1, 0, 0))
+    expected = custom_geometry_3d.compute_reflection_plane(plane, Ray(Point(0, 0, 0), Point(*direction)))
+    _, normal = plane_to_array(plane)
+    unit = np.array(direction, dtype=float) / np.linalg.norm(direction)
+    reflected = reflect(unit[None], normal[None])[0]
+    expected_direction = to_float(expected.p2) - to_float(expected.p1)
+    assert np.allclose(reflected, expected_direction / np.linalg.norm(expected_direction), atol=TOLERANCE)
+    assert np.isclose(np.linalg.norm(reflected), 1)
+
+
+def test_trace_rays_3d_nearest_hit():
+    # Two parallel facets in front of the ray and one behind it, the ray is reflected from the nearest one
+    facets = np.array([[[x, -50, -50], [x, 50, -50], [x, 50, 50], [x, -50, 50]] for x in [20, 10, -30]],
+                      dtype=float)
+    points, normals = polygon_planes(facets)
+    direction = np.array([1, 0.2, 0.1])
+    hit_points, directions, intensities, terminated, no_of_reflections, hit_surfaces = \
+        trace_rays_3d(np.zeros((1, 3)), direction[None], np.ones(1), points, normals, 0.9, 20, polygons=facets)
+
+    # Expected path from SymPy reflections, the ray bounces between x = 10 and x = -30 until it leaves facets
+    ray = Ray(Point(0, 0, 0), Point(*direction))
+    expected_points = []
+    plane_x = 10
+    while True:
+        plane = Plane(Point(plane_x, 0, 0), normal_vector=(1, 0, 0))
+        intersection = ray.intersection(plane)[0]
+        if abs(intersection.y) > 50 or abs(intersection.z) > 50:
+            break
+        expected_points.append(to_float(intersection))
+        ray = custom_geometry_3d.compute_reflection_plane(plane, ray)
+        plane_x = -20 - plane_x
+    assert no_of_reflections[0] == len(expected_points) and not terminated[0]
+    assert np.allclose(hit_points[:len(expected_points), 0], expected_points, atol=TOLERANCE)
+    assert hit_surfaces[:len(expected_points), 0].tolist() == [1, 2] * 3 + [1]
+    expected_direction = to_float(ray.p2) - to_float(ray.p1)
+    assert np.allclose(directions[0], expected_direction / np.linalg.norm(expected_direction), atol=TOLERANCE)
+    assert np.isclose(intensities[0], 0.9 ** len(expected_points))
+
+
+def test_trace_rays_3d_timeout():
+    # Ray perpendicular to two parallel infinite planes is reflected until reflections timeout
+    points = np.array([[10, 0, 0], [-10, 0, 0]], dtype=float)
+    normals = np.array([[1, 0, 0], [1, 0, 0]], dtype=float)
+    origins = np.zeros((2, 3))
+    directions = np.array([[1, 0, 0], [0, 1, 0]], dtype=float)
+    hit_points, directions, intensities, terminated, no_of_reflections, hit_surfaces = \
+        trace_rays_3d(origins, directions, np.ones(2), points, normals, 0.5, 5)
+    assert terminated.tolist() == [True, False]
+    assert no_of_reflections.tolist() == [5, 0]
+    assert np.allclose(hit_points[:, 0, 0], [10, -10, 10, -10, 10])
+    assert np.all(np.isnan(hit_points[:, 1]))
+    assert hit_surfaces[:, 0].tolist() == [0, 1, 0, 1, 0]
+    assert np.allclose(intensities, [0.5 ** 5, 1])
+
+
+@pytest.mark.filterwarnings("error")
+def test_road_hits_3d():
+    fan = sample_ray_fan_3d(6, "uniform")
+    origins = np.zeros((len(fan.directions), 3))
+    road_point, road_normal = plane_to_array(ROAD)
+    points, _ = road_hits_3d(origins, fan.directions, road_point, road_normal)
+    rays = [MyRay3D(Point(0, 0, 0), phi, theta) for phi, theta in fan.angles]
+    custom_geometry_3d.compute_intersections_3d(rays, ROAD)
+    expected = np.array([[float(coordinate) for coordinate in ray.road_intersection] if ray.road_intersection
+                         else [np.nan] * 3 for ray in rays])
+    assert np.any(np.isnan(expected[:, 0])) and not np.all(np.isnan(expected[:, 0]))
+    assert np.allclose(points, expected, atol=TOLERANCE, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    ['number_of_rays', 'number_of_facets', 'seed'],
+    [
+        [10, 1, 0],
+        [20, 20, 1],
+        [20, 200, 2],
+    ]
+)
+def test_trace_rays_bvh_3d(number_of_rays: int, number_of_facets: int, seed: int):
+    random.seed(seed)
+    ind = Component3D(number_of_rays, "uniform", 0, 0, number_of_facets, 100, 300)
+    facets = ind.reflective_facets
+    # Axis-parallel facets have flat boxes
+    facets[0, :, 0] = facets[0, 0, 0]
+    origins = np.zeros((len(ind.rays), 3))
+    directions = ind.ray_fan.directions
+    intensities = ind.ray_fan.intensities
+    last_reflection = np.full(len(origins), -1)
+    points, normals = polygon_planes(facets)
+    expected = trace_rays_3d(origins, directions, intensities, points, normals, 0.9, 20, polygons=facets)
+    bvh = FacetBVH(facets)
+    actual = trace_rays_bvh_3d(origins, directions, intensities, bvh, last_reflection, 0.9, 20)
+    assert np.any(expected[4] > 0)
+    for actual_part, expected_part in zip(actual, expected):
+        assert np.allclose(actual_part, expected_part, equal_nan=True)
+
+    facets = facets.copy()
+    facets[-1] += 500
+    updated = bvh.update(facets)
+    assert not np.allclose(bvh.facets, facets)
+    assert np.allclose(updated.levels[0], FacetBVH(facets).levels[0])
+    points, normals = polygon_planes(facets)
+    expected = trace_rays_3d(origins, directions, intensities, points, normals, 0.9, 20, polygons=facets)
+    actual = trace_rays_bvh_3d(origins, directions, intensities, updated, last_reflection, 0.9, 20)
+    for actual_part, expected_part in zip(actual, expected):
+        assert np.allclose(actual_part, expected_part, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    'mutation',
+    [
+        lambda facets: shift_one_facet(facets, "x"),
+        lambda facets: shift_one_facet(facets, "z"),
+        rotate_one_facet,
+        resize_one_facet,
+    ]
+)
+def test_facet_operators(mutation, monkeypatch):
+    monkeypatch.setattr(custom_geometry_3d_numpy, "BVH_MIN_FACETS", 1)
+    random.seed(3)
+    ind = Component3D(10, "uniform", 0, 0, 24, 400, 300)
+    compute_reflections_facets(ind, 0.9, 20)
+    bvh = ind.facet_bvh
+    parent = ind.clone()
+    ind.reflective_facets = mutation(ind.reflective_facets)
+    changed = np.flatnonzero(np.any(ind.reflective_facets != parent.reflective_facets, axis=(1, 2)))
+    assert len(changed) == 1
+
+    # Vertices of every facet stay in plane of the facet
+    points, normals = polygon_planes(ind.reflective_facets)
+    offsets = np.einsum("fvk,fk->fv", ind.reflective_facets - points[:, None], normals)
+    assert np.allclose(offsets, 0, atol=TOLERANCE)
+
+    # Tree of the individual is refitted, tree shared with the parent is kept
+    compute_reflections_facets(ind, 0.9, 20)
+    assert ind.facet_bvh is not bvh and parent.facet_bvh is bvh
+    assert np.array_equal(bvh.facets, parent.reflective_facets)
+    assert np.array_equal(ind.facet_bvh.facets, ind.reflective_facets)
+    assert np.allclose(ind.facet_bvh.levels[0], FacetBVH(ind.reflective_facets).levels[0])
+    expected = ind.clone()
+    expected.facet_bvh = None
+    monkeypatch.setattr(custom_geometry_3d_numpy, "BVH_MIN_FACETS", 64)
+    compute_reflections_facets(expected, 0.9, 20)
+    assert np.array_equal(ind.rays.path_offsets, expected.rays.path_offsets)
+    assert np.allclose(ind.rays.path, expected.rays.path)
+    assert np.allclose(ind.rays.intensities, expected.rays.intensities)
+
+
+def test_main_3d(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "stats").mkdir()
+    (tmp_path / "img").mkdir()
+    with open(Path(__file__).parent / "parameters_3d.json") as f:
+        config = json.load(f)
+    config["lamp"]["sqrt_of_number_of_rays"] = 10
+    config["evolution"]["number_of_generations"] = 1
+    with open("parameters_3d.json", "w") as f:
+        json.dump(config, f)
+    environments = []
+    evolution = evolution_3d.evolution
+    monkeypatch.setattr(evolution_3d, "evolution", lambda env, *args: environments.append(env) or evolution(env, *args))
+    random.seed(2)
+    evolution_3d.main()
+
+    env = environments[0]
+    road = config["road"]
+    assert (env.road_start, env.road_end, env.road_depth, env.road_sections) == \
+        (road["start"], road["end"], road["depth"], road["sections"])
+    assert env.reflections_timeout == config["evaluation"]["reflections_timeout"]
+    assert env.quality_criterion == config["evaluation"]["criterion"]
+    with open("stats/log-stats.csv") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 2
+    assert all(0 < float(value) <= 1 for line in lines for value in line.split(", ")[1:])
+    assert (tmp_path / "img" / "img-best0.png").exists()
@@ -0,0 +1,54 @@
+from typing import List
+
+import numpy as np
+import pytest
+
+from quality_assessment_3d import compute_grid_intensity, road_grid_criteria
+
+
+@pytest.mark.parametrize(
+    ['points', 'intensities', 'expected_grid', 'expected_spill'],
+    [
+        # Points on lower borders of cells belong to the cell, the end of the road and the edges of the road do not
+        [[[0, -500, -10], [25, -500, 0], [99.9, -500, 9.9], [100, -500, 0], [50, -500, 10], [50, -500, -10.1],
+          [-1, -500, 0], [np.nan, np.nan, np.nan]],
+         [1, 2, 3, 4, 5, 6, 7, 8], [[1, 0], [0, 2], [0, 0], [0, 3]], 22],
+        [[[10, -500, 5], [10, -500, 5], [60, -500, -5]], [0.5, 0.25, 1], [[0, 0.75], [0, 0], [1, 0], [0, 0]], 0],
+        [[[np.nan, np.nan, np.nan]] * 3, [1, 1, 1], [[0, 0]] * 4, 0],
+        [np.empty((0, 3)), [], [[0, 0]] * 4, 0],
+    ]
+)
+def test_compute_grid_intensity(points: List[List[float]], intensities: List[float],
+                                expected_grid: List[List[float]], expected_spill: float):
+    grid, spill = compute_grid_intensity(np.array(points, dtype=float), np.array(intensities, dtype=float),
+                                         road_start=0, road_length=100, road_width=20, road_sections=4,
+                                         crosswise_sections=2)
+    assert grid.shape == (4, 2)
+    assert np.allclose(grid, expected_grid)
+    assert abs(spill - expected_spill) < 0.0001
+
+
+def test_compute_grid_intensity_histogram():
+    rng = np.random.default_rng(0)
+    points = np.stack([rng.uniform(-1000, 13000, 500), np.full(500, -500.0), rng.uniform(-400, 400, 500)], axis=1)
+    intensities = rng.uniform(0, 1, 500)
+    grid, spill = compute_grid_intensity(points, intensities, 0, 12000, 600, 8, 3)
+    expected, _, _ = np.histogram2d(points[:, 0], points[:, 2], bins=[np.linspace(0, 12000, 9),
+                                                                       np.linspace(-300, 300, 4)],
+                                    weights=intensities)
+    assert np.allclose(grid, expected)
+    assert abs(spill + grid.sum() - intensities.sum()) < 0.0001
+
+
+@pytest.mark.parametrize(
+    ['grid', 'spill', 'total_intensity', 'expected'],
+    [
+        [[[1, 0], [0, 2], [0, 0], [0, 3]], 22, 50, [0.12, 0, 0, 22 / 28]],
+        [[[2, 2], [1, 3]], 0, 16, [0.5, 0.5, 1 / 3, 0]],
+        [[[1, 1, 1]], 1, 4, [0.75, 1, 1, 0.25]],
+        [[[0, 0], [0, 0]], 0, 0, [0, 0, 0, 0]],
+    ]
+)
+def test_road_grid_criteria(grid: List[List[float]], spill: float, total_intensity: float, expected: List[float]):
+    actual = road_grid_criteria(np.array(grid, dtype=float), spill, total_intensity)
+    assert np.allclose(actual, expected)
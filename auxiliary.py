@@ -1,9 +1,24 @@
+import atexit
+import csv
+import gzip
+import json
 import math
-from typing import List
+import os
+import pickle
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
 
 from component import Component
 from environment import Environment
 
+# Maximal number of samples of segments rasterized at once
+RASTER_CHUNK = 1 << 20
+
 
 def log_stats_init(name: str, line: str):
     """
@@ -31,6 +46,97 @@ def log_stats_append(name: str, line: str):
         f.write(line)
 
 
+class StatsLogger:
+
+    def __init__(self, name: str, columns: List[str], stats_format: str = "csv", flush_interval: float = 10,
+                 append: bool = False):
+        """
+        Buffered writer of stats rows. The file stays open for the whole evolution, rows are flushed to the file
+        at most every flush_interval seconds, when the logger is closed and at exit of the program. Rows are written
+        as CSV with header (lists in cells are encoded as JSON) or as JSON lines.
+
+        :param name: File name, stats are stored in stats/log-<name>.csv or stats/log-<name>.jsonl
+        :param columns: Names of columns
+        :param stats_format: csv or jsonl
+        :param flush_interval: Minimal number of seconds between flushes
+        :param append: Append rows to existing file instead of creating new one
+        """
+        self.file_name = "stats/log-" + str(name) + "." + stats_format
+        self.columns = columns
+        self.stats_format = stats_format
+        self.flush_interval = flush_interval
+        write_header = stats_format == "csv" and not (append and os.path.exists(self.file_name))
+        self.file = open(self.file_name, "a" if append else "w", newline="")
+        self.writer = csv.writer(self.file)
+        if write_header:
+            self.writer.writerow(columns)
+        self.last_flush = time.monotonic()
+        atexit.register(self.close)
+
+    def write(self, row: list):
+        """
+        Write one row of stats
+
+        :param row: Values of columns
+        """
+        if self.stats_format == "csv":
+            self.writer.writerow([json.dumps(value, default=float) if isinstance(value, (list, tuple)) else value
+                                  for value in row])
+        else:
+            self.file.write(json.dumps(dict(zip(self.columns, row)), default=float) + "\n")
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Write buffered rows to the file
+        """
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        """
+        Flush buffered rows and close the file
+        """
+        if not self.file.closed:
+            self.file.close()
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "StatsLogger":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def save_checkpoint(file_name: str, state: dict):
+    """
+    Save state of evolution to compressed binary file. The file is replaced only when the state is written
+    completely, so the previous checkpoint survives interruption of saving.
+
+    :param file_name: Checkpoint file
+    :param state: State of evolution
+    """
+    if os.path.dirname(file_name):
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with gzip.open(file_name + ".tmp", "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file_name + ".tmp", file_name)
+
+
+def load_checkpoint(file_name: str) -> Optional[dict]:
+    """
+    Load state of evolution saved by save_checkpoint
+
+    :param file_name: Checkpoint file
+    :return: State of evolution or None if there is no checkpoint
+    """
+    if not os.path.exists(file_name):
+        return None
+    with gzip.open(file_name, "rb") as f:
+        return pickle.load(f)
+
+
 def choose_unique(hof: List[Component], configuration) -> List[Component]:
     """
     Choose unique individuals from list hof (Hall of fame)
@@ -55,105 +161,140 @@ def choose_unique(hof: List[Component], configuration) -> List[Component]:
     return unique
 
 
-def draw(ind: Component, name: str, env: Environment):
+def image_frame(env: Environment) -> Tuple[int, int, int, int]:
+    """
+    Compute placement of environment in image. Point (x, y) of environment is drawn at (x + x_offset, y_offset - y).
+
+    :param env: Environment
+    :return: Tuple (x offset, y offset, width, height)
+    """
+    x_offset = 1000
+    if env.road_start < 0:
+        x_offset += abs(env.road_start)
+    y_offset = 1000
+    width = env.road_end + x_offset + 1000
+    height = abs(env.road_depth) + 2000
+    return x_offset, y_offset, width, height
+
+
+def ray_polylines(ind: Component, env: Environment, length: float) -> Tuple[List[np.ndarray], np.ndarray]:
     """
-    Create SVG image that represent in individual in environment.
+    Create polylines of traced rays of one LED from trace stored in the individual. Last part of ray ends in its
+    stored road intersection, rays without one are cut at given length, last part of terminated rays is not drawn.
+
+    :param ind: Individual
+    :param env: Environment
+    :param length: Length of last part of rays missing the road
+    :return: Tuple (list of arrays (points x 2), intensity of each polyline)
+    """
+    rays = ind.rays
+    road = env.road_array[np.argsort(env.road_array[:, 0])]
+    road_x = rays.road_intersections
+    ends = rays.origins + rays.directions * length
+    hit = ~np.isnan(road_x)
+    ends[hit] = np.column_stack([road_x[hit], np.interp(road_x[hit], road[:, 0], road[:, 1])])
+    polylines = []
+    intensities = []
+    for index in range(len(rays)):
+        points = rays.ray_path(index)
+        if not rays.terminated[index]:
+            points = np.vstack([points, ends[index]])
+        if len(points) > 1:
+            polylines.append(points)
+            intensities.append(rays.intensities[index])
+    return polylines, np.array(intensities, dtype=float)
+
+
+def device_polylines(ind: Component, env: Environment) -> List[np.ndarray]:
+    """
+    Create polylines of base and reflective segments of one LED
+
+    :param ind: Individual
+    :param env: Environment
+    :return: List of arrays (points x 2)
+    """
+    device = [ind.base_array]
+    if env.configuration == "two connected":
+        ind.update_segments()
+        device += [ind.right_segment_array, ind.left_segment_array]
+    if env.configuration == "multiple free":
+        device += [np.array([[float(segment.p1.x), float(segment.p1.y)], [float(segment.p2.x), float(segment.p2.y)]])
+                   for segment in ind.reflective_segments]
+    return device
+
+
+def led_placements(env: Environment) -> List[Tuple[int, float]]:
+    """
+    Placement of each LED, point (x, y) of the first LED is placed at (direction * x + shift, y)
+
+    :param env: Environment
+    :return: List of tuples (direction, shift)
+    """
+    placements = [(1, 0)]
+    if env.modification == "mirror":
+        placements.append((-1, -env.separating_distance))
+    if env.modification == "shift":
+        placements += [(1, env.led_offsets[led]) for led in range(1, env.number_of_led)]
+    return placements
+
+
+def svg_path(polylines: List[np.ndarray]) -> str:
+    """
+    Create data of SVG path, each polyline is one subpath
+
+    :param polylines: List of arrays (points x 2)
+    :return: Value of attribute d of SVG path
+    """
+    return " ".join("M" + " L".join(f"{x:.1f},{y:.1f}" for x, y in polyline) for polyline in polylines)
+
+
+def draw(ind: Component, name: str, env: Environment, compress: bool = False):
+    """
+    Create SVG image that represent in individual in environment. The image is rendered from trace of rays stored
+    in the individual. Device of one LED is drawn once as a group with one path per ray opacity, other LEDs are
+    copies of the group placed by transform. The image is written through one buffered stream.
 
     :param ind: Individual
     :param name: File name
     :param env: Environment for th individual
+    :param compress: Write gzipped .svgz file
     """
-    svg_name = "img/img-" + str(name).zfill(2) + ".svg".format(name)
-    # Generating drawing in SVG format
-    with open(svg_name, "w") as f:
-        separating_distance = env.separating_distance
-        x_offset = 1000
-        if env.road_start < 0:
-            x_offset += abs(env.road_start)
-        y_offset = 1000
-        width = env.road_end + x_offset + 1000
-        height = abs(env.road_depth) + 2000
-        diag = math.sqrt(width*width + height*height)
-
+    svg_name = "img/img-" + str(name).zfill(2) + (".svgz" if compress else ".svg")
+    x_offset, y_offset, width, height = image_frame(env)
+    diag = math.sqrt(width*width + height*height)
+
+    polylines, intensities = ray_polylines(ind, env, diag)
+    alphas = np.round(intensities, 2)
+    rays_by_alpha = {}
+    for polyline, alpha in zip(polylines, alphas):
+        rays_by_alpha.setdefault(alpha, []).append(polyline)
+    device = device_polylines(ind, env)
+
+    # Device coordinates are transformed to image coordinates (y axis goes down) for each LED
+    transforms = [f"translate({x_offset + shift},{y_offset}) scale({direction},-1)"
+                  for direction, shift in led_placements(env)]
+
+    opener = gzip.open if compress else open
+    with opener(svg_name, "wt") as f:
         # Initiate svg image and draw background
-        f.write(f'<svg width="{env.road_end + x_offset + 1000}" height="{abs(env.road_depth) + 2000}">\n')
-        f.write(f'<rect width="{env.road_end + x_offset + 1000}" height="{abs(env.road_depth) + 2000}" '
-                f'fill="black"/>\n')
-
-        # Draw rays with all reflections
-        for ray in ind.original_rays:
-            array = ray.ray_array
-            alpha = str(round(ray.intensity, 3))
-            color = "(250, 216, 22)"
-            # Draw all ray segments except the last one
-            for r in array[:-1]:
-                f.write(f'<line x1="{float(r.points[0].x) + x_offset}" y1="{- float(r.points[0].y) + y_offset}" '
-                        f'x2="{float(r.points[1].x) + x_offset}" y2="{- float(r.points[1].y) + y_offset}" '
-                        f'style="stroke:rgb{color};stroke-opacity:{alpha};stroke-width:10"/>\n')
-                if env.modification == "mirror":
-                    f.write(f'<line x1="{-float(r.points[0].x) + x_offset - separating_distance}" '
-                            f'y1="{- float(r.points[0].y) + y_offset}" '
-                            f'x2="{-float(r.points[1].x) + x_offset - separating_distance}" '
-                            f'y2="{- float(r.points[1].y) + y_offset}" style="stroke:rgb{color};stroke-opacity:{alpha};'
-                            f'stroke-width:10"/>\n')
-                if env.modification == "shift":
-                    for led in range(1, env.number_of_led):
-                        f.write(f'<line x1="{float(r.points[0].x) + x_offset + led * env.separating_distance}" '
-                                f'y1="{- float(r.points[0].y) + y_offset}" '
-                                f'x2="{float(r.points[1].x) + x_offset + led * env.separating_distance}" '
-                                f'y2="{- float(r.points[1].y) + y_offset}" style="stroke:rgb{color};'
-                                f'stroke-opacity:{alpha};stroke-width:10"/>\n')
-            r = array[-1]
-            # Draw last segment of all rays
-            intersection = env.road.intersection(r)
-            if intersection and not ray.terminated:
-                intersection = intersection[0]
-                f.write(f'<line x1="{float(r.points[0].x) + x_offset}" y1="{- float(r.points[0].y) + y_offset}" '
-                        f'x2="{float(intersection.x) + x_offset}" y2="{- float(intersection.y) + y_offset}" '
-                        f'style="stroke:rgb{color};stroke-opacity:{alpha};stroke-width:10"/>\n')
-                if env.modification == "mirror":
-                    f.write(f'<line x1="{-float(r.points[0].x) + x_offset - separating_distance}" '
-                            f'y1="{- float(r.points[0].y) + y_offset}" '
-                            f'x2="{-float(intersection.x) + x_offset - separating_distance}" '
-                            f'y2="{- float(intersection.y) + y_offset}" style="stroke:rgb{color};'
-                            f'stroke-opacity:{alpha};stroke-width:10"/>\n')
-                if env.modification == "shift":
-                    for led in range(1, env.number_of_led):
-                        f.write(f'<line x1="{float(r.points[0].x) + x_offset + led * env.separating_distance}" '
-                                f'y1="{- float(r.points[0].y) + y_offset}" '
-                                f'x2="{float(intersection.x) + x_offset + led * env.separating_distance}" '
-                                f'y2="{- float(intersection.y) + y_offset}" style="stroke:rgb{color};'
-                                f'stroke-opacity:{alpha};stroke-width:10"/>\n')
-
-            else:
-                if not ray.terminated:
-                    x_diff = float(r.points[1].x - r.points[0].x)
-                    y_diff = float(r.points[1].y - r.points[0].y)
-                    length = math.sqrt(x_diff * x_diff + y_diff * y_diff)
-                    ratio = diag / length
-                    x_diff = float(r.points[1].x - r.points[0].x) * ratio
-                    y_diff = float(r.points[1].y - r.points[0].y) * ratio
-                    f.write(f'<line x1="{float(r.points[0].x) + x_offset}" y1="{- float(r.points[0].y) + y_offset}" '
-                            f'x2="{float(r.points[0].x) + x_offset + x_diff}" '
-                            f'y2="{-float(r.points[0].y) + y_offset - y_diff}" style="stroke:rgb{color};'
-                            f'stroke-opacity:{alpha};stroke-width:10"/>\n')
-                    if env.modification == "mirror":
-                        f.write(f'<line x1="{-float(r.points[0].x) + x_offset - separating_distance}" '
-                                f'y1="{- float(r.points[0].y) + y_offset}" '
-                                f'x2="{-float(r.points[0].x) + x_offset - x_diff - separating_distance}" '
-                                f'y2="{-float(r.points[0].y) + y_offset - y_diff}" style="stroke:rgb{color};'
-                                f'stroke-opacity:{alpha};stroke-width:10"/>\n')
-                    if env.modification == "shift":
-                        for led in range(1, env.number_of_led):
-                            f.write(f'<line x1="{float(r.points[0].x) + x_offset + led * env.separating_distance}" '
-                                    f'y1="{- float(r.points[0].y) + y_offset}" '
-                                    f'x2="{float(r.points[0].x) + x_offset + x_diff + led * env.separating_distance}" '
-                                    f'y2="{-float(r.points[0].y) + y_offset - y_diff}" style="stroke:rgb{color};'
-                                    f'stroke-opacity:{alpha};stroke-width:10"/>\n')
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+                f'width="{width}" height="{height}">\n')
+        f.write(f'<rect width="{width}" height="{height}" fill="black"/>\n')
+
+        # Rays with all reflections and device of one LED
+        f.write('<defs>\n<g id="led" fill="none">\n')
+        f.write('<g stroke="rgb(250, 216, 22)" stroke-width="10">\n')
+        for alpha, polylines in sorted(rays_by_alpha.items()):
+            f.write(f'<path stroke-opacity="{alpha}" d="{svg_path(polylines)}"/>\n')
+        f.write('</g>\n')
+        f.write(f'<path stroke="gray" stroke-width="20" d="{svg_path(device)}"/>\n')
+        f.write('</g>\n</defs>\n')
+        for transform in transforms:
+            f.write(f'<use xlink:href="#led" transform="{transform}"/>\n')
 
         # Road
-        f.write(f'<rect x="{env.road.p1.x + x_offset}" y="{-env.road.p1.y + y_offset}" '
-                f'width="{(env.road.p2.x - env.road.p1.x)}" height="50" fill="gray"/>\n')
+        f.write(f'<rect x="{env.road_start + x_offset}" y="{-env.road_depth + y_offset}" '
+                f'width="{env.road_length}" height="50" fill="gray"/>\n')
 
         if env.quality_criterion in ["illuminance uniformity", "weighted sum", "nsgaii"]:
             left_border = env.road_start
@@ -162,69 +303,273 @@ def draw(ind: Component, name: str, env: Environment):
             for segment in range(env.road_sections):
                 alpha = str(round(ind.segments_intensity_proportional[segment], 3))
                 color = "(250, 6, 22)"
-                f.write(f'<rect x="{left_border + x_offset}" y="{-env.road.p1.y + y_offset}" width="{segments_size}" '
-                        f'height="50" style="fill:rgb{color};fill-opacity:{alpha};"/>')
+                f.write(f'<rect x="{left_border + x_offset}" y="{-env.road_depth + y_offset}" width="{segments_size}" '
+                        f'height="50" style="fill:rgb{color};fill-opacity:{alpha};"/>\n')
                 left_border += segments_size
 
-        # Base
-        f.write(f'<line x1="{ind.base.p1.x + x_offset}" y1="{-ind.base.p1.y + y_offset}" '
-                f'x2="{ind.base.p2.x + x_offset}" '
-                f'y2="{-ind.base.p2.y + y_offset}" style="stroke:gray;stroke-width:20"/>\n')
-        if env.modification == "mirror":
-            f.write(f'<line x1="{-ind.base.p1.x + x_offset - separating_distance}" y1="{-ind.base.p1.y + y_offset}" '
-                    f'x2="{-ind.base.p2.x + x_offset - separating_distance}" y2="{-ind.base.p2.y + y_offset}" '
-                    f'style="stroke:gray;stroke-width:20"/>\n')
-        if env.modification == "shift":
-            for led in range(1, env.number_of_led):
-                f.write(f'<line x1="{ind.base.p1.x + x_offset + led * env.separating_distance}" '
-                        f'y1="{-ind.base.p1.y + y_offset}" '
-                        f'x2="{ind.base.p2.x + x_offset + led * env.separating_distance}" '
-                        f'y2="{-ind.base.p2.y + y_offset}" style="stroke:gray;stroke-width:20"/>')
-
-        if env.configuration == "two connected":
-            # right segment
-            f.write(f'<line x1="{ind.base.p2.x + x_offset}" y1="{-ind.base.p2.y + y_offset}" '
-                    f'x2="{float(ind.right_segment.p2.x) + x_offset}" y2="{float(-ind.right_segment.p2.y) + y_offset}" '
-                    f'style="stroke:gray;stroke-width:20"/>\n')
-            if env.modification == "mirror":
-                f.write(f'<line x1="{-ind.base.p2.x + x_offset - separating_distance}" y1="{-ind.base.p2.y + y_offset}"'
-                        f' x2="{-float(ind.right_segment.p2.x) + x_offset - separating_distance}" '
-                        f'y2="{float(-ind.right_segment.p2.y) + y_offset}" style="stroke:gray;stroke-width:20"/>\n')
-            if env.modification == "shift":
-                for led in range(1, env.number_of_led):
-                    f.write(f'<line x1="{ind.base.p2.x + x_offset + led * env.separating_distance}" '
-                            f'y1="{-ind.base.p2.y + y_offset}" '
-                            f'x2="{float(ind.right_segment.p2.x) + x_offset + led * env.separating_distance}" '
-                            f'y2="{float(-ind.right_segment.p2.y) + y_offset}" style="stroke:gray;stroke-width:20"/>')
-            # left segment
-            f.write(f'<line x1="{ind.base.p1.x + x_offset}" y1="{-ind.base.p1.y + y_offset}" '
-                    f'x2="{float(ind.left_segment.p2.x) + x_offset}" y2="{float(-ind.left_segment.p2.y) + y_offset}" '
-                    f'style="stroke:gray;stroke-width:20"/>\n')
-            if env.modification == "mirror":
-                f.write(f'<line x1="{-ind.base.p1.x + x_offset - separating_distance}" y1="{-ind.base.p1.y + y_offset}"'
-                        f' x2="{-float(ind.left_segment.p2.x) + x_offset - separating_distance}" '
-                        f'y2="{float(-ind.left_segment.p2.y) + y_offset}" style="stroke:gray;stroke-width:20"/>')
-            if env.modification == "shift":
-                for led in range(1, env.number_of_led):
-                    f.write(f'<line x1="{ind.base.p1.x + x_offset + led * env.separating_distance}" '
-                            f'y1="{-ind.base.p1.y + y_offset}" '
-                            f'x2="{float(ind.left_segment.p2.x) + x_offset + led * env.separating_distance}" '
-                            f'y2="{float(-ind.left_segment.p2.y) + y_offset}" style="stroke:gray;stroke-width:20"/>')
-
-        if env.configuration == "multiple free":
-            # reflective segments
-            for segment in ind.reflective_segments:
-                f.write(f'<line x1="{segment.p1.x + x_offset}" y1="{-segment.p1.y + y_offset}" '
-                        f'x2="{float(segment.p2.x) + x_offset}" y2="{float(-segment.p2.y) + y_offset}" '
-                        f'style="stroke:gray;stroke-width:20"/>')
-
         f.write(f'</svg>')
 
 
+def rasterize_polylines(polylines: List[np.ndarray], weights: np.ndarray, scale: float, x_offset: float,
+                        y_offset: float, shape: Tuple[int, int]) -> np.ndarray:
+    """
+    Accumulate weights of polylines into buffer of pixels. Every segment is sampled once for each pixel of its
+    length, so cost of rasterization depends on number of covered pixels. Segments are processed in chunks
+    of bounded number of samples.
+
+    :param polylines: List of arrays (points x 2) in coordinates of environment
+    :param weights: Weight of each polyline
+    :param scale: Number of pixels per unit of environment
+    :param x_offset: Offset of x coordinates (see image_frame)
+    :param y_offset: Offset of y coordinates (see image_frame)
+    :param shape: Shape of the buffer (rows, columns)
+    :return: Buffer with sum of weights of polylines covering each pixel
+    """
+    rows, columns = shape
+    buffer = np.zeros(rows * columns)
+    if not polylines:
+        return buffer.reshape(shape)
+    points = np.concatenate(polylines)
+    last = np.cumsum([len(polyline) for polyline in polylines]) - 1
+    # Segments go between consecutive points of the same polyline
+    starts = np.setdiff1d(np.arange(len(points) - 1), last)
+    segment_weights = np.repeat(weights, [len(polyline) - 1 for polyline in polylines])
+    pixels = np.column_stack([(points[:, 0] + x_offset) * scale, (y_offset - points[:, 1]) * scale])
+    start_pixels = pixels[starts]
+    edges = pixels[starts + 1] - start_pixels
+    counts = np.ceil(np.abs(edges).max(axis=1)).astype(int) + 1
+    total = np.cumsum(counts)
+    for chunk in np.split(np.arange(len(counts)), np.searchsorted(total, np.arange(RASTER_CHUNK, total[-1],
+                                                                                   RASTER_CHUNK))):
+        if len(chunk) == 0:
+            continue
+        chunk_counts = counts[chunk]
+        segment = np.repeat(chunk, chunk_counts)
+        position = np.arange(len(segment)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        samples = start_pixels[segment] + (position / np.maximum(counts[segment] - 1, 1))[:, None] * edges[segment]
+        column = np.floor(samples[:, 0]).astype(int)
+        row = np.floor(samples[:, 1]).astype(int)
+        inside = (column >= 0) & (column < columns) & (row >= 0) & (row < rows)
+        buffer += np.bincount(row[inside] * columns + column[inside], weights=segment_weights[segment][inside],
+                              minlength=rows * columns)
+    return buffer.reshape(shape)
+
+
+def place_leds(buffer: np.ndarray, env: Environment, scale: float, x_offset: float) -> np.ndarray:
+    """
+    Add copies of buffer rendered for the first LED for other LEDs. Columns of the buffer are moved by LED
+    placement, so cost does not depend on number of rays.
+
+    :param buffer: Buffer of the first LED
+    :param env: Environment
+    :param scale: Number of pixels per unit of environment
+    :param x_offset: Offset of x coordinates (see image_frame)
+    :return: Buffer of all LEDs
+    """
+    columns = buffer.shape[1]
+    x = (np.arange(columns) + 0.5) / scale - x_offset
+    result = np.zeros_like(buffer)
+    for direction, shift in led_placements(env):
+        target = np.floor((direction * x + shift + x_offset) * scale).astype(int)
+        inside = (target >= 0) & (target < columns)
+        result[:, target[inside]] += buffer[:, inside]
+    return result
+
+
+def write_png(file_name: str, image: np.ndarray):
+    """
+    Write 8-bit grayscale (rows x columns) or RGB (rows x columns x 3) image to PNG file
+
+    :param file_name: File name
+    :param image: Array of type uint8
+    """
+    rows, columns = image.shape[:2]
+    color_type = 2 if image.ndim == 3 else 0
+    # Every row starts with filter type 0 (no filter)
+    raw = np.hstack([np.zeros((rows, 1), dtype=np.uint8), image.reshape(rows, -1)]).tobytes()
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    with open(file_name, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", columns, rows, 8, color_type, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def write_pgm(file_name: str, image: np.ndarray):
+    """
+    Write 8-bit grayscale image to binary PGM file, RGB image is converted to luminance
+
+    :param file_name: File name
+    :param image: Array of type uint8 (rows x columns) or (rows x columns x 3)
+    """
+    if image.ndim == 3:
+        image = np.round(image @ np.array([0.299, 0.587, 0.114])).astype(np.uint8)
+    with open(file_name, "wb") as f:
+        f.write(f"P5\n{image.shape[1]} {image.shape[0]}\n255\n".encode())
+        f.write(image.tobytes())
+
+
+def draw_raster(ind: Component, name: str, env: Environment, image_format: str = "png", image_width: int = 1200):
+    """
+    Create raster heatmap of rays and road illuminance of an individual. Intensity of rays is accumulated into
+    buffer of pixels and mapped to brightness logarithmically. The image covers the same area as SVG image.
+    Rays are rasterized once for the first LED, other LEDs are copies of the buffer.
+
+    :param ind: Individual
+    :param name: File name
+    :param env: Environment for the individual
+    :param image_format: png or pgm
+    :param image_width: Width of the image in pixels
+    """
+    x_offset, y_offset, width, height = image_frame(env)
+    scale = image_width / width
+    shape = (max(1, round(height * scale)), image_width)
+
+    polylines, intensities = ray_polylines(ind, env, math.sqrt(width*width + height*height))
+    rays = place_leds(rasterize_polylines(polylines, intensities, scale, x_offset, y_offset, shape), env, scale,
+                      x_offset)
+    # Few pixels near LED collect most of the rays, they would make the rest of the image dark
+    reference = np.percentile(rays[rays > 0], 99) if rays.any() else 1
+    brightness = np.minimum(np.log1p(rays) / np.log1p(reference), 1)
+    image = brightness[:, :, None] * np.array([250, 216, 22])
+
+    # Device is drawn 3 pixels wide
+    device = device_polylines(ind, env)
+    device = place_leds(rasterize_polylines(device, np.ones(len(device)), scale, x_offset, y_offset, shape), env,
+                        scale, x_offset) > 0
+    padded = np.pad(device, 1)
+    device = np.any([padded[row:row + shape[0], column:column + shape[1]] for row in range(3)
+                     for column in range(3)], axis=0)
+    image[device] = 128
+
+    # Road with illuminance of road sections
+    top = int((y_offset - env.road_depth) * scale)
+    bottom = top + max(3, round(50 * scale))
+    left = max(0, int((env.road_start + x_offset) * scale))
+    right = min(shape[1], int((env.road_end + x_offset) * scale))
+    image[top:bottom, left:right] = 128
+    if env.quality_criterion in ["illuminance uniformity", "weighted sum", "nsgaii"]:
+        borders = np.linspace(left, right, env.road_sections + 1).astype(int)
+        for segment in range(env.road_sections):
+            alpha = ind.segments_intensity_proportional[segment]
+            image[top:bottom, borders[segment]:borders[segment + 1]] = \
+                (1 - alpha) * 128 + alpha * np.array([250, 6, 22])
+
+    image = np.round(image).astype(np.uint8)
+    file_name = "img/img-" + str(name).zfill(2) + "." + image_format
+    if image_format == "png":
+        write_png(file_name, image)
+    else:
+        write_pgm(file_name, image)
+
+
+class Renderer:
+
+    def __init__(self, env: Environment, policy: str = "interval", interval: int = 1, background: bool = False,
+                 compress: bool = False, image_format: str = "svg", image_width: int = 1200):
+        """
+        Decide which best individuals are drawn during evolution. Best individual is drawn every interval
+        generations (interval), whenever best fitness changes (improvement) or only at the end (final).
+        Images can be drawn on background thread, so that writing them does not block evolution.
+
+        :param env: Environment
+        :param policy: interval, improvement or final
+        :param interval: Number of generations between images for interval policy
+        :param background: Draw images on background thread
+        :param compress: Write gzipped .svgz images
+        :param image_format: svg, png or pgm (raster heatmap, see draw_raster)
+        :param image_width: Width of raster images in pixels
+        """
+        self.env = env
+        self.policy = policy
+        self.interval = interval
+        self.compress = compress
+        self.image_format = image_format
+        self.image_width = image_width
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.images = []
+        self.drawn_fitness = None
+
+    def draw(self, ind: Component, name: str):
+        """
+        Draw individual now or on background thread
+
+        :param ind: Individual, it must not be changed after it is passed to renderer
+        :param name: File name
+        """
+        if self.image_format == "svg":
+            function, arguments = draw, (ind, name, self.env, self.compress)
+        else:
+            function, arguments = draw_raster, (ind, name, self.env, self.image_format, self.image_width)
+        if self.executor is None:
+            function(*arguments)
+        else:
+            self.images.append(self.executor.submit(function, *arguments))
+
+    def update(self, generation: int, ind: Component, name: str):
+        """
+        Draw best individual of given generation if the policy says so
+
+        :param generation: Generation index
+        :param ind: Best individual
+        :param name: File name
+        """
+        if self.policy == "interval" and (generation + 1) % self.interval == 0 or \
+                self.policy == "improvement" and ind.fitness != self.drawn_fitness:
+            self.draw(ind, name)
+            self.drawn_fitness = ind.fitness
+
+    def finish(self, ind: Component, name: str):
+        """
+        Draw best individual at the end of evolution if the policy says so and wait for all images
+
+        :param ind: Best individual
+        :param name: File name
+        """
+        if self.policy == "final":
+            self.draw(ind, name)
+        self.wait()
+
+    def wait(self):
+        """
+        Wait until all images are drawn
+        """
+        if self.executor is not None:
+            self.executor.shutdown()
+            # Errors raised while drawing are raised here
+            for image in self.images:
+                image.result()
+
+
+def check_parameters_render(policy: str, interval: int, background: bool, compress: bool, image_format: str = "svg",
+                            image_width: int = 1200) -> List[str]:
+    """
+    Check all parameters for rendering if their values are valid.
+    """
+    invalid = []
+    if policy not in ["interval", "improvement", "final"]:
+        invalid.append("render policy")
+    if type(interval) != int or interval <= 0:
+        invalid.append("render interval")
+    if type(background) != bool:
+        invalid.append("render background")
+    if type(compress) != bool:
+        invalid.append("render compress")
+    if image_format not in ["svg", "png", "pgm"]:
+        invalid.append("render format")
+    if type(image_width) != int or image_width <= 0:
+        invalid.append("render width")
+    return invalid
+
+
 def check_parameters_environment(road_start: int, road_end: int, road_depth: int,
                                  road_sections: int, criterion: str, cosine_error: str, reflective_factor: float,
                                  configuration: str, number_of_led: int, separating_distance: int,
-                                 modification: str, weights: List[int], reflections_timeout: int) -> List[str]:
+                                 modification: str, weights: List[int], reflections_timeout: int,
+                                 backend: str, led_offsets: List[float] = None) -> List[str]:
     """
     Check all parameters for environment if their values are valid.
     """
@@ -239,6 +584,8 @@ def check_parameters_environment(road_start: int, road_end: int, road_depth: int
         invalid.append("cosine error")
     if type(weights) != list or len(weights) != 4:
         invalid.append("weights")
+    if backend not in ["sympy", "numpy"]:
+        invalid.append("backend")
 
     if type(road_start) != int:
         invalid.append("road start")
@@ -258,6 +605,10 @@ def check_parameters_environment(road_start: int, road_end: int, road_depth: int
     if type(separating_distance) != int or reflective_factor <= 0:
         invalid.append("separating distance")
 
+    if led_offsets is not None and (type(led_offsets) != list or len(led_offsets) != number_of_led
+                                    or any(type(offset) not in (int, float) for offset in led_offsets)):
+        invalid.append("LED offsets")
+
     if modification == "mirror" and number_of_led > 2:
         invalid.append("mirror + number_of_LEDs")
 
@@ -271,14 +622,17 @@ def check_parameters_evolution(number_of_rays: int, ray_distribution: str, angle
                                angle_mut_prob: float, length_mut_prob: float, shift_segment_prob: float,
                                rotate_segment_prob: float, resize_segment_prob: float,
                                tilt_base_prob, base_length: int, base_slope: int, base_angle_limit_min: int,
-                               base_angle_limit_max: int) -> List[str]:
+                               base_angle_limit_max: int, workers: int, seed: int, cache_size: int,
+                               algorithm: str = "generational", mu: int = None, lambda_: int = None,
+                               checkpoint_interval: int = 0, checkpoint_file: str = "checkpoints/checkpoint.gz",
+                               stats_format: str = "csv", stats_flush_interval: float = 10) -> List[str]:
     """
     Check all parameters for evolution if their values are valid.
     """
     invalid = []
     if type(number_of_rays) != int or number_of_rays <= 0:
         invalid.append("number of rays")
-    if ray_distribution not in ["uniform", "random"]:
+    if ray_distribution not in ["uniform", "random", "stratified", "sobol", "halton", "importance"]:
         invalid.append("ray distribution")
 
     if type(base_length) != int or base_length <= 0:
@@ -310,6 +664,33 @@ def check_parameters_evolution(number_of_rays: int, ray_distribution: str, angle
         invalid.append("population size")
     if type(number_of_generations) != int or number_of_generations <= 0:
         invalid.append("number of generations")
+    if type(workers) != int or workers <= 0:
+        invalid.append("workers")
+    if seed is not None and type(seed) != int:
+        invalid.append("seed")
+    if type(cache_size) != int or cache_size < 0:
+        invalid.append("cache size")
+    if algorithm not in ["generational", "steady state", "mu+lambda", "mu,lambda"]:
+        invalid.append("algorithm")
+    if mu is not None and (type(mu) != int or mu <= 1):
+        invalid.append("mu")
+    if lambda_ is not None and (type(lambda_) != int or lambda_ <= 0):
+        invalid.append("lambda")
+    if type(checkpoint_interval) != int or checkpoint_interval < 0:
+        invalid.append("checkpoint interval")
+    if type(checkpoint_file) != str or not os.path.basename(checkpoint_file):
+        invalid.append("checkpoint file")
+    if stats_format not in ["csv", "jsonl"]:
+        invalid.append("stats format")
+    if type(stats_flush_interval) not in (int, float) or stats_flush_interval < 0:
+        invalid.append("stats flush interval")
+    # Steady state keeps some individuals of population, mu,lambda needs at least mu offspring
+    size = population_size if mu is None else mu
+    if type(size) == int and type(lambda_) == int:
+        if algorithm == "steady state" and lambda_ >= size:
+            invalid.append("steady state + lambda")
+        if algorithm == "mu,lambda" and lambda_ < size:
+            invalid.append("mu,lambda + lambda")
 
     if type(xover_prob) != float or xover_prob < 0 or xover_prob > 1:
         invalid.append("xover prob")
@@ -328,3 +709,23 @@ def check_parameters_evolution(number_of_rays: int, ray_distribution: str, angle
         invalid.append("tilt base prob")
 
     return invalid
+
+
+def check_parameters_islands(number_of_islands: int, topology: str, migration_interval: int, migrants: int,
+                             seeds: List[int], population_size: int) -> List[str]:
+    """
+    Check all parameters for island model if their values are valid.
+    """
+    invalid = []
+    if type(number_of_islands) != int or number_of_islands <= 0:
+        invalid.append("number of islands")
+    if topology not in ["ring", "random"]:
+        invalid.append("topology")
+    if type(migration_interval) != int or migration_interval <= 0:
+        invalid.append("migration interval")
+    if type(migrants) != int or migrants <= 0 or migrants >= population_size:
+        invalid.append("migrants")
+    if seeds is not None and (type(seeds) != list or len(seeds) != number_of_islands
+                              or any(type(seed) != int for seed in seeds)):
+        invalid.append("island seeds")
+    return invalid
@@ -1,11 +1,12 @@
+import copy
 import math
 import random
 from typing import List
 
-from sympy.geometry import Ray, Point, Segment
-from sympy import pi, sin, cos
+import numpy as np
+from sympy.geometry import Point, Segment
 
-from custom_ray import MyRay
+from custom_ray import MyRay, RayBundle, sample_ray_fan
 from environment import Environment
 
 
@@ -22,10 +23,15 @@ class Component:
         self.base_length = base_length
 
         self.base = None
+        self.base_array = None
+        self.segments_dirty = True
         self.calculate_base()
 
         # Sampling light rays
-        self.original_rays = self.sample_rays(number_of_rays, ray_distribution)
+        self.ray_fan = None
+        self.rays = None
+        self._original_rays = None
+        self.sample_rays(number_of_rays, ray_distribution)
 
         self.angle_limit_min = angle_lower_bound + base_slope
         self.angle_limit_max = angle_upper_bound + base_slope
@@ -37,14 +43,17 @@ class Component:
         self.right_length_coef = random.random() * self.length_limit_diff + length_lower_bound
 
         if env.configuration == "two connected":
-            self.right_segment = None
-            self.left_segment = None
-            self.compute_right_segment()
-            self.compute_left_segment()
+            self._right_segment = None
+            self._left_segment = None
+            self.right_segment_array = None
+            self.left_segment_array = None
+            self.update_segments()
 
         if env.configuration == "multiple free":
             self.reflective_segments = generate_reflective_segments(no_of_reflective_segments,
                                                                     distance_limit, length_limit)
+            # Bounding volume hierarchy of reflective segments and base, built by the numpy backend
+            self.segment_bvh = None
 
         self.intersections_on = []
         self.intersections_on_intensity = 0
@@ -57,67 +66,132 @@ class Component:
         y_diff = round(self.base_length / 2 * math.sin(math.radians(self.base_slope)))
         x_diff = round(self.base_length / 2 * math.cos(math.radians(self.base_slope)))
         self.base = Segment(Point(-x_diff, -y_diff), Point(x_diff, y_diff))
+        self.base_array = np.array([[-x_diff, -y_diff], [x_diff, y_diff]], dtype=float)
+        self.segments_dirty = True
+
+    def genotype(self, configuration: str) -> tuple:
+        """
+        Canonical description of the individual. Individuals with equal genotype have equal fitness.
+
+        :param configuration: Configuration - two connected or multiple free
+        :return: Tuple of base, ray angles and reflective segments parameters
+        """
+        rays = tuple(self.ray_fan.angles)
+        if configuration == "two connected":
+            return (self.base_slope, self.base_length, rays, self.left_angle, self.right_angle,
+                    self.left_length_coef, self.right_length_coef)
+        segments = tuple((float(segment.p1.x), float(segment.p1.y), float(segment.p2.x), float(segment.p2.y))
+                         for segment in self.reflective_segments)
+        return self.base_slope, self.base_length, rays, segments
+
+    def clone(self) -> "Component":
+        """
+        Copy the individual. SymPy geometry is immutable, so it is shared with the copy. Lists, fitness and trace
+        of rays are copied, MyRay objects are not copied and they are created again when needed.
 
-    def sample_rays(self, number_of_rays: int, distribution: str) -> List[MyRay]:
+        :return: Copy of the individual
+        """
+        clone = copy.copy(self)
+        clone._original_rays = None
+        clone.rays = self.rays.copy()
+        for name in ("reflective_segments", "intersections_on", "segments_intensity",
+                     "segments_intensity_proportional", "fitness_array"):
+            if hasattr(self, name):
+                setattr(clone, name, list(getattr(self, name)))
+        if hasattr(self, "fitness"):
+            clone.fitness = copy.deepcopy(self.fitness)
+        return clone
+
+    def __deepcopy__(self, memo) -> "Component":
+        return self.clone()
+
+    def __getstate__(self) -> dict:
+        # MyRay objects are created again when needed, so they are not pickled
+        state = self.__dict__.copy()
+        state["_original_rays"] = None
+        return state
+
+    def sample_rays(self, number_of_rays: int, distribution: str):
         """
         Sample given number of rays from LED according to base angle and distribution parameter.
+        Ray fan (directions and intensities) is shared with other individuals, the individual only holds
+        trace state of the rays.
 
         :param number_of_rays: Number of rays going from LED
         :param distribution: random vs uniform distribution - random is default
-        :return: List of rays from LED
-        """
-        base_angle = self.base_slope
-        ray_array = []
-        step = 1
-        if distribution == "uniform":
-            step = 180 / number_of_rays
-        for ray in range(number_of_rays):
-            if distribution == "uniform":
-                angle = 180 + ray*step + step/2 + base_angle
-            else:
-                angle = random.randint(180, 360) + base_angle
-            new_ray = MyRay(self.origin, angle, base_angle)
-            ray_array.append(new_ray)
-        return ray_array
+        """
+        self.ray_fan = sample_ray_fan(number_of_rays, distribution, self.base_slope)
+        self.rays = RayBundle(self.ray_fan, self.origin)
+        self._original_rays = None
+
+    @property
+    def original_rays(self) -> List[MyRay]:
+        """
+        Rays from LED as MyRay objects used by sympy backend. They are created on first use.
+        """
+        if self._original_rays is None:
+            self._original_rays = [MyRay(self.origin, angle, self.base_slope, intensity)
+                                   for angle, intensity in zip(self.ray_fan.angles, self.ray_fan.intensities)]
+        return self._original_rays
+
+    def update_segments(self):
+        """
+        Recompute right and left segment if angles, lengths or base changed since the last computation
+        """
+        if self.segments_dirty:
+            self.compute_right_segment()
+            self.compute_left_segment()
+            self.segments_dirty = False
 
     def compute_right_segment(self):
         """
         Computing coordinates for right segment based on right angle and base info
         """
-        base_right_p = self.base.points[1]
-        right_ray = Ray(base_right_p, angle=self.right_angle/180 * pi)
-        x_diff = self.base.length * self.right_length_coef * cos(self.right_angle/180 * pi)
-        y_diff = self.base.length * self.right_length_coef * sin(self.right_angle/180 * pi)
-        if right_ray.xdirection == "oo":
-            right_end_x = base_right_p.x + x_diff
-        else:
-            right_end_x = base_right_p.x - x_diff
-        if right_ray.ydirection == "oo":
-            right_end_y = base_right_p.y + y_diff
-        else:
-            right_end_y = base_right_p.y - y_diff
-
-        self.right_segment = Segment(base_right_p, Point(float(right_end_x), float(right_end_y)))
+        self.right_segment_array = self.compute_segment(self.base_array[1], self.right_angle, self.right_length_coef)
+        self._right_segment = None
 
     def compute_left_segment(self):
         """
         Computing coordinates for left segment based on left angle and base info
         """
-        base_left_p = self.base.points[0]
-        left_ray = Ray(base_left_p, angle=self.left_angle/180 * pi)
-        x_diff = self.base.length * self.left_length_coef * cos(self.left_angle/180 * pi)
-        y_diff = self.base.length * self.left_length_coef * sin(self.left_angle/180 * pi)
-
-        if left_ray.xdirection == "oo":
-            left_end_x = base_left_p.x + x_diff
-        else:
-            left_end_x = base_left_p.x - x_diff
-        if left_ray.ydirection == "oo":
-            left_end_y = base_left_p.y + y_diff
-        else:
-            left_end_y = base_left_p.y - y_diff
-
-        self.left_segment = Segment(base_left_p, Point(float(left_end_x), float(left_end_y)))
+        self.left_segment_array = self.compute_segment(self.base_array[0], self.left_angle, self.left_length_coef)
+        self._left_segment = None
+
+    def compute_segment(self, start: np.ndarray, angle: int, length_coef: float) -> np.ndarray:
+        """
+        Compute segment starting at the end of base. The end point is the start shifted against the direction of
+        the angle.
+
+        :param start: End point of base the segment starts at
+        :param angle: Angle of the segment (in degrees)
+        :param length_coef: Length of the segment relative to base length
+        :return: Array [[x1, y1], [x2, y2]]
+        """
+        base_edge = self.base_array[1] - self.base_array[0]
+        length = math.hypot(base_edge[0], base_edge[1]) * length_coef
+        radians = math.radians(angle)
+        end = start - length * np.array([math.cos(radians), math.sin(radians)])
+        return np.array([start, end])
+
+    @property
+    def right_segment(self) -> Segment:
+        """
+        Right segment as SymPy Segment used by sympy backend and drawing. It is created on first use.
+        """
+        if self._right_segment is None:
+            end = self.right_segment_array[1]
+            self._right_segment = Segment(self.base.points[1], Point(float(end[0]), float(end[1])))
+        return self._right_segment
+
+    @property
+    def left_segment(self) -> Segment:
+        """
+        Left segment as SymPy Segment used by sympy backend and drawing. It is created on first use.
+        """
+        if self._left_segment is None:
+            end = self.left_segment_array[1]
+            self._left_segment = Segment(self.base.points[0], Point(float(end[0]), float(end[1])))
+        return self._left_segment
 
 
 def generate_reflective_segments(number_of_segments: int, distance_limit: int, length_limit: int) -> List[Segment]:
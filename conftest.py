@@ -0,0 +1,26 @@
+from typing import List, Tuple
+
+import pytest
+
+from component import Component
+from environment import Environment
+
+
+@pytest.fixture
+def make_lamp():
+    """
+    Factory of environment with road from 0 to 12000 and population of individuals in it. Parameters of environment
+    are changed by keyword arguments with names of Environment parameters.
+    """
+    def make(population_size: int = 1, number_of_rays: int = 10, ray_distribution: str = "uniform",
+             no_of_reflective_segments: int = 6, base_slope: int = 90, **environment) \
+            -> Tuple[Environment, List[Component]]:
+        parameters = dict(road_start=0, road_end=12000, road_depth=-4000, road_sections=4, criterion="weighted sum",
+                          cosine_error="no", reflective_factor=0.98, configuration="multiple free", number_of_led=1,
+                          separating_distance=24, modification="shift", weights=[1, 10, 5, -1],
+                          reflections_timeout=20, backend="numpy")
+        env = Environment(**{**parameters, **environment})
+        population = [Component(env, number_of_rays, ray_distribution, 90, 180, 1, 3, no_of_reflective_segments,
+                                400, 300, 40, base_slope) for _ in range(population_size)]
+        return env, population
+    return make
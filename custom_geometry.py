@@ -1,10 +1,12 @@
-from math import pi
-from typing import List, Tuple
+from math import hypot, pi
+from typing import List, Optional, Tuple
 
+import numpy as np
 from sympy import Rational, sin, cos
 from sympy.geometry import Ray, Point, Segment
 
 from component import Component
+from custom_geometry_numpy import recalculate_intersections_population
 from custom_ray import MyRay
 
 
@@ -12,55 +14,80 @@ def compute_intersections(rays: List[MyRay], road: Segment) -> List[Tuple[Ration
     """
     Compute intersections of rays from LED and road below the lamp. Zip x coordinates of each intersection
     with intensity of the ray and intensity with taking cosine error into account.
+    Intersections with horizontal road are computed directly from the ray (see horizontal_road_intersection).
 
     :param rays: List of rays directed from LED
     :param road: Segment representing road that rays should fall on
     :return: List of tuples (x-coord of road intersection, intensity of incident ray, intensity with cosine error)
     """
+    horizontal = road.p1.y == road.p2.y
+    road_start = min(road.p1.x, road.p2.x)
+    road_end = max(road.p1.x, road.p2.x)
     inter_array = []
     for ray in rays:
         ray.road_intersection = []
-        inter_point = road.intersection(ray.ray_array[-1])
-        if inter_point and not ray.terminated:
-            intensity = ray.intensity
-            reduction = float(sin(ray.ray_array[-1].angle_between(road)))
-            cos_error_intensity = ray.intensity*reduction
-            inter_array.append((inter_point[0].x, intensity, cos_error_intensity))
-            ray.road_intersection = inter_point[0].x
+        if ray.terminated:
+            continue
+        last_ray = ray.ray_array[-1]
+        if horizontal:
+            intersection = horizontal_road_intersection(last_ray, road.p1.y, road_start, road_end)
+        else:
+            inter_point = road.intersection(last_ray)
+            intersection = (inter_point[0].x, float(sin(last_ray.angle_between(road)))) if inter_point else None
+        if intersection:
+            x, reduction = intersection
+            inter_array.append((x, ray.intensity, ray.intensity*reduction))
+            ray.road_intersection = x
     return inter_array
 
 
-def recalculate_intersections(intersections: List[Tuple[Rational, float, float]], number_of_led: int,
+def horizontal_road_intersection(ray: Ray, road_y: Rational, road_start: Rational, road_end: Rational) \
+        -> Optional[Tuple[Rational, float]]:
+    """
+    Compute intersection of ray and horizontal road from the ray origin and direction. The x-coordinate is exact,
+    the same as from Segment.intersection.
+
+    :param ray: Ray
+    :param road_y: Y-coordinate of the road
+    :param road_start: X-coordinate of start of the road
+    :param road_end: X-coordinate of end of the road
+    :return: Tuple (x-coord of road intersection, sine of angle between ray and road), None if there is none
+    """
+    x_diff = ray.p2.x - ray.p1.x
+    y_diff = ray.p2.y - ray.p1.y
+    if y_diff == 0:
+        return None
+    t = (road_y - ray.p1.y) / y_diff
+    if t < 0:
+        return None
+    x = ray.p1.x + t * x_diff
+    if not road_start <= x <= road_end:
+        return None
+    return x, abs(float(y_diff)) / hypot(float(x_diff), float(y_diff))
+
+
+def recalculate_intersections(intersections: List[Tuple[Rational, float, float]], led_offsets: List[float],
                               separating_distance: int, modification: str, road_start: int, road_end: int) \
-                            -> List[Tuple[Rational, float, float]]:
+                            -> np.ndarray:
     """
     Recalculate intersections for situations with more than one LED. The function works either with mirror or
-     shift modification.
+     shift modification. Intersections of all LEDs are computed at once by broadcasting x-coords by LED offsets.
 
     :param intersections: List of tuples (x-coord of road intersection, intensity, intensity with cosine error)
-    :param number_of_led: Number of LED in the device
-    :param separating_distance: Distance separating LEDs
+    :param led_offsets: Horizontal offset of each LED from the first LED
+    :param separating_distance: Distance separating mirrored LEDs
     :param modification: Indicator whether the LEDs are mirrored or shifted only
     :param road_start: Coordinates for start of the road
     :param road_end: Coordinates for end of the road
-    :return: List of tuples (x-coord of road intersection, intensity, intensity with cosine error) for all LEDs
+    :return: Array (intersections x 3) of rows (x-coord of road intersection, intensity, intensity with cosine
+    error) for all LEDs, intersections of one ray are next to each other
     """
-    recalculated = []
-    if modification == "mirror":
-        for i in intersections:
-            recalculated.append(i)
-            new_x = i[0] * -1 - separating_distance
-            if road_start <= new_x <= road_end:
-                new_intersection = (new_x, i[1], i[2])
-                recalculated.append(new_intersection)
-    else:
-        for i in intersections:
-            for led in range(number_of_led):
-                new_x = i[0] + separating_distance * led
-                if road_start <= new_x <= road_end:
-                    new_intersection = (new_x, i[1], i[2])
-                    recalculated.append(new_intersection)
-    return recalculated
+    intersections = np.array(intersections, dtype=float).reshape(-1, 3)
+    x = recalculate_intersections_population(intersections[:, 0], led_offsets, separating_distance, modification,
+                                             road_start, road_end)
+    keep = ~np.isnan(x)
+    intensities = np.broadcast_to(intersections[:, None, 1:], x.shape + (2,))
+    return np.column_stack([x[keep], intensities[keep]])
 
 
 def compute_reflection(ray: Ray, surface: Segment, intensity: float, reflective_factor: float) -> (Ray, float):
@@ -147,6 +174,7 @@ def compute_reflection_multiple_segments(ind: Component, r_factor: float, r_time
     for ray in ind.original_rays:
         ray_intensity = ray.original_intensity
         ray.ray_array = [ray.ray]
+        ray.terminated = False
         last_reflection = ind.base
         reflection_exists = True
         no_of_reflections = 0
@@ -172,8 +200,7 @@ def compute_reflections_two_segments(ind: Component, r_factor: float):
     :param ind: Individual
     :param r_factor: Reflective factor from parameters
     """
-    ind.compute_right_segment()
-    ind.compute_left_segment()
+    ind.update_segments()
     no_of_reflections = 0
     for ray in ind.original_rays:
         ray_intensity = ray.original_intensity
@@ -0,0 +1,590 @@
+import copy
+import math
+from typing import List, Tuple
+
+import numpy as np
+from sympy.geometry import Point
+
+from component import Component
+from custom_ray import RayBundle
+
+# Float backend. Rays and segments are stored as arrays [[x1, y1], [x2, y2]]. For a ray the second point only
+# gives its direction, exactly as p2 of SymPy Ray does. Results agree with the SymPy backend within TOLERANCE.
+TOLERANCE = 1e-6
+
+# Intersections closer than this to the ray origin are the point the ray has just been reflected from
+EPSILON = 1e-7
+
+# Bounding volume hierarchy is used for individuals with at least this many segments, leaves hold BVH_LEAF_SIZE
+# segments
+BVH_MIN_SEGMENTS = 64
+BVH_LEAF_SIZE = 4
+
+
+def to_array(entity) -> np.ndarray:
+    """
+    Convert SymPy Point, Ray or Segment into float array. Arrays are returned unchanged.
+
+    :param entity: SymPy geometry entity or array
+    :return: Array [x, y] for point, [[x1, y1], [x2, y2]] for ray or segment
+    """
+    if isinstance(entity, np.ndarray):
+        return entity
+    if isinstance(entity, Point):
+        return np.array([float(entity.x), float(entity.y)])
+    return np.array([[float(entity.p1.x), float(entity.p1.y)], [float(entity.p2.x), float(entity.p2.y)]])
+
+
+def trace_population(origins: np.ndarray, directions: np.ndarray, intensities: np.ndarray, segments: np.ndarray,
+                     last_reflection: np.ndarray, ray_mask: np.ndarray, r_factor: float, r_timeout: int,
+                     in_turns: bool = False) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trace rays of whole population at once. Arrays are padded to the largest individual, padded segments
+    have zero length and never intersect anything, padded rays are excluded by ray mask. Rays hit the closest
+    segment, or with in_turns the segment following the last reflection if they intersect it (the first segment
+    for rays that were not reflected yet). Two connected segments of sympy backend are tried in turns like this,
+    right segment first.
+
+    :param origins: Array (individuals x rays x 2) of ray origins
+    :param directions: Array (individuals x rays x 2) of ray directions
+    :param intensities: Array (individuals x rays) of ray intensities
+    :param segments: Array (individuals x segments x 2 x 2) of reflective segments
+    :param last_reflection: Array (individuals x rays) of indices of segment each ray starts on (-1 for none)
+    :param ray_mask: Array (individuals x rays), False for padded rays
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    :param in_turns: Whether segments are tried in turns instead of hitting the closest one
+    :return: Tuple (reflection points (bounces x individuals x rays x 2, NaN when the ray has no more
+     reflections), final directions, final intensities, terminated mask, number of reflections of each ray,
+     indices of hit segments (bounces x individuals x rays, -1 when the ray has no more reflections))
+    """
+    shape = ray_mask.shape
+    number_of_segments = segments.shape[1]
+    origins = origins.reshape(-1, 2).astype(float)
+    directions = directions.reshape(-1, 2).astype(float)
+    intensities = intensities.reshape(-1).astype(float)
+    last_reflection = last_reflection.reshape(-1).copy()
+    owner = np.repeat(np.arange(shape[0]), shape[1])
+    no_of_reflections = np.zeros(len(origins), dtype=int)
+    hit_points = np.full((r_timeout, len(origins), 2), np.nan)
+    hit_segments = np.full((r_timeout, len(origins)), -1)
+
+    active = np.flatnonzero(ray_mask)
+    directions[active] /= np.hypot(directions[active, 0], directions[active, 1])[:, None]
+    starts = segments[:, :, 0]
+    edges = segments[:, :, 1] - segments[:, :, 0]
+    edge_lengths = np.hypot(edges[:, :, 0], edges[:, :, 1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normals = np.stack([-edges[:, :, 1], edges[:, :, 0]], axis=2) / edge_lengths[:, :, None]
+    segment_indices = np.arange(number_of_segments)
+
+    bounces = r_timeout
+    for bounce in range(r_timeout):
+        if len(active) == 0:
+            bounces = bounce
+            break
+        origin = origins[active]
+        direction = directions[active]
+        edge = edges[owner[active]]
+        # (rays x segments) cross products
+        denominator = direction[:, None, 0] * edge[:, :, 1] - direction[:, None, 1] * edge[:, :, 0]
+        diff = starts[owner[active]] - origin[:, None, :]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = (diff[:, :, 0] * edge[:, :, 1] - diff[:, :, 1] * edge[:, :, 0]) / denominator
+            position = (diff[:, :, 0] * direction[:, None, 1] - diff[:, :, 1] * direction[:, None, 0]) / denominator
+        valid = (np.abs(denominator) > EPSILON * edge_lengths[owner[active]]) & (distance > EPSILON) & \
+                (position >= -EPSILON) & (position <= 1 + EPSILON) & \
+                (segment_indices[None, :] != last_reflection[active][:, None])
+        distance = np.where(valid, distance, np.inf)
+        closest = np.argmin(distance, axis=1)
+        if in_turns:
+            following = (last_reflection[active] + 1) % number_of_segments
+            closest = np.where(np.isfinite(distance[np.arange(len(active)), following]), following, closest)
+        closest_distance = distance[np.arange(len(active)), closest]
+        hit = np.isfinite(closest_distance)
+
+        active = active[hit]
+        closest = closest[hit]
+        points = origin[hit] + closest_distance[hit][:, None] * direction[hit]
+        normal = normals[owner[active], closest]
+        direction = direction[hit]
+        hit_points[bounce, active] = points
+        hit_segments[bounce, active] = closest
+        origins[active] = points
+        directions[active] = direction - 2 * np.sum(direction * normal, axis=1)[:, None] * normal
+        intensities[active] *= r_factor
+        last_reflection[active] = closest
+        no_of_reflections[active] += 1
+    terminated = no_of_reflections == r_timeout
+    return hit_points[:bounces].reshape(bounces, shape[0], shape[1], 2), directions.reshape(shape + (2,)), \
+        intensities.reshape(shape), terminated.reshape(shape), no_of_reflections.reshape(shape), \
+        hit_segments[:bounces].reshape(bounces, shape[0], shape[1])
+
+
+class SegmentBVH:
+    """
+    Bounding volume hierarchy over segments of one individual. It is a complete binary tree stored by levels,
+    levels[k] holds boxes (nodes x [min, max] x 2) of 2^k nodes, children of node i are nodes 2i and 2i + 1.
+    Leaf i holds segments order[i * BVH_LEAF_SIZE:(i + 1) * BVH_LEAF_SIZE], -1 marks an empty slot.
+    The tree is never modified after it is built, update returns a new tree, so it can be shared by clones.
+    """
+
+    def __init__(self, segments: np.ndarray):
+        self.segments = segments.astype(float)
+        number_of_leaves = 2 ** math.ceil(math.log2(max(1, math.ceil(len(segments) / BVH_LEAF_SIZE))))
+        self.depth = int(math.log2(number_of_leaves))
+        self.order = np.full(number_of_leaves * BVH_LEAF_SIZE, -1)
+        self._split(np.arange(len(segments)), 0, number_of_leaves)
+        # Slot of each segment in order
+        self.position = np.empty(len(segments), dtype=int)
+        self.position[self.order[self.order >= 0]] = np.flatnonzero(self.order >= 0)
+        self.levels = [np.full((2 ** level, 2, 2), np.nan) for level in range(self.depth + 1)]
+        self._refit(np.arange(number_of_leaves))
+
+    def _split(self, indices: np.ndarray, first_leaf: int, number_of_leaves: int):
+        """
+        Distribute segments into leaves, segments are split in half by their centers along the longer axis
+
+        :param indices: Indices of segments
+        :param first_leaf: First leaf of the subtree
+        :param number_of_leaves: Number of leaves of the subtree
+        """
+        if number_of_leaves == 1:
+            self.order[first_leaf * BVH_LEAF_SIZE:first_leaf * BVH_LEAF_SIZE + len(indices)] = indices
+            return
+        if len(indices) > 1:
+            centers = self.segments[indices].mean(axis=1)
+            axis = np.argmax(np.ptp(centers, axis=0))
+            indices = indices[np.argsort(centers[:, axis], kind="stable")]
+        half = (len(indices) + 1) // 2
+        self._split(indices[:half], first_leaf, number_of_leaves // 2)
+        self._split(indices[half:], first_leaf + number_of_leaves // 2, number_of_leaves // 2)
+
+    def _refit(self, leaves: np.ndarray):
+        """
+        Recompute boxes of given leaves and of all their ancestors. Boxes are enlarged by TOLERANCE,
+        so that axis-parallel segments have boxes with non-zero area.
+
+        :param leaves: Indices of leaves
+        """
+        slots = self.order[leaves[:, None] * BVH_LEAF_SIZE + np.arange(BVH_LEAF_SIZE)]
+        points = np.where((slots >= 0)[:, :, None, None], self.segments[slots], np.nan).reshape(len(leaves), -1, 2)
+        self.levels[self.depth][leaves, 0] = np.fmin.reduce(points, axis=1) - TOLERANCE
+        self.levels[self.depth][leaves, 1] = np.fmax.reduce(points, axis=1) + TOLERANCE
+        nodes = leaves
+        for level in range(self.depth - 1, -1, -1):
+            nodes = np.unique(nodes // 2)
+            children = self.levels[level + 1]
+            self.levels[level][nodes, 0] = np.fmin(children[2 * nodes, 0], children[2 * nodes + 1, 0])
+            self.levels[level][nodes, 1] = np.fmax(children[2 * nodes, 1], children[2 * nodes + 1, 1])
+
+    def update(self, segments: np.ndarray) -> "SegmentBVH":
+        """
+        Get tree for modified segments. If only few segments changed (e.g. after shift, rotation or resizing
+        of one segment), only boxes on their paths to the root are recomputed, otherwise the tree is built again.
+
+        :param segments: Array (segments x 2 x 2) of current segments
+        :return: Tree for given segments
+        """
+        if segments.shape != self.segments.shape:
+            return SegmentBVH(segments)
+        changed = np.flatnonzero(np.any(segments != self.segments, axis=(1, 2)))
+        if len(changed) == 0:
+            return self
+        if len(changed) > len(segments) // 4:
+            return SegmentBVH(segments)
+        bvh = copy.copy(self)
+        bvh.segments = segments.astype(float)
+        bvh.levels = [level.copy() for level in self.levels]
+        bvh._refit(np.unique(self.position[changed] // BVH_LEAF_SIZE))
+        return bvh
+
+    def closest_hits(self, origins: np.ndarray, directions: np.ndarray, last_reflection: np.ndarray) \
+            -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest segment hit by each ray. The tree is traversed level by level for all rays at once,
+        only segments in leaves whose boxes are hit by the ray are tested.
+
+        :param origins: Array (rays x 2) of ray origins
+        :param directions: Array (rays x 2) of unit ray directions
+        :param last_reflection: Array of indices of segment each ray starts on (-1 for none)
+        :return: Tuple (distance to the closest hit, inf if there is none; index of the closest segment, -1 if
+         there is none)
+        """
+        with np.errstate(divide="ignore", over="ignore"):
+            inverse = 1 / np.where(directions == 0, 1e-300, directions)
+        rays = np.arange(len(origins))
+        nodes = np.zeros(len(origins), dtype=int)
+        for level in range(self.depth + 1):
+            boxes = self.levels[level][nodes]
+            with np.errstate(invalid="ignore", over="ignore"):
+                lower = (boxes[:, 0] - origins[rays]) * inverse[rays]
+                upper = (boxes[:, 1] - origins[rays]) * inverse[rays]
+                near = np.max(np.minimum(lower, upper), axis=1)
+                far = np.min(np.maximum(lower, upper), axis=1)
+                hit = (near <= far) & (far > EPSILON)
+            rays, nodes = rays[hit], nodes[hit]
+            if level < self.depth:
+                rays = np.repeat(rays, 2)
+                nodes = (2 * nodes[:, None] + np.arange(2)).ravel()
+
+        segment = self.order[nodes[:, None] * BVH_LEAF_SIZE + np.arange(BVH_LEAF_SIZE)].ravel()
+        rays = np.repeat(rays, BVH_LEAF_SIZE)
+        keep = (segment >= 0) & (segment != last_reflection[rays])
+        rays, segment = rays[keep], segment[keep]
+        start = self.segments[segment, 0]
+        edge = self.segments[segment, 1] - start
+        direction = directions[rays]
+        denominator = direction[:, 0] * edge[:, 1] - direction[:, 1] * edge[:, 0]
+        diff = start - origins[rays]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            distance = (diff[:, 0] * edge[:, 1] - diff[:, 1] * edge[:, 0]) / denominator
+            position = (diff[:, 0] * direction[:, 1] - diff[:, 1] * direction[:, 0]) / denominator
+        valid = (np.abs(denominator) > EPSILON * np.hypot(edge[:, 0], edge[:, 1])) & (distance > EPSILON) & \
+                (position >= -EPSILON) & (position <= 1 + EPSILON)
+        rays, segment, distance = rays[valid], segment[valid], distance[valid]
+
+        # The closest hit of each ray, ties are resolved by segment index as in trace_population
+        closest_distance = np.full(len(origins), np.inf)
+        closest = np.full(len(origins), -1)
+        order = np.lexsort((segment, distance, rays))
+        first = order[np.r_[True, rays[order][1:] != rays[order][:-1]]] if len(order) else order
+        closest_distance[rays[first]] = distance[first]
+        closest[rays[first]] = segment[first]
+        return closest_distance, closest
+
+
+def trace_rays_bvh(origins: np.ndarray, directions: np.ndarray, intensities: np.ndarray, bvh: SegmentBVH,
+                   last_reflection: np.ndarray, r_factor: float, r_timeout: int) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trace rays of one individual like trace_population, closest segments are found with bounding volume hierarchy.
+
+    :param origins: Array (rays x 2) of ray origins
+    :param directions: Array (rays x 2) of ray directions
+    :param intensities: Array of ray intensities
+    :param bvh: Bounding volume hierarchy of reflective segments
+    :param last_reflection: Array of indices of segment each ray starts on (-1 for none)
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    :return: Tuple (reflection points (bounces x rays x 2, NaN when the ray has no more reflections),
+     final directions, final intensities, terminated mask, number of reflections of each ray, indices of hit
+     segments (bounces x rays, -1 when the ray has no more reflections))
+    """
+    origins = origins.astype(float)
+    directions = directions / np.hypot(directions[:, 0], directions[:, 1])[:, None]
+    intensities = intensities.astype(float)
+    last_reflection = last_reflection.copy()
+    edges = bvh.segments[:, 1] - bvh.segments[:, 0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        normals = np.stack([-edges[:, 1], edges[:, 0]], axis=1) / np.hypot(edges[:, 0], edges[:, 1])[:, None]
+    no_of_reflections = np.zeros(len(origins), dtype=int)
+    hit_points = np.full((r_timeout, len(origins), 2), np.nan)
+    hit_segments = np.full((r_timeout, len(origins)), -1)
+
+    active = np.arange(len(origins))
+    bounces = r_timeout
+    for bounce in range(r_timeout):
+        if len(active) == 0:
+            bounces = bounce
+            break
+        distance, closest = bvh.closest_hits(origins[active], directions[active], last_reflection[active])
+        hit = closest >= 0
+        active, closest, distance = active[hit], closest[hit], distance[hit]
+        direction = directions[active]
+        points = origins[active] + distance[:, None] * direction
+        normal = normals[closest]
+        hit_points[bounce, active] = points
+        hit_segments[bounce, active] = closest
+        origins[active] = points
+        directions[active] = direction - 2 * np.sum(direction * normal, axis=1)[:, None] * normal
+        intensities[active] *= r_factor
+        last_reflection[active] = closest
+        no_of_reflections[active] += 1
+    terminated = no_of_reflections == r_timeout
+    return hit_points[:bounces], directions, intensities, terminated, no_of_reflections, hit_segments[:bounces]
+
+
+def pack_population(individuals: List[Component], configuration: str) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Pack rays and reflective segments of all individuals into arrays padded to the largest individual.
+    In two connected configuration right and left segment are used, in multiple free configuration all
+    reflective segments and base (which rays start on).
+
+    :param individuals: List of individuals
+    :param configuration: Configuration - two connected or multiple free
+    :return: Tuple (origins, directions, original intensities, segments, last reflection, ray mask)
+    """
+    all_segments = []
+    for ind in individuals:
+        if configuration == "two connected":
+            ind.update_segments()
+            all_segments.append([ind.right_segment_array, ind.left_segment_array])
+        else:
+            all_segments.append([to_array(segment) for segment in ind.reflective_segments + [ind.base]])
+    max_rays = max(len(ind.ray_fan.angles) for ind in individuals)
+    max_segments = max(len(segments) for segments in all_segments)
+    origins = np.zeros((len(individuals), max_rays, 2))
+    directions = np.zeros((len(individuals), max_rays, 2))
+    intensities = np.zeros((len(individuals), max_rays))
+    segments = np.zeros((len(individuals), max_segments, 2, 2))
+    last_reflection = np.full((len(individuals), max_rays), -1)
+    ray_mask = np.zeros((len(individuals), max_rays), dtype=bool)
+    for index, ind in enumerate(individuals):
+        number_of_rays = len(ind.ray_fan.angles)
+        origins[index, :number_of_rays] = to_array(ind.origin)
+        directions[index, :number_of_rays] = ind.ray_fan.directions
+        intensities[index, :number_of_rays] = ind.ray_fan.intensities
+        segments[index, :len(all_segments[index])] = all_segments[index]
+        ray_mask[index, :number_of_rays] = True
+        if configuration == "multiple free":
+            last_reflection[index, :number_of_rays] = len(all_segments[index]) - 1
+    return origins, directions, intensities, segments, last_reflection, ray_mask
+
+
+def road_hits(origins: np.ndarray, directions: np.ndarray, road: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute intersections of rays with road for rays given by arrays of any shape.
+
+    :param origins: Array (... x 2) of ray origins
+    :param directions: Array (... x 2) of unit ray directions
+    :param road: Segment representing road
+    :return: Tuple (x-coord of road intersection, NaN if there is none; sine of angle between ray and road)
+    """
+    if road[0, 1] == road[1, 1]:
+        return horizontal_road_hits(origins, directions, road[0, 1], min(road[:, 0]), max(road[:, 0]))
+    edge = road[1] - road[0]
+    edge_length = np.hypot(edge[0], edge[1])
+    denominator = directions[..., 0] * edge[1] - directions[..., 1] * edge[0]
+    diff = road[0] - origins
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = (diff[..., 0] * edge[1] - diff[..., 1] * edge[0]) / denominator
+        position = (diff[..., 0] * directions[..., 1] - diff[..., 1] * directions[..., 0]) / denominator
+    hit = (np.abs(denominator) > EPSILON * edge_length) & (distance >= -EPSILON) & \
+          (position >= -EPSILON) & (position <= 1 + EPSILON)
+    x = np.where(hit, origins[..., 0] + distance * directions[..., 0], np.nan)
+    return x, np.abs(denominator) / edge_length
+
+
+def trace_population_bvh(individuals: List[Component], origins: np.ndarray, directions: np.ndarray,
+                         intensities: np.ndarray, segments: np.ndarray, last_reflection: np.ndarray,
+                         ray_mask: np.ndarray, r_factor: float, r_timeout: int) \
+        -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Trace rays of whole population individual by individual with bounding volume hierarchy of each individual.
+    Trees are kept on individuals and updated when their segments change. Arguments and returned values are
+    the same as in trace_population.
+
+    :param individuals: List of individuals
+    :param origins: Array (individuals x rays x 2) of ray origins
+    :param directions: Array (individuals x rays x 2) of ray directions
+    :param intensities: Array (individuals x rays) of ray intensities
+    :param segments: Array (individuals x segments x 2 x 2) of reflective segments
+    :param last_reflection: Array (individuals x rays) of indices of segment each ray starts on (-1 for none)
+    :param ray_mask: Array (individuals x rays), False for rays that are not traced
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    :return: Tuple (reflection points (bounces x individuals x rays x 2, NaN when the ray has no more
+     reflections), final directions, final intensities, terminated mask, number of reflections of each ray,
+     indices of hit segments (bounces x individuals x rays, -1 when the ray has no more reflections))
+    """
+    results = []
+    for index, ind in enumerate(individuals):
+        ind_segments = segments[index, :len(ind.reflective_segments) + 1]
+        if ind.segment_bvh is None:
+            ind.segment_bvh = SegmentBVH(ind_segments)
+        else:
+            ind.segment_bvh = ind.segment_bvh.update(ind_segments)
+        rays = np.flatnonzero(ray_mask[index])
+        results.append(trace_rays_bvh(origins[index, rays], directions[index, rays], intensities[index, rays],
+                                      ind.segment_bvh, last_reflection[index, rays], r_factor, r_timeout))
+
+    bounces = max(len(result[0]) for result in results)
+    hit_points = np.full((bounces,) + origins.shape, np.nan)
+    hit_segments = np.full((bounces,) + ray_mask.shape, -1)
+    directions = directions.astype(float)
+    intensities = intensities.astype(float)
+    terminated = np.zeros(ray_mask.shape, dtype=bool)
+    no_of_reflections = np.zeros(ray_mask.shape, dtype=int)
+    for index, (ind_hit_points, ind_directions, ind_intensities, ind_terminated, ind_reflections, ind_hit_segments) \
+            in enumerate(results):
+        rays = np.flatnonzero(ray_mask[index])
+        hit_points[:len(ind_hit_points), index, rays] = ind_hit_points
+        hit_segments[:len(ind_hit_segments), index, rays] = ind_hit_segments
+        directions[index, rays] = ind_directions
+        intensities[index, rays] = ind_intensities
+        terminated[index, rays] = ind_terminated
+        no_of_reflections[index, rays] = ind_reflections
+    return hit_points, directions, intensities, terminated, no_of_reflections, hit_segments
+
+
+def horizontal_road_hits(origins: np.ndarray, directions: np.ndarray, road_y: float, road_start: float,
+                         road_end: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute intersections of rays with horizontal road directly from ray origins and directions, for rays given
+    by arrays of any shape. Tolerances are the same as in road_hits.
+
+    :param origins: Array (... x 2) of ray origins
+    :param directions: Array (... x 2) of unit ray directions
+    :param road_y: Y-coordinate of the road
+    :param road_start: X-coordinate of start of the road
+    :param road_end: X-coordinate of end of the road
+    :return: Tuple (x-coord of road intersection, NaN if there is none; sine of angle between ray and road)
+    """
+    y_direction = directions[..., 1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        distance = (road_y - origins[..., 1]) / y_direction
+        x = origins[..., 0] + distance * directions[..., 0]
+    margin = EPSILON * (road_end - road_start)
+    hit = (np.abs(y_direction) > EPSILON) & (distance >= -EPSILON) & (x >= road_start - margin) & \
+          (x <= road_end + margin)
+    return np.where(hit, x, np.nan), np.abs(y_direction)
+
+
+def rays_to_retrace(bundle: RayBundle, segments: np.ndarray) -> np.ndarray:
+    """
+    Find rays whose trace can change when segments differ from the segments the bundle was traced with. A ray
+    can change only if it was reflected from a changed segment or if some part of its path crosses the new
+    position of a changed segment. All rays are traced again if the bundle was not traced with known segments.
+
+    :param bundle: Ray bundle with previous trace
+    :param segments: Array (segments x 2 x 2) of current segments
+    :return: Mask of rays that must be traced again
+    """
+    if bundle.segments is None or bundle.segments.shape != segments.shape:
+        return np.ones(len(bundle), dtype=bool)
+    changed = np.flatnonzero(np.any(segments != bundle.segments, axis=(1, 2)))
+    retrace = np.zeros(len(bundle), dtype=bool)
+    if len(changed) == 0:
+        return retrace
+    owner = np.repeat(np.arange(len(bundle)), np.diff(bundle.path_offsets))
+    retrace[owner[np.isin(bundle.hit_segments, changed)]] = True
+
+    # Parts of paths between reflections (parameter along the part up to 1) and last parts of rays that were
+    # not terminated (unit direction, unlimited)
+    inner = owner[:-1] == owner[1:]
+    free = np.flatnonzero(~bundle.terminated)
+    starts = np.concatenate([bundle.path[:-1][inner], bundle.origins[free]])
+    vectors = np.concatenate([bundle.path[1:][inner] - bundle.path[:-1][inner], bundle.directions[free]])
+    limits = np.concatenate([np.ones(np.count_nonzero(inner)), np.full(len(free), np.inf)])
+    part_owner = np.concatenate([owner[:-1][inner], free])
+
+    new_segments = segments[changed]
+    edges = new_segments[:, 1] - new_segments[:, 0]
+    denominator = vectors[:, None, 0] * edges[None, :, 1] - vectors[:, None, 1] * edges[None, :, 0]
+    diff = new_segments[None, :, 0] - starts[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        along = (diff[:, :, 0] * edges[None, :, 1] - diff[:, :, 1] * edges[None, :, 0]) / denominator
+        position = (diff[:, :, 0] * vectors[:, None, 1] - diff[:, :, 1] * vectors[:, None, 0]) / denominator
+    # Parallel parts are retraced too, so that the test is conservative
+    crossing = (np.abs(denominator) <= EPSILON) | \
+        ((along >= -TOLERANCE) & (along <= limits[:, None] + TOLERANCE) &
+         (position >= -TOLERANCE) & (position <= 1 + TOLERANCE))
+    retrace[part_owner[np.any(crossing, axis=1)]] = True
+    return retrace
+
+
+def compute_reflections_population(individuals: List[Component], configuration: str, r_factor: float,
+                                   r_timeout: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray,
+                                                            np.ndarray, np.ndarray]:
+    """
+    Compute reflections of rays of all individuals in one batched pass. Trace of the rays is recorded in ray
+    bundle of each individual. In multiple free configuration only rays that can be affected by segments
+    changed since the previous trace (see rays_to_retrace) are traced again, other rays keep their trace.
+
+    :param individuals: List of individuals
+    :param configuration: Configuration - two connected or multiple free
+    :param r_factor: Reflective factor of the material
+    :param r_timeout: Reflections timeout from parameters
+    :return: Tuple (final ray origins, final ray directions, intensities, original intensities, terminated mask,
+     ray mask); arrays are individuals x rays (x 2)
+    """
+    origins, directions, original_intensities, segments, last_reflection, ray_mask = \
+        pack_population(individuals, configuration)
+    retrace = ray_mask.copy()
+    if configuration == "multiple free":
+        for index, ind in enumerate(individuals):
+            retrace[index, :len(ind.rays)] = rays_to_retrace(ind.rays,
+                                                             segments[index, :len(ind.reflective_segments) + 1])
+    if configuration == "multiple free" and segments.shape[1] >= BVH_MIN_SEGMENTS:
+        hit_points, directions, intensities, terminated, no_of_reflections, hit_segments = \
+            trace_population_bvh(individuals, origins, directions, original_intensities, segments,
+                                 last_reflection, retrace, r_factor, r_timeout)
+    else:
+        hit_points, directions, intensities, terminated, no_of_reflections, hit_segments = \
+            trace_population(origins, directions, original_intensities, segments, last_reflection, retrace,
+                             r_factor, r_timeout, in_turns=configuration == "two connected")
+
+    # Rays that were not traced again keep their previous trace
+    reused = ray_mask & ~retrace
+    if reused.any():
+        bounces = max(len(hit_points), max(int(ind.rays.no_of_reflections.max(initial=0)) for ind in individuals))
+        hit_points = np.concatenate([hit_points, np.full((bounces - len(hit_points),) + origins.shape, np.nan)])
+        hit_segments = np.concatenate([hit_segments, np.full((bounces - len(hit_segments),) + ray_mask.shape, -1)])
+        for index, ind in enumerate(individuals):
+            rays = np.flatnonzero(reused[index])
+            if len(rays) == 0:
+                continue
+            bundle = ind.rays
+            points, segment_indices = bundle.padded_paths(bounces + 1)
+            hit_points[:, index, rays] = points[rays, 1:].transpose(1, 0, 2)
+            hit_segments[:, index, rays] = segment_indices[rays, 1:].T
+            directions[index, rays] = bundle.directions[rays]
+            intensities[index, rays] = bundle.intensities[rays]
+            terminated[index, rays] = bundle.terminated[rays]
+            no_of_reflections[index, rays] = bundle.no_of_reflections[rays]
+
+    final_origins = origins.copy()
+    for bounce in range(len(hit_points)):
+        reflected = no_of_reflections > bounce
+        final_origins[reflected] = hit_points[bounce][reflected]
+
+    for index, ind in enumerate(individuals):
+        number_of_rays = len(ind.rays)
+        reflections = no_of_reflections[index, :number_of_rays]
+        # Points (rays x bounces + 1 x 2) starting with origin, only the first reflections + 1 are valid
+        points = np.concatenate([origins[index, :number_of_rays, None],
+                                 hit_points[:, index, :number_of_rays].transpose(1, 0, 2)], axis=1)
+        segment_indices = np.concatenate([np.full((number_of_rays, 1), -1),
+                                          hit_segments[:, index, :number_of_rays].T], axis=1)
+        valid = np.arange(points.shape[1])[None, :] <= reflections[:, None]
+        bundle = ind.rays
+        bundle.path = points[valid]
+        bundle.path_offsets = np.concatenate([[0], np.cumsum(reflections + 1)])
+        bundle.hit_segments = segment_indices[valid]
+        bundle.segments = segments[index, :len(ind.reflective_segments) + 1] \
+            if configuration == "multiple free" else None
+        bundle.origins = final_origins[index, :number_of_rays]
+        bundle.directions = directions[index, :number_of_rays]
+        bundle.intensities = intensities[index, :number_of_rays]
+        bundle.terminated = terminated[index, :number_of_rays]
+        bundle.no_of_reflections = reflections
+        bundle.road_intersections = np.full(number_of_rays, np.nan)
+        ind.no_of_reflections = int(reflections.sum())
+    return final_origins, directions, intensities, original_intensities, terminated, ray_mask
+
+
+def recalculate_intersections_population(x: np.ndarray, led_offsets: List[float], separating_distance: float,
+                                         modification: str, road_start: int, road_end: int) -> np.ndarray:
+    """
+    Recalculate road intersections of all individuals for situations with more than one LED. The function works
+    either with mirror or shift modification. Shifted LEDs are placed at arbitrary offsets from the first LED.
+
+    :param x: Array (individuals x rays) of x-coords of road intersections, NaN if there is none
+    :param led_offsets: Horizontal offset of each LED from the first LED
+    :param separating_distance: Distance separating mirrored LEDs
+    :param modification: Indicator whether the LEDs are mirrored or shifted only
+    :param road_start: Coordinates for start of the road
+    :param road_end: Coordinates for end of the road
+    :return: Array (individuals x rays x LEDs) of x-coords of road intersections, NaN if there is none
+    """
+    if modification == "mirror":
+        recalculated = np.stack([x, -x - separating_distance], axis=-1)
+        # Intersections of the first LED are always kept
+        recalculated[..., 1][(recalculated[..., 1] < road_start) | (recalculated[..., 1] > road_end)] = np.nan
+        return recalculated
+    recalculated = x[..., None] + np.asarray(led_offsets, dtype=float)
+    recalculated[(recalculated < road_start) | (recalculated > road_end)] = np.nan
+    return recalculated
@@ -114,6 +114,7 @@ def mutate_length(individual: Component, length_upper_bound: int, length_lower_b
     individual.right_length_coef = min(individual.right_length_coef, length_upper_bound)
     individual.left_length_coef = max(individual.left_length_coef, length_lower_bound)
     individual.right_length_coef = max(individual.right_length_coef, length_lower_bound)
+    individual.segments_dirty = True
     return individual
 
 
@@ -130,6 +131,7 @@ def mutate_angle(individual: Component) -> Component:
     individual.left_angle += random.randint(-10, 10)
     individual.left_angle = max(individual.angle_limit_min - 90, individual.left_angle)
     individual.left_angle = min(individual.angle_limit_max - 90, individual.left_angle)
+    individual.segments_dirty = True
     return individual
 
 
@@ -147,4 +149,6 @@ def x_over_two_segments(ind1: Component, ind2: Component) -> (Component, Compone
     dummy_length = ind1.right_length_coef
     ind1.right_length_coef = ind2.right_length_coef
     ind2.right_length_coef = dummy_length
+    ind1.segments_dirty = True
+    ind2.segments_dirty = True
     return ind1, ind2
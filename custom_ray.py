@@ -1,23 +1,289 @@
 import math
+import random
+from functools import lru_cache
+from typing import NamedTuple, Tuple
 
+import numpy as np
 from sympy import Point, Ray
 
 
+# Sobol points are computed with this many bits
+SOBOL_BITS = 30
+
+
+class RayFan(NamedTuple):
+    """
+    Directions and intensities of rays sampled from LED. Arrays are read-only and shared by all individuals
+    with the same sampling parameters. Total intensity of the rays is computed once when the fan is sampled.
+    Rays of importance sampled fan all have the same intensity (mean Lambertian intensity), their density
+    follows the Lambertian distribution instead.
+    """
+    angles: np.ndarray
+    directions: np.ndarray
+    intensities: np.ndarray
+    total_intensity: float
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def halton_sequence(count: int, base: int) -> np.ndarray:
+    """
+    Compute points of Halton (van der Corput) sequence in given base, the first point (zero) is skipped
+
+    :param count: Number of points
+    :param base: Base of the sequence (prime number)
+    :return: Array of points in [0, 1)
+    """
+    indices = np.arange(1, count + 1)
+    points = np.zeros(count)
+    factor = 1 / base
+    while indices.any():
+        points += indices % base * factor
+        indices //= base
+        factor /= base
+    return points
+
+
+def sobol_sequence(count: int, dimensions: int) -> np.ndarray:
+    """
+    Compute points of Sobol sequence in Gray code order, the first point (zero) is skipped. The first dimension
+    is van der Corput sequence in base 2, the second one uses primitive polynomial x + 1 with direction number 1
+    (Joe and Kuo).
+
+    :param count: Number of points
+    :param dimensions: Number of dimensions (1 or 2)
+    :return: Array (points x dimensions) of points in [0, 1)
+    """
+    directions = np.zeros((2, SOBOL_BITS), dtype=np.int64)
+    m = 1
+    for bit in range(SOBOL_BITS):
+        directions[0, bit] = 1 << (SOBOL_BITS - 1 - bit)
+        directions[1, bit] = m << (SOBOL_BITS - 1 - bit)
+        m = (m << 1) ^ m
+    indices = np.arange(1, count + 1, dtype=np.int64)
+    gray = indices ^ (indices >> 1)
+    points = np.zeros((count, dimensions), dtype=np.int64)
+    for bit in range(SOBOL_BITS):
+        points ^= ((gray >> bit) & 1)[:, None] * directions[None, :dimensions, bit]
+    return points / float(1 << SOBOL_BITS)
+
+
+def sample_ray_fan(number_of_rays: int, distribution: str, base_angle: int) -> RayFan:
+    """
+    Sample given number of rays from LED according to base angle and distribution parameter.
+    Uniform, Sobol and Halton fans are computed only once for each combination of parameters. Stratified fan
+    has one ray at random angle in each of equal parts of the fan, importance sampled fan is stratified fan
+    of Lambertian distribution.
+
+    :param number_of_rays: Number of rays going from LED
+    :param distribution: random, uniform, stratified, sobol, halton or importance - random is default
+    :param base_angle: Angle of base for LED
+    :return: Ray fan
+    """
+    if distribution == "uniform":
+        return uniform_ray_fan(number_of_rays, base_angle)
+    if distribution in ["sobol", "halton"]:
+        return low_discrepancy_ray_fan(number_of_rays, distribution, base_angle)
+    if distribution in ["stratified", "importance"]:
+        samples = [(ray + random.random()) / number_of_rays for ray in range(number_of_rays)]
+        if distribution == "importance":
+            # Inverse of cumulative distribution function of Lambertian distribution, (1 - cos(angle)) / 2
+            angles = [180 + math.degrees(math.acos(1 - 2 * sample)) + base_angle for sample in samples]
+            return make_ray_fan(angles, base_angle, 2 / math.pi)
+        angles = [180 + 180 * sample + base_angle for sample in samples]
+        return make_ray_fan(angles, base_angle)
+    angles = [random.randint(180, 360) + base_angle for _ in range(number_of_rays)]
+    return make_ray_fan(angles, base_angle)
+
+
+@lru_cache(maxsize=None)
+def uniform_ray_fan(number_of_rays: int, base_angle: int) -> RayFan:
+    """
+    Sample rays uniformly from LED
+
+    :param number_of_rays: Number of rays going from LED
+    :param base_angle: Angle of base for LED
+    :return: Ray fan
+    """
+    step = 180 / number_of_rays
+    angles = [180 + ray*step + step/2 + base_angle for ray in range(number_of_rays)]
+    return make_ray_fan(angles, base_angle)
+
+
+@lru_cache(maxsize=None)
+def low_discrepancy_ray_fan(number_of_rays: int, distribution: str, base_angle: int) -> RayFan:
+    """
+    Sample rays from LED by Sobol or Halton sequence
+
+    :param number_of_rays: Number of rays going from LED
+    :param distribution: sobol or halton
+    :param base_angle: Angle of base for LED
+    :return: Ray fan
+    """
+    if distribution == "sobol":
+        samples = sobol_sequence(number_of_rays, 1)[:, 0]
+    else:
+        samples = halton_sequence(number_of_rays, 2)
+    return make_ray_fan(180 + 180 * samples + base_angle, base_angle)
+
+
+def make_ray_fan(angles: list, base_angle: int, intensity: float = None) -> RayFan:
+    """
+    Create ray fan for given ray angles. Intensity is calculated according to Lambertian distribution
+    unless the same intensity of all rays is given.
+
+    :param angles: Angles of rays (in degrees)
+    :param base_angle: Angle of base for LED
+    :param intensity: Intensity of every ray for importance sampled fan
+    :return: Ray fan
+    """
+    angles = np.array(angles, dtype=float)
+    radians = np.radians(angles)
+    directions = np.stack([np.cos(radians), np.sin(radians)], axis=1).reshape(-1, 2)
+    if intensity is None:
+        intensities = np.abs(np.sin(np.radians(np.abs(angles - base_angle))))
+    else:
+        intensities = np.full(len(angles), float(intensity))
+    for array in (angles, directions, intensities):
+        array.flags.writeable = False
+    return RayFan(angles, directions, intensities, float(intensities.sum()))
+
+
 class MyRay:
 
-    def __init__(self, origin: Point, ray_angle: float, base_angle: int):
+    def __init__(self, origin: Point, ray_angle: float, base_angle: int, intensity: float = None):
         self.ray_length = 1
-        # Intensity is calculated according to Lambertian distribution
-        self.intensity = abs(math.sin(math.radians(abs(ray_angle - base_angle))))
-        self.original_intensity = abs(math.sin(math.radians(abs(ray_angle - base_angle))))
+        self.origin = origin
+        self.angle = ray_angle
+        # Intensity is calculated according to Lambertian distribution unless it is given by importance sampling
+        if intensity is None:
+            intensity = abs(math.sin(math.radians(abs(ray_angle - base_angle))))
+        self.intensity = intensity
+        self.original_intensity = intensity
         self.end_intensity = self.intensity * 1 / (self.ray_length * self.ray_length)
-        # End coordinates are calculated from ray angle
-        x_coordinate = 10000 * math.cos(math.radians(ray_angle)) + origin.x
-        y_coordinate = 10000 * math.sin(math.radians(ray_angle)) + origin.y
-        # Ray goes from the origin in direction of end coordinates
-        self.ray = Ray(origin, Point(x_coordinate, y_coordinate))
+        # SymPy ray is created only when it is needed by sympy backend or drawing
+        self._ray = None
         # Array used for storing segments of reflected ray
-        self.ray_array = [Ray(origin, Point(x_coordinate, y_coordinate))]
+        self._ray_array = None
         self.road_intersection = []
         # If the ray is reflected too many time or if it is reflected back into the device, it will be terminated
         self.terminated = False
+
+    @property
+    def ray(self) -> Ray:
+        if self._ray is None:
+            # End coordinates are calculated from ray angle
+            x_coordinate = 10000 * math.cos(math.radians(self.angle)) + self.origin.x
+            y_coordinate = 10000 * math.sin(math.radians(self.angle)) + self.origin.y
+            # Ray goes from the origin in direction of end coordinates
+            self._ray = Ray(self.origin, Point(x_coordinate, y_coordinate))
+        return self._ray
+
+    @property
+    def ray_array(self) -> list:
+        if self._ray_array is None:
+            return [self.ray]
+        return self._ray_array
+
+    @ray_array.setter
+    def ray_array(self, ray_array: list):
+        self._ray_array = ray_array
+
+
+class RayBundle:
+    """
+    Trace state of all rays of one individual stored as arrays. Path of ray i (origin and all reflection points)
+    is path[path_offsets[i]:path_offsets[i + 1]], the last part of the ray starts at origins[i] and goes in
+    direction directions[i]. hit_segments holds index of segment hit in each point of path (-1 for origin),
+    segments are the segments the rays were traced with (None if they are unknown).
+    """
+    __slots__ = ("origins", "directions", "intensities", "terminated", "no_of_reflections", "path", "path_offsets",
+                 "hit_segments", "segments", "road_intersections")
+
+    def __init__(self, fan: RayFan, origin: Point):
+        number_of_rays = len(fan.angles)
+        self.origins = np.tile(np.array([float(origin.x), float(origin.y)]), (number_of_rays, 1))
+        self.directions = fan.directions
+        self.intensities = fan.intensities
+        self.terminated = np.zeros(number_of_rays, dtype=bool)
+        self.no_of_reflections = np.zeros(number_of_rays, dtype=int)
+        self.path = self.origins
+        self.path_offsets = np.arange(number_of_rays + 1)
+        self.hit_segments = np.full(number_of_rays, -1)
+        self.segments = None
+        self.road_intersections = np.full(number_of_rays, np.nan)
+
+    def __len__(self) -> int:
+        return len(self.origins)
+
+    def __deepcopy__(self, memo) -> "RayBundle":
+        return self.copy()
+
+    def __getstate__(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def copy(self) -> "RayBundle":
+        """
+        Copy the bundle, arrays are copied too
+        """
+        bundle = RayBundle.__new__(RayBundle)
+        for name in self.__slots__:
+            value = getattr(self, name)
+            setattr(bundle, name, None if value is None else value.copy())
+        return bundle
+
+    def ray_path(self, index: int) -> np.ndarray:
+        """
+        Points of polyline of given ray - origin and all reflection points
+
+        :param index: Index of the ray
+        :return: Array (points x 2)
+        """
+        return self.path[self.path_offsets[index]:self.path_offsets[index + 1]]
+
+    def padded_paths(self, length: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Paths of all rays padded to the same length
+
+        :param length: Number of points of each padded path
+        :return: Tuple (points (rays x length x 2, NaN for padding), hit segments (rays x length, -1 for padding))
+        """
+        owner = np.repeat(np.arange(len(self)), np.diff(self.path_offsets))
+        position = np.arange(len(self.path)) - self.path_offsets[owner]
+        keep = position < length
+        points = np.full((len(self), length, 2), np.nan)
+        points[owner[keep], position[keep]] = self.path[keep]
+        hit_segments = np.full((len(self), length), -1)
+        hit_segments[owner[keep], position[keep]] = self.hit_segments[keep]
+        return points, hit_segments
+
+    def record(self, rays: list):
+        """
+        Record trace of rays traced by sympy backend
+
+        :param rays: List of traced rays
+        """
+        paths = []
+        directions = []
+        for ray in rays:
+            points = [part.p1 for part in ray.ray_array]
+            paths.append([(float(point.x), float(point.y)) for point in points])
+            last_ray = ray.ray_array[-1]
+            direction = (float(last_ray.p2.x - last_ray.p1.x), float(last_ray.p2.y - last_ray.p1.y))
+            directions.append(np.array(direction) / math.hypot(*direction))
+        self.path = np.array([point for points in paths for point in points]).reshape(-1, 2)
+        self.path_offsets = np.concatenate([[0], np.cumsum([len(points) for points in paths])]).astype(int)
+        self.origins = self.path[self.path_offsets[1:] - 1]
+        self.directions = np.array(directions).reshape(-1, 2)
+        self.intensities = np.array([ray.intensity for ray in rays], dtype=float)
+        self.terminated = np.array([ray.terminated for ray in rays], dtype=bool)
+        self.no_of_reflections = self.path_offsets[1:] - self.path_offsets[:-1] - 1
+        self.hit_segments = np.full(len(self.path), -1)
+        self.segments = None
+        self.road_intersections = np.array([float(ray.road_intersection) if ray.road_intersection != [] else np.nan
+                                            for ray in rays])
@@ -1,5 +1,6 @@
 from typing import List
 
+import numpy as np
 from sympy import Point, Segment
 
 
@@ -7,9 +8,10 @@ class Environment:
     def __init__(self, road_start: int, road_end: int, road_depth: int,
                  road_sections: int, criterion: str, cosine_error: str, reflective_factor: float, configuration: str,
                  number_of_led: int, separating_distance: float, modification: str, weights: List[int],
-                 reflections_timeout: int):
+                 reflections_timeout: int, backend: str = "sympy", led_offsets: List[float] = None):
 
         self.road = Segment(Point(road_start, road_depth), Point(road_end, road_depth))
+        self.road_array = np.array([[road_start, road_depth], [road_end, road_depth]], dtype=float)
         self.road_start = road_start
         self.road_end = road_end
         self.road_length = (self.road_end - self.road_start)
@@ -22,9 +24,25 @@ class Environment:
         self.quality_criterion = criterion
         self.configuration = configuration
         self.weights = weights
+        self.backend = backend
 
         self.number_of_led = number_of_led
         self.separating_distance = separating_distance
         self.modification = modification
         if self.modification == "mirror" and self.number_of_led != 2:
             self.modification = ""
+        # Horizontal offset of each LED from the first one, LEDs are evenly spaced by default
+        if led_offsets is None:
+            led_offsets = [separating_distance * led for led in range(number_of_led)]
+        self.led_offsets = list(led_offsets)
+
+    def key(self) -> tuple:
+        """
+        Collect all parameters that affect fitness of an individual
+
+        :return: Tuple of parameters
+        """
+        return (self.road_start, self.road_end, self.road_depth, self.road_sections, self.reflective_factor,
+                self.reflections_timeout, self.cosine_error, self.quality_criterion, self.configuration,
+                tuple(self.weights), self.backend, self.number_of_led, self.separating_distance, self.modification,
+                tuple(self.led_offsets))
@@ -1,14 +1,24 @@
+import argparse
+import multiprocessing
+import os
 import random
+import time
+from typing import Callable, List
 
+import numpy as np
 from deap.base import Fitness
 
-from auxiliary import draw, log_stats_init, log_stats_append, check_parameters_environment, \
-    check_parameters_evolution, choose_unique
+import custom_geometry_numpy
+
+from auxiliary import check_parameters_environment, check_parameters_evolution, check_parameters_islands, \
+    check_parameters_render, choose_unique, save_checkpoint, load_checkpoint, Renderer, StatsLogger
 from custom_geometry import compute_intersections, compute_reflections_two_segments, \
     compute_reflection_multiple_segments, recalculate_intersections
 from custom_operators import mutate_angle, mutate_length, shift_one_segment, rotate_one_segment, \
     resize_one_segment, x_over_multiple_segments, x_over_two_segments, tilt_base
-from quality_assessment import efficiency, illuminance_uniformity, light_pollution, obtrusive_light_elimination
+from quality_assessment import efficiency, illuminance_uniformity, obtrusive_light_elimination, criteria, \
+    criteria_population, efficiency_population, illuminance_uniformity_population, \
+    intensity_from_device_population, obtrusive_light_elimination_population
 
 from deap import base
 from deap import creator
@@ -18,55 +28,369 @@ from python_json_config import ConfigBuilder
 
 from component import Component
 from environment import Environment
-from quality_precalculations import compute_segments_intensity, compute_proportional_intensity
-
-
-def evaluate(individual: Component, env: Environment):
+from fitness_cache import FitnessCache
+from islands import run_islands
+from quality_precalculations import compute_segments_intensity, compute_proportional_intensity, \
+    compute_segments_intensity_population
+
+# Classes are created on import so that individuals can be pickled and sent to worker processes
+creator.create("Fitness", base.Fitness, weights=(1.0,))
+base.Fitness.weights = (1.0, 10.0, 5.0, -1.0)
+creator.create("Individual", Component, fitness=creator.Fitness)
+
+
+def evaluate(individual: Component, env: Environment, cache: FitnessCache = None):
+    if cache is not None:
+        key = cache.key(individual, env)
+        result = cache.get(key)
+        if result is not None:
+            apply_evaluation_result(individual, result)
+            return copy_fitness(result[0])
+        fitness = evaluate(individual, env)
+        _, fitness_array, segments_intensity, segments_intensity_proportional, no_of_reflections, rays = \
+            evaluation_result(individual, fitness)
+        # Cached result must not share fitness array and rays with the individual, which may change them later
+        cache.put(key, (copy_fitness(fitness), list(fitness_array), segments_intensity,
+                        segments_intensity_proportional, no_of_reflections, rays.copy()))
+        return fitness
+    if env.backend == "numpy":
+        return evaluate_population([individual], env)[0]
+    fitness = evaluate_exact(individual, env)
+    individual.rays.record(individual.original_rays)
+    return fitness
+
+
+def evaluate_exact(individual: Component, env: Environment):
+    """
+    Evaluate individual with sympy backend
+
+    :param individual: Individual
+    :param env: Environment
+    :return: Fitness value
+    """
     if env.configuration == "two connected":
         compute_reflections_two_segments(individual, env.reflective_factor)
     if env.configuration == "multiple free":
         compute_reflection_multiple_segments(individual, env.reflective_factor, env.reflections_timeout)
     if env.quality_criterion == "efficiency":
-        return efficiency(individual.original_rays)
+        return efficiency(individual.original_rays, individual.ray_fan.total_intensity)
     road_intersections = compute_intersections(individual.original_rays, env.road)
     if env.number_of_led > 1:
-        road_intersections = recalculate_intersections(road_intersections, env.number_of_led, env.separating_distance,
+        road_intersections = recalculate_intersections(road_intersections, env.led_offsets, env.separating_distance,
                                                        env.modification, env.road_start, env.road_end)
     if env.quality_criterion == "obtrusive light":
         return obtrusive_light_elimination(individual.original_rays, road_intersections, env.number_of_led)
+    if env.quality_criterion in ("weighted sum", "nsgaii"):
+        values, individual.segments_intensity = criteria(individual.original_rays, road_intersections,
+                                                         individual.ray_fan.total_intensity, env.number_of_led,
+                                                         env.road_sections, env.road_start, env.road_length,
+                                                         env.cosine_error)
+        individual.segments_intensity_proportional = compute_proportional_intensity(individual.segments_intensity)
+        efficiency_value, uniformity, obtrusive_light, upwards_rays = values
+        if env.quality_criterion == "nsgaii":
+            return Fitness((efficiency_value, uniformity, obtrusive_light, env.number_of_led * upwards_rays))
+        individual.fitness_array = [efficiency_value, uniformity, obtrusive_light, -env.number_of_led*upwards_rays]
+        weights = env.weights
+        product = [x * y for x, y in zip(individual.fitness_array, weights)]
+        return sum(product)
     individual.segments_intensity = compute_segments_intensity(road_intersections, env.road_sections, env.road_start,
                                                     env.road_length, env.cosine_error)
     individual.segments_intensity_proportional = compute_proportional_intensity(individual.segments_intensity)
     if env.quality_criterion == "illuminance uniformity":
         return illuminance_uniformity(individual.segments_intensity)
-    if env.quality_criterion == "weighted sum":
-        individual.fitness_array = [efficiency(individual.original_rays),
-                                    illuminance_uniformity(individual.segments_intensity),
-                                    obtrusive_light_elimination(individual.original_rays, road_intersections,
-                                                                env.number_of_led),
-                                    -env.number_of_led*light_pollution(individual.original_rays)]
-        weights = env.weights
-        product = [x * y for x, y in zip(individual.fitness_array, weights)]
-        return sum(product)
-    if env.quality_criterion == "nsgaii":
-        return Fitness((efficiency(individual.original_rays), illuminance_uniformity(individual.segments_intensity),
-                        obtrusive_light_elimination(individual.original_rays, road_intersections, env.number_of_led),
-                        env.number_of_led * light_pollution(individual.original_rays)))
     return efficiency(individual)
 
 
+def evaluate_population(individuals: List[Component], env: Environment) -> list:
+    """
+    Evaluate all individuals at once. With numpy backend rays of the whole population are traced in one batched
+    pass and all criteria are computed for all individuals together. Returned fitness values and attributes set on
+    individuals are the same as if evaluate was called for each individual.
+
+    :param individuals: List of individuals
+    :param env: Environment
+    :return: List of fitness values
+    """
+    if env.backend != "numpy" or not individuals:
+        return [evaluate(individual, env) for individual in individuals]
+    origins, directions, intensities, _, terminated, ray_mask = \
+        custom_geometry_numpy.compute_reflections_population(individuals, env.configuration, env.reflective_factor,
+                                                             env.reflections_timeout)
+    total_intensities = np.array([ind.ray_fan.total_intensity for ind in individuals])
+    if env.quality_criterion == "efficiency":
+        efficiencies = efficiency_population(intensity_from_device_population(intensities, terminated),
+                                             total_intensities)
+        return [float(fitness) for fitness in efficiencies]
+
+    x, reduction = custom_geometry_numpy.road_hits(origins, directions, env.road_array)
+    x[terminated | ~ray_mask] = np.nan
+    for index, ind in enumerate(individuals):
+        ind.rays.road_intersections = x[index, :len(ind.rays)]
+    if env.cosine_error == "no":
+        section_intensities = intensities
+    else:
+        section_intensities = intensities * reduction
+    road_intensities = intensities
+    if env.number_of_led > 1:
+        x = custom_geometry_numpy.recalculate_intersections_population(x, env.led_offsets, env.separating_distance,
+                                                                       env.modification, env.road_start,
+                                                                       env.road_end)
+        road_intensities = np.broadcast_to(intensities[:, :, None], x.shape).reshape(len(individuals), -1)
+        section_intensities = np.broadcast_to(section_intensities[:, :, None], x.shape).reshape(len(individuals), -1)
+        x = x.reshape(len(individuals), -1)
+    intensity_on_road = np.where(np.isnan(x), 0, road_intensities).sum(axis=1)
+    if env.quality_criterion == "obtrusive light":
+        obtrusive_light = obtrusive_light_elimination_population(
+            intensity_from_device_population(intensities, terminated), intensity_on_road, env.number_of_led)
+        return [float(fitness) for fitness in obtrusive_light]
+
+    segments_intensity = compute_segments_intensity_population(x, section_intensities, env.road_sections,
+                                                               env.road_start, env.road_length)
+    for index, ind in enumerate(individuals):
+        ind.segments_intensity = segments_intensity[index].tolist()
+        ind.segments_intensity_proportional = compute_proportional_intensity(ind.segments_intensity)
+    if env.quality_criterion == "illuminance uniformity":
+        return [float(fitness) for fitness in illuminance_uniformity_population(segments_intensity)]
+    values = criteria_population(intensities, terminated, total_intensities, intensity_on_road, segments_intensity,
+                                 directions, ray_mask, env.number_of_led)
+    if env.quality_criterion == "nsgaii":
+        return [Fitness((float(efficiency_value), float(uniformity), float(obtrusive_light),
+                         env.number_of_led * int(upwards_rays)))
+                for efficiency_value, uniformity, obtrusive_light, upwards_rays in values]
+    fitnesses = []
+    for ind, (efficiency_value, uniformity, obtrusive_light, upwards_rays) in zip(individuals, values):
+        ind.fitness_array = [float(efficiency_value), float(uniformity), float(obtrusive_light),
+                             -env.number_of_led * int(upwards_rays)]
+        fitnesses.append(sum([x * y for x, y in zip(ind.fitness_array, env.weights)]))
+    return fitnesses
+
+
+def evaluation_result(individual: Component, fitness) -> tuple:
+    """
+    Collect fitness and everything evaluation computed for an individual, so it can be sent between processes
+
+    :param individual: Evaluated individual
+    :param fitness: Fitness of the individual
+    :return: Tuple (fitness, fitness array, segments intensity, proportional segments intensity, number of
+     reflections, ray bundle)
+    """
+    return fitness, individual.fitness_array, individual.segments_intensity, \
+        individual.segments_intensity_proportional, individual.no_of_reflections, individual.rays
+
+
+def copy_fitness(fitness):
+    """
+    Copy fitness so that cached fitness objects are never shared between individuals
+
+    :param fitness: Fitness value or Fitness object
+    :return: Copy of the fitness
+    """
+    if isinstance(fitness, Fitness):
+        return Fitness(fitness.values)
+    return fitness
+
+
+def apply_evaluation_result(individual: Component, result: tuple):
+    """
+    Set everything evaluation computed on the individual
+
+    :param individual: Individual
+    :param result: Tuple created by evaluation_result
+    """
+    _, individual.fitness_array, individual.segments_intensity, individual.segments_intensity_proportional, \
+        individual.no_of_reflections, rays = result
+    individual.fitness_array = list(individual.fitness_array)
+    individual.rays = rays.copy()
+
+
+def evaluate_chunk(individuals: List[Component], env: Environment) -> List[tuple]:
+    """
+    Evaluate part of the population, possibly in worker process
+
+    :param individuals: List of individuals
+    :param env: Environment
+    :return: List of evaluation results
+    """
+    fitnesses = evaluate_population(individuals, env)
+    return [evaluation_result(ind, fit) for ind, fit in zip(individuals, fitnesses)]
+
+
+def evaluate_in_parallel(toolbox: base.Toolbox, individuals: List[Component], env: Environment, workers: int,
+                         cache: FitnessCache) -> list:
+    """
+    Evaluate individuals whose genotype is not cached. Split them into one chunk per worker, evaluate the chunks
+    with toolbox map and copy results back to the individuals. Results do not depend on the number of workers.
+
+    :param toolbox: Toolbox with registered evaluate and map
+    :param individuals: List of individuals
+    :param env: Environment
+    :param workers: Number of worker processes
+    :param cache: Fitness cache
+    :return: List of fitness values
+    """
+    keys = [cache.key(ind, env) for ind in individuals]
+    fitnesses = [None] * len(individuals)
+    missing = []
+    for index, (ind, key) in enumerate(zip(individuals, keys)):
+        result = cache.get(key)
+        if result is None:
+            missing.append(index)
+        else:
+            apply_evaluation_result(ind, result)
+            fitnesses[index] = copy_fitness(result[0])
+
+    chunk_size = max(1, -(-len(missing) // workers))
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    all_results = toolbox.map(toolbox.evaluate, [[individuals[index] for index in chunk] for chunk in chunks])
+    for chunk, results in zip(chunks, all_results):
+        for index, result in zip(chunk, results):
+            apply_evaluation_result(individuals[index], result)
+            fitnesses[index] = result[0]
+            cache.put(keys[index], (copy_fitness(result[0]),) + result[1:])
+    return fitnesses
+
+
+def select_parents(toolbox: base.Toolbox, pop: List[Component], count: int, criterion: str) -> List[Component]:
+    """
+    Select parents of given number of offspring and clone them
+
+    :param toolbox: Toolbox with registered select and clone
+    :param pop: Population
+    :param count: Number of offspring
+    :param criterion: Quality criterion
+    :return: List of cloned parents
+    """
+    if criterion != "nsgaii":
+        return [toolbox.clone(ind) for ind in toolbox.select(pop, count)]
+    # Tournament takes individuals in groups of four, one round selects at most the largest multiple of four
+    # not exceeding population size
+    size = len(pop) - len(pop) % 4
+    if size == 0:
+        # Population is too small for tournament
+        return [toolbox.clone(ind) for ind in tools.selRandom(pop, count)]
+    parents = []
+    while len(parents) < count:
+        parents.extend(tools.selTournamentDCD(pop, min(count - len(parents), size)))
+    # Tournament selects individuals in groups of four, so there may be more of them than needed
+    return [toolbox.clone(ind) for ind in parents[:count]]
+
+
+def replace_population(toolbox: base.Toolbox, pop: List[Component], offspring: List[Component], algorithm: str,
+                       mu: int, criterion: str) -> List[Component]:
+    """
+    Create next population from current population and evaluated offspring
+
+    generational - offspring replace the whole population (NSGA-II selects from both)
+    steady state - offspring replace the worst individuals of the population
+    mu+lambda - best mu individuals of population and offspring survive
+    mu,lambda - best mu offspring survive
+
+    :param toolbox: Toolbox with registered select
+    :param pop: Current population
+    :param offspring: Evaluated offspring
+    :param algorithm: Evolution algorithm
+    :param mu: Size of population after replacement (not used by generational algorithm)
+    :param criterion: Quality criterion
+    :return: Next population
+    """
+    if criterion == "nsgaii":
+        best = toolbox.select
+    else:
+        best = tools.selBest
+    if algorithm == "generational":
+        if criterion == "nsgaii":
+            return toolbox.select(offspring + pop, len(pop))
+        return offspring
+    if algorithm == "steady state":
+        survivors = best(pop, mu - len(offspring)) + offspring
+        if criterion == "nsgaii":
+            # Crowding distance of the new individuals is assigned for the next tournament
+            survivors = toolbox.select(survivors, len(survivors))
+        return survivors
+    if algorithm == "mu+lambda":
+        return best(pop + offspring, mu)
+    return best(offspring, mu)
+
+
+CRITERIA_COLUMNS = ["efficiency", "illuminance uniformity", "obtrusive light", "light pollution"]
+
+
+def geometry_columns(configuration: str) -> List[str]:
+    """
+    Names of stats columns describing geometry of an individual
+
+    :param configuration: Configuration - two connected or multiple free
+    :return: List of column names
+    """
+    if configuration == "two connected":
+        return ["left segment angle", "left segment length", "right segment angle", "right segment length"]
+    return ["base slope", "reflective segments"]
+
+
+def geometry_stats(ind: Component, configuration: str) -> list:
+    """
+    Geometry of an individual for stats, reflective segments are lists [x1, y1, x2, y2]
+
+    :param ind: Individual
+    :param configuration: Configuration - two connected or multiple free
+    :return: Values of geometry columns
+    """
+    if configuration == "two connected":
+        return [180 - ind.left_angle + ind.base_slope, float(ind.left_length_coef * ind.base_length),
+                ind.right_angle - ind.base_slope, float(ind.right_length_coef * ind.base_length)]
+    return [ind.base_slope, [[float(segment.p1.x), float(segment.p1.y), float(segment.p2.x), float(segment.p2.y)]
+                             for segment in ind.reflective_segments]]
+
+
+def log_pareto_front(hof: List[Component], env: Environment, name: str = "", stats_format: str = "csv",
+                     renderer: Renderer = None):
+    """
+    Draw and log unique individuals of Pareto front
+
+    :param hof: Pareto front
+    :param env: Environment
+    :param name: Prefix of stats and images
+    :param stats_format: csv or jsonl
+    :param renderer: Renderer drawing the images, SVG images are drawn if it is not given
+    """
+    if renderer is None:
+        renderer = Renderer(env)
+    unique = choose_unique(hof, env.configuration)
+    columns = ["index"] + CRITERIA_COLUMNS + geometry_columns(env.configuration)
+    with StatsLogger(f"{name}stats", columns, stats_format) as stats:
+        for index in range(len(unique)):
+            renderer.draw(unique[index], f"{name}unique{index}")
+            stats.write([index] + list(unique[index].fitness.values) +
+                        geometry_stats(unique[index], env.configuration))
+
+
 def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
               angle_lower_bound: int, angle_upper_bound: int, length_lower_bound: int, length_upper_bound: int,
               no_of_reflective_segments: int, distance_limit: int, length_limit: int,
               population_size: int, number_of_generations: int,
               xover_prob: float, mut_angle_prob: float, mut_length_prob: float,
               shift_segment_prob: float, rotate_segment_prob: float, resize_segment_prob: float, tilt_base_prob: float,
-              base_length: int, base_slope: int, base_angle_limit_min: int, base_angle_limit_max: int):
+              base_length: int, base_slope: int, base_angle_limit_min: int, base_angle_limit_max: int,
+              workers: int = 1, cache_size: int = 0, algorithm: str = "generational", mu: int = None,
+              lambda_: int = None, migration: Callable = None, name: str = "", checkpoint_interval: int = 0,
+              checkpoint_file: str = "checkpoints/checkpoint.gz", resume: bool = False, stats_format: str = "csv",
+              stats_flush_interval: float = 10, render_policy: str = "interval", render_interval: int = 1,
+              render_background: bool = False, render_compress: bool = False, render_format: str = "svg",
+              render_width: int = 1200):
+    """
+    Run evolution of reflective surfaces of the lamp. Stats, images and checkpoint of the run are prefixed by name,
+    stats are written in given format and flushed at most every stats_flush_interval seconds. Best individuals are
+    drawn according to render policy (see auxiliary.Renderer).
+    Migration (see islands.Migration) is called after every generation and may replace part of the population.
+    Every checkpoint_interval generations state of the run is saved to checkpoint file, run with resume continues
+    from the saved state exactly as the run would continue without interruption.
+
+    :return: Hall of fame (Pareto front for nsgaii)
+    """
+
+    checkpoint_file = os.path.join(os.path.dirname(checkpoint_file), name + os.path.basename(checkpoint_file))
 
     # Initiating evolutionary algorithm
-    creator.create("Fitness", base.Fitness, weights=(1.0,))
-    base.Fitness.weights = (1.0, 10.0, 5.0, -1.0)
-    creator.create("Individual", Component, fitness=creator.Fitness)
     toolbox = base.Toolbox()
     toolbox.register("individual", creator.Individual, env=env, number_of_rays=number_of_rays,
                      ray_distribution=ray_distribution, angle_lower_bound=angle_lower_bound,
@@ -75,54 +399,81 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
                      distance_limit=distance_limit, length_limit=length_limit, base_length=base_length,
                      base_slope=base_slope)
     toolbox.register("population", tools.initRepeat, list, toolbox.individual)
-    toolbox.register("evaluate", evaluate)
+    toolbox.register("evaluate", evaluate_chunk, env=env)
+    toolbox.register("clone", Component.clone)
+    cache = FitnessCache(cache_size)
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        toolbox.register("map", pool.map)
     if env.quality_criterion == "nsgaii":
         toolbox.register("select", tools.selNSGA2)
     else:
         toolbox.register("select", tools.selTournament, tournsize=2)
 
-    # Initiating first population
-    pop = toolbox.population(n=population_size)
+    # Size of population after replacement and number of offspring in each generation
+    if mu is None:
+        mu = population_size
+    if lambda_ is None:
+        lambda_ = min(2, mu) if algorithm == "steady state" else mu
+    if algorithm == "generational":
+        lambda_ = population_size
+
+    checkpoint = None
+    if resume:
+        checkpoint = load_checkpoint(checkpoint_file)
+        if checkpoint is None:
+            print("No checkpoint found, starting new run")
+    if checkpoint is not None:
+        # Continue from the end of checkpointed generation with the same random state
+        start_generation = checkpoint["generation"]
+        pop = checkpoint["population"]
+        hof = checkpoint["hall_of_fame"]
+        cache.hits, cache.misses = checkpoint["cache hits"], checkpoint["cache misses"]
+        evaluation_time = checkpoint["evaluation time"]
+        if migration is not None:
+            migration.seed = checkpoint["migration seed"]
+        random.setstate(checkpoint["random state"])
+    else:
+        start_generation = 0
+        # Initiating first population
+        pop = toolbox.population(n=population_size)
+
+        # Evaluating fitness
+        evaluation_time = time.perf_counter()
+        fitnesses = evaluate_in_parallel(toolbox, pop, env, workers, cache)
+        evaluation_time = time.perf_counter() - evaluation_time
+        for ind, fit in zip(pop, fitnesses):
+            ind.fitness = fit
 
-    # Evaluating fitness
-    fitnesses = []
-    for item in pop:
-        fitnesses.append(evaluate(item, env))
-    for ind, fit in zip(pop, fitnesses):
-        ind.fitness = fit
+        # Initiating elitism
 
-    if env.quality_criterion != "nsgaii":
-        if env.configuration == "two connected":
-            stats_line = f"generation, best fitness, average fitness, fitness array, left segment angle, " \
-                     f"left segment length, right segment angle, right segment length  \n"
+        if env.quality_criterion == "nsgaii":
+            pop = toolbox.select(pop, len(pop))
+            hof = tools.ParetoFront()
+            hof.update(pop)
         else:
-            stats_line = f"generation, best fitness, average fitness, fitness array, reflective segments  \n"
-        log_stats_init(f"stats", stats_line)
+            hof = HallOfFame(1)
+            hof.update(pop)
 
-    # Initiating elitism
+    stats = None
+    if env.quality_criterion != "nsgaii":
+        columns = ["generation", "best fitness", "average fitness", "cache hits", "cache misses",
+                   "evaluations per second"] + CRITERIA_COLUMNS + geometry_columns(env.configuration)
+        stats = StatsLogger(f"{name}stats", columns, stats_format, stats_flush_interval, append=checkpoint is not None)
 
-    if env.quality_criterion == "nsgaii":
-        pop = toolbox.select(pop, len(pop))
-        hof = tools.ParetoFront()
-        hof.update(pop)
-    else:
-        hof = HallOfFame(1)
-        hof.update(pop)
+    renderer = Renderer(env, render_policy, render_interval, render_background, render_compress, render_format,
+                        render_width)
 
     print("Start of evolution")
 
     # Begin the evolution
-    for g in range(number_of_generations):
+    for g in range(start_generation, number_of_generations):
         # A new generation
         print(f"-- Generation {g} --")
 
-        # Select the next generation individuals
-        if env.quality_criterion == "nsgaii":
-            offspring = tools.selTournamentDCD(pop, len(pop))
-            offspring = [toolbox.clone(ind) for ind in offspring]
-        else:
-            offspring = toolbox.select(pop, len(pop))
-            offspring = list(map(toolbox.clone, offspring))
+        # Select parents of the offspring
+        offspring = select_parents(toolbox, pop, lambda_, env.quality_criterion)
 
         # Apply crossover and mutation on the offspring
 
@@ -158,7 +509,7 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
                 if random.random() < tilt_base_prob:
                     mutant.base_slope = tilt_base(mutant.base_slope, base_angle_limit_min, base_angle_limit_max)
                     mutant.calculate_base()
-                    mutant.original_rays = mutant.sample_rays(number_of_rays, ray_distribution)
+                    mutant.sample_rays(number_of_rays, ray_distribution)
                     mutant.fitness = None
 
             if env.configuration == "two connected":
@@ -171,65 +522,56 @@ def evolution(env: Environment, number_of_rays: int, ray_distribution: str,
 
         # Evaluate the individuals with an invalid fitness
         invalid_ind = [ind for ind in offspring if ind.fitness is None]
-        fitnesses = []
-        for item in invalid_ind:
-            fitnesses.append(evaluate(item, env))
+        start = time.perf_counter()
+        fitnesses = evaluate_in_parallel(toolbox, invalid_ind, env, workers, cache)
+        evaluation_time += time.perf_counter() - start
         for ind, fit in zip(invalid_ind, fitnesses):
             ind.fitness = fit
 
-        if env.quality_criterion == "nsgaii":
-            pop = toolbox.select(offspring + pop, population_size)
-        else:
-            pop[:] = offspring
+        pop = replace_population(toolbox, pop, offspring, algorithm, mu, env.quality_criterion)
+        if migration is not None:
+            pop = migration(g, pop, toolbox, env.quality_criterion)
 
         hof.update(pop)
         best_ind = hof[0]
 
-        fitnesses = []
-        for item in pop:
-            fitnesses.append(item.fitness)
-        print(fitnesses)
-
-        if env.configuration == "two connected" and env.quality_criterion != "nsgaii":
-            stats_line = f"{g+1}, {best_ind.fitness}, {sum(fitnesses) / population_size}, {best_ind.fitness_array}, " \
-                     f"left angle: {180-best_ind.left_angle+best_ind.base_slope}, " \
-                     f"left length: {best_ind.left_length_coef*best_ind.base_length}, " \
-                     f"right angle: {best_ind.right_angle-best_ind.base_slope}, " \
-                     f"right length: {best_ind.right_length_coef*best_ind.base_length} "
-            log_stats_append(f"stats", stats_line)
-
-        if env.configuration == "multiple free" and env.quality_criterion != "nsgaii":
-            stats_line = f"{g + 1}, {best_ind.fitness}, {sum(fitnesses) / population_size}, {best_ind.fitness_array}, "
-            for reflective_segment in best_ind.reflective_segments:
-                dimensions = f" start: {reflective_segment.p1}, end: {reflective_segment.p2}"
-                stats_line = stats_line + dimensions
-            log_stats_append(f"stats", stats_line)
+        # Every cache miss is one evaluation of an individual
+        throughput = cache.misses / evaluation_time if evaluation_time > 0 else 0
+        print(f"Evaluations: {cache.misses}, evaluations per second: {throughput:.2f}")
+
+        if stats is not None:
+            # Fitness array is empty for single criterion
+            fitness_array = (list(best_ind.fitness_array) + [None] * len(CRITERIA_COLUMNS))[:len(CRITERIA_COLUMNS)]
+            stats.write([g + 1, best_ind.fitness, sum(ind.fitness for ind in pop) / len(pop), cache.hits,
+                         cache.misses, throughput] + fitness_array + geometry_stats(best_ind, env.configuration))
         print(f"Best individual has fitness: {best_ind.fitness}")
-        draw(best_ind, f"best{g}", env)
+        renderer.update(g, best_ind, f"{name}best{g}")
 
+        if checkpoint_interval > 0 and (g + 1) % checkpoint_interval == 0:
+            save_checkpoint(checkpoint_file, {
+                "generation": g + 1, "population": pop, "hall_of_fame": hof, "cache hits": cache.hits,
+                "cache misses": cache.misses, "evaluation time": evaluation_time,
+                "migration seed": None if migration is None else migration.seed, "random state": random.getstate()})
+
+    if stats is not None:
+        stats.close()
     if env.quality_criterion == "nsgaii":
-        unique = choose_unique(hof, env.configuration)
-        stats_line = f"index, fitness array"
-        log_stats_init(f"stats", stats_line)
-        for index in range(len(unique)):
-            draw(unique[index], f"unique{index}", env)
-            if env.configuration == "two connected":
-                stats_line = f"{index}, {unique[index].fitness}," \
-                         f"left angle: {180-unique[index].left_angle+unique[index].base_slope}, " \
-                         f"left length: {unique[index].left_length_coef*unique[index].base_length}, " \
-                         f"right angle: {unique[index].right_angle-unique[index].base_slope}, " \
-                         f"right length: {unique[index].right_length_coef*unique[index].base_length} "
-            else:
-                stats_line = f"{index}, {unique[index].fitness}, {unique[index].base_slope}"
-                for reflective_segment in unique[index].reflective_segments:
-                    dimensions = f" start: {reflective_segment.p1}, end: {reflective_segment.p2}"
-                    stats_line = stats_line + dimensions
-            log_stats_append(f"stats", stats_line)
+        log_pareto_front(hof, env, name, stats_format, renderer)
+    renderer.finish(hof[0], f"{name}best{number_of_generations - 1}")
+    if pool is not None:
+        pool.close()
+        pool.join()
     print("-- End of (successful) evolution --")
     print("--")
+    return hof
+
 
+def main(argv: List[str] = None):
+    # parse command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", action="store_true", help="continue evolution from the last checkpoint")
+    args = parser.parse_args(argv)
 
-def main():
     # create config parser
     builder = ConfigBuilder()
     # parse configuration from file parameters.json
@@ -250,15 +592,17 @@ def main():
     reflective_factor = config.evaluation.reflective_factor
     reflections_timeout = config.evaluation.reflections_timeout
     weights = config.evaluation.weights
+    backend = config.evaluation.backend
 
     number_of_leds = config.lamp.number_of_LEDs
     separating_distance = config.lamp.separating_distance
     modification = config.lamp.modification
+    led_offsets = config.lamp.led_offsets
 
     invalid_parameters = check_parameters_environment(road_start, road_end, road_depth,
                                                       road_sections, criterion, cosine_error, reflective_factor,
                                                       configuration, number_of_leds, separating_distance, modification,
-                                                      weights, reflections_timeout)
+                                                      weights, reflections_timeout, backend, led_offsets)
     if invalid_parameters:
         print(f"Invalid value for parameters {invalid_parameters}")
         return
@@ -267,7 +611,8 @@ def main():
     # Init environment
     env = Environment(road_start, road_end, road_depth, road_sections,
                       criterion, cosine_error, reflective_factor, configuration,
-                      number_of_leds, separating_distance, modification, weights, reflections_timeout)
+                      number_of_leds, separating_distance, modification, weights, reflections_timeout, backend,
+                      led_offsets)
 
     # Load parameters for LED
     number_of_rays = config.lamp.number_of_rays
@@ -289,6 +634,22 @@ def main():
 
     population_size = config.evolution.population_size
     number_of_generations = config.evolution.number_of_generations
+    workers = config.evolution.workers
+    cache_size = config.evolution.cache_size
+    seed = config.evolution.seed
+    algorithm = config.evolution.algorithm
+    checkpoint_interval = config.evolution.checkpoint_interval
+    checkpoint_file = config.evolution.checkpoint_file
+    stats_format = config.stats.format
+    stats_flush_interval = config.stats.flush_interval
+    render_policy = config.render.policy
+    render_interval = config.render.interval
+    render_background = config.render.background
+    render_compress = config.render.compress
+    render_format = config.render.format
+    render_width = config.render.width
+    mu = config.evolution.mu
+    lambda_ = getattr(config.evolution, "lambda")
 
     # Load parameters for evolution
     operators = config.evolution.operators
@@ -306,20 +667,70 @@ def main():
                                                     population_size, number_of_generations, xover_prob, angle_mut_prob,
                                                     length_mut_prob, shift_segment_prob, rotate_segment_prob,
                                                     resize_segment_prob, tilt_base_prob, base_length, base_slope,
-                                                    base_angle_limit_min, base_angle_limit_max)
+                                                    base_angle_limit_min, base_angle_limit_max, workers, seed,
+                                                    cache_size, algorithm, mu, lambda_, checkpoint_interval,
+                                                    checkpoint_file, stats_format, stats_flush_interval)
     if invalid_parameters:
         print(f"Invalid value for parameters {invalid_parameters}")
         return
     else:
         print(f" Evolution parameters: ok")
 
-    # Run evolution algorithm
-    evolution(env, number_of_rays, ray_distribution, angle_lower_bound, angle_upper_bound,
-              length_lower_bound, length_upper_bound, no_of_reflective_segments, distance_limit, length_limit,
-              population_size, number_of_generations, xover_prob, angle_mut_prob, length_mut_prob,
-              shift_segment_prob, rotate_segment_prob, resize_segment_prob, tilt_base_prob, base_length, base_slope,
-              base_angle_limit_min, base_angle_limit_max)
+    if seed is not None:
+        random.seed(seed)
 
+    invalid_parameters = check_parameters_render(render_policy, render_interval, render_background, render_compress,
+                                                 render_format, render_width)
+    if invalid_parameters:
+        print(f"Invalid value for parameters {invalid_parameters}")
+        return
+    else:
+        print(f" Render parameters: ok")
+
+    # Load parameters for island model
+    number_of_islands = config.islands.number_of_islands
+    topology = config.islands.topology
+    migration_interval = config.islands.migration_interval
+    migrants = config.islands.migrants
+    island_seeds = config.islands.seeds
+
+    invalid_parameters = check_parameters_islands(number_of_islands, topology, migration_interval, migrants,
+                                                  island_seeds, population_size if mu is None else mu)
+    if invalid_parameters:
+        print(f"Invalid value for parameters {invalid_parameters}")
+        return
+    else:
+        print(f" Island parameters: ok")
+
+    kwargs = dict(env=env, number_of_rays=number_of_rays, ray_distribution=ray_distribution,
+                  angle_lower_bound=angle_lower_bound, angle_upper_bound=angle_upper_bound,
+                  length_lower_bound=length_lower_bound, length_upper_bound=length_upper_bound,
+                  no_of_reflective_segments=no_of_reflective_segments, distance_limit=distance_limit,
+                  length_limit=length_limit, population_size=population_size,
+                  number_of_generations=number_of_generations, xover_prob=xover_prob, mut_angle_prob=angle_mut_prob,
+                  mut_length_prob=length_mut_prob, shift_segment_prob=shift_segment_prob,
+                  rotate_segment_prob=rotate_segment_prob, resize_segment_prob=resize_segment_prob,
+                  tilt_base_prob=tilt_base_prob, base_length=base_length, base_slope=base_slope,
+                  base_angle_limit_min=base_angle_limit_min, base_angle_limit_max=base_angle_limit_max,
+                  workers=workers, cache_size=cache_size, algorithm=algorithm, mu=mu, lambda_=lambda_,
+                  checkpoint_interval=checkpoint_interval, checkpoint_file=checkpoint_file, resume=args.resume,
+                  stats_format=stats_format, stats_flush_interval=stats_flush_interval, render_policy=render_policy,
+                  render_interval=render_interval, render_background=render_background,
+                  render_compress=render_compress, render_format=render_format, render_width=render_width)
+
+    # Run evolution algorithm
+    if number_of_islands == 1:
+        evolution(**kwargs)
+        return
+    hof = run_islands(evolution, kwargs, criterion, number_of_islands, topology, migration_interval, migrants,
+                      island_seeds)
+    renderer = Renderer(env, compress=render_compress, image_format=render_format, image_width=render_width)
+    if criterion == "nsgaii":
+        log_pareto_front(hof, env, stats_format=stats_format, renderer=renderer)
+    else:
+        print(f"Best individual of all islands has fitness: {hof[0].fitness}")
+        renderer.draw(hof[0], "best")
+    renderer.wait()
 
 if __name__ == "__main__":
     main()
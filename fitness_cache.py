@@ -0,0 +1,59 @@
+from collections import OrderedDict
+from typing import Optional
+
+from component import Component
+from environment import Environment
+
+
+class FitnessCache:
+
+    def __init__(self, capacity: int):
+        """
+        Bounded cache of evaluation results, least recently used results are dropped first.
+
+        :param capacity: Maximal number of stored results, 0 disables the cache
+        """
+        self.capacity = capacity
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(individual: Component, env: Environment) -> tuple:
+        """
+        Compute cache key of an individual. Individuals with equal key have equal fitness in given environment.
+
+        :param individual: Individual
+        :param env: Environment
+        :return: Hashable key
+        """
+        return env.key(), individual.genotype(env.configuration)
+
+    def get(self, key: tuple) -> Optional[tuple]:
+        """
+        Find evaluation result for given key and count hit or miss
+
+        :param key: Cache key
+        :return: Evaluation result or None
+        """
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.results.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: tuple, result: tuple):
+        """
+        Store evaluation result for given key
+
+        :param key: Cache key
+        :param result: Evaluation result
+        """
+        if self.capacity <= 0:
+            return
+        self.results[key] = result
+        self.results.move_to_end(key)
+        if len(self.results) > self.capacity:
+            self.results.popitem(last=False)
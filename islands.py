@@ -0,0 +1,140 @@
+import multiprocessing
+import queue
+import random
+from typing import Callable, List
+
+from deap import base
+from deap import tools
+from deap.tools import HallOfFame
+
+from component import Component
+
+
+class Migration:
+
+    def __init__(self, index: int, inboxes: list, topology: str, interval: int, migrants: int, seed: int):
+        """
+        Exchange of best individuals between islands. Every interval generations each island sends copies of its
+        best individuals to another island and its worst individuals are replaced by the individuals it receives.
+        Islands either form a ring or they are connected by random cycle drawn from the seed shared by all islands,
+        so every island receives exactly one group of migrants in each migration.
+
+        :param index: Index of the island
+        :param inboxes: Queue of incoming migrants of each island
+        :param topology: ring or random
+        :param interval: Number of generations between migrations
+        :param migrants: Number of individuals sent in each migration
+        :param seed: Seed of random topology, the same for all islands
+        """
+        self.index = index
+        self.inboxes = inboxes
+        self.topology = topology
+        self.interval = interval
+        self.migrants = migrants
+        self.seed = seed
+
+    def target(self, generation: int) -> int:
+        """
+        Find island that receives migrants of this island in given generation
+
+        :param generation: Generation index
+        :return: Index of target island
+        """
+        number_of_islands = len(self.inboxes)
+        if self.topology == "ring":
+            return (self.index + 1) % number_of_islands
+        order = list(range(number_of_islands))
+        random.Random(self.seed + generation).shuffle(order)
+        return order[(order.index(self.index) + 1) % number_of_islands]
+
+    def __call__(self, generation: int, pop: List[Component], toolbox: base.Toolbox, criterion: str) \
+            -> List[Component]:
+        """
+        Exchange migrants with other islands if it is time for migration
+
+        :param generation: Generation index
+        :param pop: Population of the island
+        :param toolbox: Toolbox with registered select and clone
+        :param criterion: Quality criterion
+        :return: Population with migrants
+        """
+        if (generation + 1) % self.interval != 0 or len(self.inboxes) < 2:
+            return pop
+        if criterion == "nsgaii":
+            best = toolbox.select(pop, self.migrants)
+        else:
+            best = tools.selBest(pop, self.migrants)
+        self.inboxes[self.target(generation)].put([toolbox.clone(ind) for ind in best])
+        migrants = self.inboxes[self.index].get()
+        if criterion == "nsgaii":
+            return toolbox.select(pop + migrants, len(pop))
+        return tools.selBest(pop, len(pop) - len(migrants)) + migrants
+
+
+def run_island(evolve: Callable, index: int, seed: int, migration: Migration, results: multiprocessing.Queue,
+               kwargs: dict):
+    """
+    Run evolution of one island and send its hall of fame to the main process
+
+    :param evolve: Evolution function
+    :param index: Index of the island
+    :param seed: Seed of the island
+    :param migration: Migration of the island
+    :param results: Queue for hall of fame of each island
+    :param kwargs: Parameters of evolution
+    """
+    random.seed(seed)
+    hof = evolve(migration=migration, name=f"island{index}-", **kwargs)
+    results.put((index, list(hof)))
+
+
+def run_islands(evolve: Callable, kwargs: dict, criterion: str, number_of_islands: int, topology: str,
+                migration_interval: int, migrants: int, seeds: List[int] = None):
+    """
+    Run island model - each island evolves its own population in separate process and islands exchange their best
+    individuals. Stats and images of each island are prefixed by island index.
+
+    :param evolve: Evolution function
+    :param kwargs: Parameters of evolution
+    :param criterion: Quality criterion
+    :param number_of_islands: Number of islands
+    :param topology: ring or random
+    :param migration_interval: Number of generations between migrations
+    :param migrants: Number of individuals sent in each migration
+    :param seeds: Seed of each island, seeds are drawn from random if they are not given
+    :return: Hall of fame (Pareto front for nsgaii) merged from all islands
+    """
+    if seeds is None:
+        seeds = [random.randrange(2 ** 32) for _ in range(number_of_islands)]
+    topology_seed = random.randrange(2 ** 32)
+    inboxes = [multiprocessing.Queue() for _ in range(number_of_islands)]
+    results = multiprocessing.Queue()
+    processes = []
+    for index in range(number_of_islands):
+        migration = Migration(index, inboxes, topology, migration_interval, migrants, topology_seed)
+        processes.append(multiprocessing.Process(target=run_island,
+                                                 args=(evolve, index, seeds[index], migration, results, kwargs)))
+    for process in processes:
+        process.start()
+
+    hofs = [None] * number_of_islands
+    received = 0
+    while received < number_of_islands:
+        try:
+            index, hof = results.get(timeout=1)
+        except queue.Empty:
+            # Other islands would wait for migrants of failed island forever
+            if any(process.exitcode not in (None, 0) for process in processes):
+                for process in processes:
+                    process.terminate()
+                raise RuntimeError("Evolution of an island failed")
+            continue
+        hofs[index] = hof
+        received += 1
+    for process in processes:
+        process.join()
+
+    merged = tools.ParetoFront() if criterion == "nsgaii" else HallOfFame(1)
+    for hof in hofs:
+        merged.update(hof)
+    return merged
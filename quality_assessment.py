@@ -1,19 +1,23 @@
 from typing import List, Tuple
 
+import numpy as np
 from sympy import Rational, Segment
 
 from custom_ray import MyRay
-from quality_precalculations import intensity_of_intersections, sum_intensity, rays_upwards, sum_original_intensity
+from quality_precalculations import intensity_of_intersections, sum_intensity, rays_upwards, sum_original_intensity, \
+    compute_segments_intensity_population
 
 
-def efficiency(all_rays: List[MyRay]) -> float:
+def efficiency(all_rays: List[MyRay], total_intensity: float = None) -> float:
     """
     Compute efficiency of component from the amount of rays intersecting the road and their intensity.
 
     :param all_rays: List of all rays from LED
+    :param total_intensity: Total intensity of all rays from LED, computed from rays if it is not given
     :return: fraction of intensity of rays on the road to the total intensity of all ray from LED
     """
-    total_intensity = sum_original_intensity(all_rays)
+    if total_intensity is None:
+        total_intensity = sum_original_intensity(all_rays)
     intensity_from_device = sum_intensity(all_rays)
     return intensity_from_device/total_intensity
 
@@ -42,9 +46,10 @@ def obtrusive_light_elimination(all_rays: List[MyRay], road_intersections: List[
     :param number_of_led: Number of LEDs in the device
     :return: The fraction of the light that falls on the road
     """
-    if sum_intensity(all_rays) == 0:
+    intensity_from_device = sum_intensity(all_rays)
+    if intensity_from_device == 0:
         return 1
-    intensity_on_road = intensity_of_intersections(road_intersections) / (sum_intensity(all_rays) * number_of_led)
+    intensity_on_road = intensity_of_intersections(road_intersections) / (intensity_from_device * number_of_led)
     return intensity_on_road
 
 
@@ -56,3 +61,128 @@ def light_pollution(individual_rays: List[List[Segment]]) -> int:
     :return: The amount of rays that are misdirected
     """
     return rays_upwards([ray.ray_array for ray in individual_rays])
+
+
+def criteria(all_rays: List[MyRay], road_intersections: List[Tuple[Rational, float, float]], total_intensity: float,
+             number_of_led: int, road_sections: int, road_start: int, road_length: int,
+             cosine_error: str) -> Tuple[List[float], List[float]]:
+    """
+    Compute all four criteria and intensity of road sections in one pass over rays and one pass over road
+    intersections. Values are the same as from efficiency, illuminance_uniformity, obtrusive_light_elimination
+    and light_pollution.
+
+    :param all_rays: List of all rays from LED
+    :param road_intersections: List of tuples (x-coordinate of intersection, intensity, intensity with cosine error)
+    :param total_intensity: Total intensity of all rays from LED
+    :param number_of_led: Number of LEDs in the device
+    :param road_sections: Number of road sections
+    :param road_start: X coordinate of start of the road
+    :param road_length: Length of the road
+    :param cosine_error: yes/no indicator whether to work with cosine error
+    :return: Tuple ([efficiency, illuminance uniformity, obtrusive light elimination, number of misdirected rays],
+     list of intensity of incident rays of each road section)
+    """
+    intensity_from_device = 0
+    upwards_rays = 0
+    for ray in all_rays:
+        if not ray.terminated:
+            intensity_from_device += ray.intensity
+        last_part = ray.ray_array[-1]
+        if last_part.p2.y > last_part.p1.y:
+            upwards_rays += 1
+
+    intersections = np.array(road_intersections, dtype=float).reshape(-1, 3)
+    column = 1 if cosine_error == "no" else 2
+    segments_intensity = compute_segments_intensity_population(intersections[None, :, 0],
+                                                               intersections[None, :, column], road_sections,
+                                                               road_start, road_length)[0].tolist()
+    if intensity_from_device == 0:
+        obtrusive_light = 1
+    else:
+        obtrusive_light = float(intersections[:, 1].sum()) / (intensity_from_device * number_of_led)
+    return [intensity_from_device / total_intensity, illuminance_uniformity(segments_intensity), obtrusive_light,
+            upwards_rays], segments_intensity
+
+
+def intensity_from_device_population(intensities: np.ndarray, terminated: np.ndarray) -> np.ndarray:
+    """
+    Compute intensity of rays leaving the device for all individuals at once
+
+    :param intensities: Array (individuals x rays) of intensities of rays leaving the device, zero for padded rays
+    :param terminated: Array (individuals x rays) indicating terminated rays
+    :return: Array of sums of intensities of rays that were not terminated
+    """
+    return np.where(terminated, 0, intensities).sum(axis=1)
+
+
+def efficiency_population(intensity_from_device: np.ndarray, total_intensities: np.ndarray) -> np.ndarray:
+    """
+    Compute efficiency of all individuals at once.
+
+    :param intensity_from_device: Array of intensities of rays leaving the device
+    :param total_intensities: Array of total intensities of all rays from LED
+    :return: Array of fractions of intensity of rays leaving the device to the total intensity of all rays from LED
+    """
+    return intensity_from_device / total_intensities
+
+
+def illuminance_uniformity_population(segments_intensity: np.ndarray) -> np.ndarray:
+    """
+    Compute illuminance uniformity of all individuals at once
+
+    :param segments_intensity: Array (individuals x road sections) of intensity of incident rays
+    :return: Array of ratios of minimal segment illuminance to maximal segment illuminance
+    """
+    max_illuminance = segments_intensity.max(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(max_illuminance == 0, 0, segments_intensity.min(axis=1) / max_illuminance)
+
+
+def obtrusive_light_elimination_population(intensity_from_device: np.ndarray, intensity_on_road: np.ndarray,
+                                           number_of_led: int) -> np.ndarray:
+    """
+    Compute what fraction of light is directed on the road for all individuals at once.
+
+    :param intensity_from_device: Array of intensities of rays leaving the device
+    :param intensity_on_road: Array of sums of intensities of road intersections of all LEDs
+    :param number_of_led: Number of LEDs in the device
+    :return: Array of fractions of the light that falls on the road
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(intensity_from_device == 0, 1, intensity_on_road / (intensity_from_device * number_of_led))
+
+
+def light_pollution_population(directions: np.ndarray, ray_mask: np.ndarray) -> np.ndarray:
+    """
+    Compute light pollution of all individuals at once
+
+    :param directions: Array (individuals x rays x 2) of directions of the last parts of rays
+    :param ray_mask: Array (individuals x rays), False for padded rays
+    :return: Array of amounts of rays that are misdirected
+    """
+    return ((directions[:, :, 1] > 0) & ray_mask).sum(axis=1)
+
+
+def criteria_population(intensities: np.ndarray, terminated: np.ndarray, total_intensities: np.ndarray,
+                        intensity_on_road: np.ndarray, segments_intensity: np.ndarray, directions: np.ndarray,
+                        ray_mask: np.ndarray, number_of_led: int) -> np.ndarray:
+    """
+    Compute all four criteria of all individuals at once, intensity of rays leaving the device is computed
+    only once for efficiency and obtrusive light elimination.
+
+    :param intensities: Array (individuals x rays) of intensities of rays leaving the device, zero for padded rays
+    :param terminated: Array (individuals x rays) indicating terminated rays
+    :param total_intensities: Array of total intensities of all rays from LED
+    :param intensity_on_road: Array of sums of intensities of road intersections of all LEDs
+    :param segments_intensity: Array (individuals x road sections) of intensity of incident rays
+    :param directions: Array (individuals x rays x 2) of directions of the last parts of rays
+    :param ray_mask: Array (individuals x rays), False for padded rays
+    :param number_of_led: Number of LEDs in the device
+    :return: Array (individuals x 4) of efficiency, illuminance uniformity, obtrusive light elimination and number
+     of misdirected rays
+    """
+    intensity_from_device = intensity_from_device_population(intensities, terminated)
+    return np.stack([efficiency_population(intensity_from_device, total_intensities),
+                     illuminance_uniformity_population(segments_intensity),
+                     obtrusive_light_elimination_population(intensity_from_device, intensity_on_road, number_of_led),
+                     light_pollution_population(directions, ray_mask)], axis=1)
@@ -1,8 +1,9 @@
 from typing import List, Tuple
 
+import numpy as np
+from numpy import ndarray
 from sympy import Rational, Segment
 
-from custom_geometry import prepare_intersections
 from custom_ray import MyRay
 
 
@@ -49,7 +50,8 @@ def sum_intensity(rays: List[MyRay]) -> float:
 def compute_segments_intensity(road_intersections: List[Tuple[Rational, float, float]], road_sections: int,
                                road_start: int, road_length: int, cosine_error: str) -> List[float]:
     """
-    Compute sum of intensity of incidents rays for each segment
+    Compute sum of intensity of incidents rays for each segment. Intersections are binned into road sections
+    by histogram, they do not need to be sorted.
 
     :param road_intersections: List of tuples (x-coord of road intersection, intensity of incident ray,
     intensity with cosine error)
@@ -59,25 +61,32 @@ def compute_segments_intensity(road_intersections: List[Tuple[Rational, float, f
     :cosine_error: yes/no indicator whether to work with cosine error
     :return: List of intensity of incident rays of each road segment
     """
-    segments_size = road_length / road_sections
-    segments_intensity = [0] * road_sections
-    intersections = prepare_intersections(road_intersections)
-    right_border = road_start
-    counter = 0
-    for segment in range(road_sections):
-        left_border = right_border
-        right_border += segments_size
-        stay = True
-        while stay and counter < len(intersections):
-            stay = False
-            if left_border <= intersections[counter][0] < right_border:
-                if cosine_error == "no":
-                    segments_intensity[segment] += intersections[counter][1]
-                else:
-                    segments_intensity[segment] += intersections[counter][2]
-                counter += 1
-                stay = True
-    return segments_intensity
+    column = 1 if cosine_error == "no" else 2
+    intersections = np.array(road_intersections, dtype=float).reshape(-1, 3)
+    return compute_segments_intensity_population(intersections[None, :, 0], intersections[None, :, column],
+                                                 road_sections, road_start, road_length)[0].tolist()
+
+
+def compute_segments_intensity_population(x: ndarray, intensities: ndarray, road_sections: int, road_start: int,
+                                          road_length: int) -> ndarray:
+    """
+    Compute sum of intensity of incident rays for each segment for all individuals at once
+
+    :param x: Array (individuals x intersections) of x-coords of road intersections, NaN if there is none
+    :param intensities: Array (individuals x intersections) of intensities of incident rays
+    :param road_sections: Number of road sections
+    :param road_start: X coordinate of start of the road
+    :param road_length: Length of the road
+    :return: Array (individuals x road sections) of intensity of incident rays of each road segment
+    """
+    # Borders of sections are accumulated the same way as in the original sweep over sorted intersections
+    borders = np.cumsum(np.concatenate([[road_start], np.full(road_sections, road_length / road_sections)]))
+    section = np.searchsorted(borders, x, side="right") - 1
+    valid = (section >= 0) & (section < road_sections)
+    individual = np.broadcast_to(np.arange(len(x))[:, None], x.shape)
+    index = individual[valid] * road_sections + section[valid]
+    return np.bincount(index, weights=intensities[valid], minlength=len(x) * road_sections).reshape(len(x),
+                                                                                                   road_sections)
 
 
 def compute_proportional_intensity(segments_intensity: List[float]) -> List[float]:
@@ -0,0 +1,121 @@
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from python_json_config import ConfigBuilder
+
+from component import Component
+from environment import Environment
+from evolution import evaluate_population
+
+DISTRIBUTIONS = ["random", "uniform", "stratified", "sobol", "halton", "importance"]
+CRITERIA = ["efficiency", "illuminance uniformity", "obtrusive light elimination"]
+
+
+def estimate_criteria(individuals: List[Component], env: Environment, number_of_rays: int,
+                      distribution: str) -> np.ndarray:
+    """
+    Sample new rays for all individuals and evaluate them
+
+    :param individuals: Individuals with fixed reflective segments
+    :param env: Environment with weighted sum criterion and numpy backend
+    :param number_of_rays: Number of rays going from LED
+    :param distribution: Ray distribution
+    :return: Array (individuals x 3) of efficiency, illuminance uniformity and obtrusive light elimination
+    """
+    for ind in individuals:
+        ind.sample_rays(number_of_rays, distribution)
+    evaluate_population(individuals, env)
+    return np.array([ind.fitness_array[:3] for ind in individuals])
+
+
+def convergence(individuals: List[Component], env: Environment, distributions: List[str], rays: List[int],
+                repetitions: int, reference_rays: int) -> Dict[str, np.ndarray]:
+    """
+    Compute error of criteria estimated with given numbers of rays. Reference values are estimated with uniform
+    fan of reference number of rays. Deterministic fans (uniform, Sobol, Halton) are evaluated only once.
+
+    :param individuals: Individuals with fixed reflective segments
+    :param env: Environment with weighted sum criterion and numpy backend
+    :param distributions: Ray distributions to compare
+    :param rays: Numbers of rays going from LED
+    :param repetitions: Number of repetitions for random fans
+    :param reference_rays: Number of rays of reference fan
+    :return: Root mean square error (numbers of rays x 3) of each distribution
+    """
+    reference = estimate_criteria(individuals, env, reference_rays, "uniform")
+    errors = {}
+    for distribution in distributions:
+        count = 1 if distribution in ["uniform", "sobol", "halton"] else repetitions
+        errors[distribution] = np.array([
+            np.sqrt(np.mean([(estimate_criteria(individuals, env, number_of_rays, distribution) - reference) ** 2
+                             for _ in range(count)], axis=(0, 1)))
+            for number_of_rays in rays])
+    return errors
+
+
+def rays_needed(rays: List[int], errors: np.ndarray, target_error: float) -> str:
+    """
+    Find the smallest number of rays from which the error stays below the target
+
+    :param rays: Numbers of rays in increasing order
+    :param errors: Array of errors for each number of rays
+    :param target_error: Target error
+    :return: Number of rays or ">max" if the target was not reached
+    """
+    above = np.flatnonzero(errors > target_error)
+    if len(above) == 0:
+        return str(rays[0])
+    if above[-1] == len(rays) - 1:
+        return f">{rays[-1]}"
+    return str(rays[above[-1] + 1])
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="Compare ray distributions by number of rays needed to estimate "
+                                                 "quality criteria with given error")
+    parser.add_argument("--individuals", type=int, default=20, help="number of random individuals")
+    parser.add_argument("--repetitions", type=int, default=5, help="repetitions of random fans")
+    parser.add_argument("--rays", type=str, default="16,32,64,128,256,512,1024,2048,4096",
+                        help="comma separated numbers of rays")
+    parser.add_argument("--reference-rays", type=int, default=50000, help="rays of reference uniform fan")
+    parser.add_argument("--target-error", type=float, default=0.01, help="target root mean square error")
+    parser.add_argument("--distributions", type=str, default=",".join(DISTRIBUTIONS))
+    parser.add_argument("--configuration", type=str, default=None,
+                        help="two connected or multiple free, configuration from parameters.json by default")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    config = ConfigBuilder().parse_config('parameters.json')
+    lamp = config.lamp
+    configuration = args.configuration or lamp.configuration
+    env = Environment(config.road.start, config.road.end, config.road.depth, config.road.sections, "weighted sum",
+                      config.evaluation.cosine_error, config.evaluation.reflective_factor, configuration,
+                      lamp.number_of_LEDs, lamp.separating_distance, lamp.modification, config.evaluation.weights,
+                      config.evaluation.reflections_timeout, "numpy", lamp.led_offsets)
+    random.seed(args.seed)
+    individuals = [Component(env, 1, "uniform", lamp.two_connected.angle_lower_bound,
+                             lamp.two_connected.angle_upper_bound, lamp.two_connected.length_lower_bound,
+                             lamp.two_connected.length_upper_bound, lamp.multiple_free.no_of_reflective_segments,
+                             lamp.multiple_free.distance_limit, lamp.multiple_free.length_limit, lamp.base_length,
+                             lamp.base_slope)
+                   for _ in range(args.individuals)]
+
+    rays = [int(number) for number in args.rays.split(",")]
+    distributions = args.distributions.split(",")
+    start = time.perf_counter()
+    errors = convergence(individuals, env, distributions, rays, args.repetitions, args.reference_rays)
+    print(f"{configuration}, {args.individuals} individuals, reference {args.reference_rays} rays, "
+          f"{time.perf_counter() - start:.1f} s")
+    for column, criterion in enumerate(CRITERIA):
+        print(f"\n{criterion} - RMSE by number of rays, rays needed for error {args.target_error}")
+        print(f"{'':12}" + "".join(f"{number:>9}" for number in rays) + f"{'needed':>9}")
+        for distribution in distributions:
+            print(f"{distribution:12}" + "".join(f"{error:9.4f}" for error in errors[distribution][:, column]) +
+                  f"{rays_needed(rays, errors[distribution][:, column], args.target_error):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import csv
+import gzip
+import json
+import random
+import zlib
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+import pytest
+
+import auxiliary
+from auxiliary import Renderer, StatsLogger, draw, draw_raster, place_leds, rasterize_polylines, ray_polylines
+from evolution import evaluate
+
+
+@pytest.mark.parametrize('stats_format', ["csv", "jsonl"])
+def test_stats_logger(tmp_path, monkeypatch, stats_format: str):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "stats").mkdir()
+    columns = ["generation", "best fitness", "reflective segments"]
+    rows = [[1, 0.5, [[0.0, 1.0, 2.0, 3.0]]], [2, 0.75, []], [3, 0.875, [[1.5, 2.0, 3.0, 4.5]]]]
+    with StatsLogger("stats", columns, stats_format, flush_interval=100) as stats:
+        stats.write(rows[0])
+        stats.write(rows[1])
+    # Resumed evolution appends rows without header
+    with StatsLogger("stats", columns, stats_format, append=True) as stats:
+        stats.write(rows[2])
+
+    with open(f"stats/log-stats.{stats_format}") as f:
+        if stats_format == "csv":
+            lines = list(csv.reader(f))
+            assert lines[0] == columns
+            written = [[int(line[0]), float(line[1]), json.loads(line[2])] for line in lines[1:]]
+        else:
+            written = [[row[column] for column in columns] for row in map(json.loads, f)]
+    assert written == rows
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'number_of_led', 'modification', 'compress', 'expected_copies'],
+    [
+        ["two connected", 1, "shift", False, 1],
+        ["two connected", 2, "mirror", True, 2],
+        ["multiple free", 16, "shift", False, 16],
+    ]
+)
+def test_draw(make_lamp, tmp_path, monkeypatch, configuration: str, number_of_led: int, modification: str,
+              compress: bool, expected_copies: int):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "img").mkdir()
+    random.seed(2)
+    env, [ind] = make_lamp(number_of_rays=100, ray_distribution="random", configuration=configuration,
+                           number_of_led=number_of_led, modification=modification)
+    evaluate(ind, env)
+    draw(ind, "best", env, compress)
+
+    if compress:
+        with gzip.open("img/img-best.svgz", "rt") as f:
+            image = f.read()
+    else:
+        with open("img/img-best.svg") as f:
+            image = f.read()
+    assert image.startswith("<svg") and image.endswith("</svg>")
+    # Device of one LED is drawn once, other LEDs refer to it
+    assert image.count('<use xlink:href="#led"') == expected_copies
+    # Every drawn ray and every segment of the device is one subpath
+    rays = ind.rays
+    drawn_rays = sum(len(rays.ray_path(index)) > 1 or not rays.terminated[index] for index in range(len(rays)))
+    device = 3 if configuration == "two connected" else 1 + len(ind.reflective_segments)
+    assert image.count(" M") + image.count('"M') == drawn_rays + device
+
+
+@pytest.mark.parametrize('backend', ["sympy", "numpy"])
+def test_ray_polylines(make_lamp, backend: str):
+    random.seed(3)
+    env, [ind] = make_lamp(backend=backend)
+    evaluate(ind, env)
+    polylines, intensities = ray_polylines(ind, env, 100)
+    rays = ind.rays
+    drawn = [index for index in range(len(rays)) if len(rays.ray_path(index)) > 1 or not rays.terminated[index]]
+    assert len(polylines) == len(intensities) == len(drawn)
+    for polyline, intensity, index in zip(polylines, intensities, drawn):
+        assert intensity == rays.intensities[index]
+        assert np.allclose(polyline[:len(rays.ray_path(index))], rays.ray_path(index))
+        if rays.terminated[index]:
+            assert len(polyline) == len(rays.ray_path(index))
+        elif np.isnan(rays.road_intersections[index]):
+            assert np.allclose(polyline[-1], rays.origins[index] + 100 * rays.directions[index])
+        else:
+            assert np.allclose(polyline[-1], [rays.road_intersections[index], env.road_depth])
+
+
+@pytest.mark.parametrize(
+    ['policy', 'interval', 'expected'],
+    [
+        ["interval", 1, ["0", "1", "2", "3", "4", "5"]],
+        ["interval", 3, ["2", "5"]],
+        ["improvement", 1, ["0", "2", "5"]],
+        ["final", 1, ["final"]],
+    ]
+)
+@pytest.mark.parametrize('background', [False, True])
+def test_renderer(monkeypatch, policy: str, interval: int, expected: List[str], background: bool):
+    drawn = []
+    monkeypatch.setattr(auxiliary, "draw", lambda ind, name, env, compress: drawn.append(name))
+    renderer = Renderer(None, policy, interval, background)
+    for generation, fitness in enumerate([0.5, 0.5, 0.7, 0.7, 0.7, 0.9]):
+        renderer.update(generation, SimpleNamespace(fitness=fitness), str(generation))
+    renderer.finish(SimpleNamespace(fitness=0.9), "final")
+    assert drawn == expected
+
+
+@pytest.mark.parametrize(
+    ['polyline', 'expected'],
+    [
+        [[[0, -0.5], [4, -0.5]], [(0, 0), (0, 1), (0, 2), (0, 3)]],
+        [[[0.5, -0.5], [2.5, -2.5]], [(0, 0), (1, 1), (2, 2)]],
+        [[[0.5, -3.5], [0.5, -1.5], [2.5, -1.5]], [(1, 0), (2, 0), (3, 0), (1, 1), (1, 2)]],
+        [[[-10, 10], [-1, 3]], []],
+    ]
+)
+def test_rasterize_polylines(polyline: List[List[float]], expected: List[tuple]):
+    # Environment point (x, y) is drawn at pixel (row, column) = (-y, x)
+    buffer = rasterize_polylines([np.array(polyline, dtype=float)], np.array([0.5]), 1, 0, 0, (4, 4))
+    assert sorted(zip(*np.nonzero(buffer))) == sorted(expected)
+    assert np.all(buffer[buffer > 0] >= 0.5)
+
+
+@pytest.mark.parametrize(
+    ['number_of_led', 'modification', 'expected'],
+    [
+        [1, "shift", [2]],
+        [3, "shift", [2, 4, 6]],
+        [2, "mirror", [2, 5]],
+    ]
+)
+def test_place_leds(make_lamp, number_of_led: int, modification: str, expected: List[int]):
+    env, _ = make_lamp(0, road_end=10, road_depth=-5, criterion="efficiency", configuration="two connected",
+                       number_of_led=number_of_led, separating_distance=2, modification=modification)
+    buffer = np.zeros((1, 10))
+    buffer[0, 2] = 1
+    # Environment x is drawn at column x + 5
+    assert list(np.nonzero(place_leds(buffer, env, 1, 5)[0])[0]) == expected
+
+
+@pytest.mark.parametrize('image_format', ["png", "pgm"])
+def test_draw_raster(make_lamp, tmp_path, monkeypatch, image_format: str):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "img").mkdir()
+    random.seed(2)
+    env, [ind] = make_lamp(number_of_rays=100, ray_distribution="random", road_start=-6000, road_end=6000,
+                           configuration="two connected", number_of_led=3, separating_distance=240)
+    evaluate(ind, env)
+    draw_raster(ind, "best", env, image_format, 280)
+
+    with open(f"img/img-best.{image_format}", "rb") as f:
+        data = f.read()
+    # Image covers the environment with 1000 units margin, 280 pixels for 14000 units
+    if image_format == "png":
+        assert data[:8] == b"\x89PNG\r\n\x1a\n"
+        assert data[16:24] == (280).to_bytes(4, "big") + (120).to_bytes(4, "big")
+        raw = zlib.decompress(data[41:-12])
+        image = np.frombuffer(raw, dtype=np.uint8).reshape(120, 1 + 280 * 3)[:, 1:].reshape(120, 280, 3)
+        assert image.any(axis=2).sum() > 0
+    else:
+        assert data.startswith(b"P5\n280 120\n255\n")
+        assert len(data) == len(b"P5\n280 120\n255\n") + 280 * 120
@@ -1,11 +1,35 @@
+import random
 from typing import List, Tuple
 
+import numpy as np
 import pytest
-from sympy import Rational, Ray, Segment, Point, cos, pi
+from sympy import Rational, Ray, Segment, Point, cos, pi, sin
 
-from custom_geometry import compute_reflection, prepare_intersections, compute_intersections, rotate_segment, \
-    change_size_segment
+import custom_geometry
+import custom_geometry_numpy
+from custom_geometry import prepare_intersections, rotate_segment, change_size_segment
+from custom_operators import mutate_angle
 from custom_ray import MyRay
+from evolution import evaluate
+from quality_assessment import criteria, efficiency, illuminance_uniformity, light_pollution, \
+    obtrusive_light_elimination
+from quality_precalculations import compute_segments_intensity
+
+
+@pytest.fixture(params=["sympy", "numpy"])
+def backend(request) -> str:
+    return request.param
+
+
+def assert_same_ray(actual, expected: Ray, backend: str):
+    if backend == "sympy":
+        assert actual == expected
+        return
+    expected = custom_geometry_numpy.to_array(expected)
+    actual_direction = (actual[1] - actual[0]) / np.linalg.norm(actual[1] - actual[0])
+    expected_direction = (expected[1] - expected[0]) / np.linalg.norm(expected[1] - expected[0])
+    assert np.allclose(actual[0], expected[0], atol=custom_geometry_numpy.TOLERANCE)
+    assert np.allclose(actual_direction, expected_direction, atol=custom_geometry_numpy.TOLERANCE)
 
 
 @pytest.mark.parametrize(
@@ -18,9 +42,26 @@ from custom_ray import MyRay
         [Ray(Point(2, 4), Point(4, 0)), Segment(Point(2, 2), Point(3, 0)), 0.78, 0.5, None],
     ]
 )
-def test_compute_reflection(ray: Ray, surface: Segment, intensity: float, r_factor: float, expected: (Ray, float)):
-    actual = compute_reflection(ray=ray, surface=surface, intensity=intensity, reflective_factor=r_factor)
-    assert actual == expected
+def test_compute_reflection(ray: Ray, surface: Segment, intensity: float, r_factor: float, expected: (Ray, float),
+                            backend: str):
+    if backend == "sympy":
+        actual = custom_geometry.compute_reflection(ray=ray, surface=surface, intensity=intensity,
+                                                    reflective_factor=r_factor)
+    else:
+        ray = custom_geometry_numpy.to_array(ray)
+        hit_points, directions, intensities, _, no_of_reflections, _ = custom_geometry_numpy.trace_population(
+            ray[None, None, 0], ray[None, None, 1] - ray[None, None, 0], np.array([[intensity]]),
+            custom_geometry_numpy.to_array(surface)[None, None], np.full((1, 1), -1), np.ones((1, 1), dtype=bool),
+            r_factor, 1)
+        actual = None
+        if no_of_reflections[0, 0]:
+            reflected_ray = np.array([hit_points[0, 0, 0], hit_points[0, 0, 0] + directions[0, 0]])
+            actual = reflected_ray, intensities[0, 0]
+    if expected is None:
+        assert actual is None
+    else:
+        assert_same_ray(actual[0], expected[0], backend)
+        assert abs(actual[1] - expected[1]) < custom_geometry_numpy.TOLERANCE
 
 
 @pytest.mark.parametrize(
@@ -33,10 +74,20 @@ def test_compute_reflection(ray: Ray, surface: Segment, intensity: float, r_fact
     ]
 )
 def test_compute_intersections(rays: List[MyRay], road: Segment, cosine_error: str,
-                               expected: List[Tuple[Rational, float]]):
-    actual = compute_intersections(rays=rays, road=road, cosine_error=cosine_error)
+                               expected: List[Tuple[Rational, float]], backend: str):
+    if backend == "sympy":
+        actual = custom_geometry.compute_intersections(rays=rays, road=road)
+    else:
+        origins = np.array([[float(ray.origin.x), float(ray.origin.y)] for ray in rays])
+        angles = np.radians([ray.angle for ray in rays])
+        x, reduction = custom_geometry_numpy.road_hits(origins, np.stack([np.cos(angles), np.sin(angles)], axis=1),
+                                                       custom_geometry_numpy.to_array(road))
+        intensities = np.array([ray.end_intensity for ray in rays])
+        actual = list(zip(x, intensities, intensities * reduction))
+    intensity_index = 2 if cosine_error == "Yes" else 1
+    assert len(actual) == len(expected)
     for a, e in zip(actual, expected):
-        assert abs(a[0] - e[0]) < 0.0001 and abs(a[1] - e[1]) < 0.0001
+        assert abs(a[0] - e[0]) < 0.0001 and abs(a[intensity_index] - e[1]) < 0.0001
 
 
 @pytest.mark.parametrize(
@@ -79,3 +130,266 @@ def test_rotate_segment(segment: Segment, angle: int, expected: Segment):
 def test_change_size_segment(segment: Segment, coefficient: float, expected: Segment):
     actual = change_size_segment(segment=segment, coefficient=coefficient)
     assert actual == expected
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'number_of_led', 'modification', 'seed'],
+    [
+        ["two connected", 1, "shift", 0],
+        ["two connected", 2, "mirror", 1],
+        ["multiple free", 1, "shift", 2],
+        ["multiple free", 3, "shift", 3],
+    ]
+)
+def test_backends_agree(make_lamp, configuration: str, number_of_led: int, modification: str, seed: int):
+    fitness = {}
+    fitness_array = {}
+    rays = {}
+    for backend in ["sympy", "numpy"]:
+        random.seed(seed)
+        env, [ind] = make_lamp(cosine_error="yes", configuration=configuration, number_of_led=number_of_led,
+                               modification=modification, backend=backend)
+        fitness[backend] = evaluate(ind, env)
+        fitness_array[backend] = ind.fitness_array
+        rays[backend] = ind.rays
+    assert abs(fitness["sympy"] - fitness["numpy"]) < custom_geometry_numpy.TOLERANCE
+    assert np.allclose(fitness_array["sympy"], fitness_array["numpy"], atol=custom_geometry_numpy.TOLERANCE)
+    assert np.array_equal(rays["sympy"].path_offsets, rays["numpy"].path_offsets)
+    assert np.allclose(rays["sympy"].path, rays["numpy"].path, atol=custom_geometry_numpy.TOLERANCE)
+    assert np.allclose(rays["sympy"].intensities, rays["numpy"].intensities, atol=custom_geometry_numpy.TOLERANCE)
+    assert np.array_equal(rays["sympy"].terminated, rays["numpy"].terminated)
+    assert np.allclose(rays["sympy"].road_intersections, rays["numpy"].road_intersections,
+                       atol=custom_geometry_numpy.TOLERANCE, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    ['number_of_rays', 'number_of_segments', 'seed'],
+    [
+        [10, 6, 0],
+        [10, 12, 1],
+    ]
+)
+def test_trace_population_matches_closest_segment(number_of_rays: int, number_of_segments: int, seed: int):
+    rng = np.random.default_rng(seed)
+    segments = rng.integers(-400, 400, size=(number_of_segments, 2, 2))
+    directions = rng.integers(-100, 100, size=(number_of_rays, 2))
+    directions[np.all(directions == 0, axis=1)] = [1, 0]
+    hit_points, _, actual_intensities, terminated, no_of_reflections, _ = custom_geometry_numpy.trace_population(
+        np.zeros((1, number_of_rays, 2)), directions[None], np.ones((1, number_of_rays)), segments[None],
+        np.full((1, number_of_rays), -1), np.ones((1, number_of_rays), dtype=bool), 0.9, 5)
+    sympy_segments = [Segment(Point(*segment[0]), Point(*segment[1])) for segment in segments.tolist()]
+    for index in range(number_of_rays):
+        ray_array = [Ray(Point(0, 0), Point(*directions[index].tolist()))]
+        intensity = 1.0
+        last = None
+        segment = custom_geometry.closest_segment(sympy_segments, ray_array[-1], last)
+        while segment and len(ray_array) <= 5:
+            ray_array, intensity = custom_geometry.compute_reflection_segment_simple(ray_array, segment[0],
+                                                                                     intensity, 0.9)
+            last = segment[0]
+            segment = custom_geometry.closest_segment(sympy_segments, ray_array[-1], last)
+        reflections = len(ray_array) - 1
+        assert no_of_reflections[0, index] == reflections
+        assert terminated[0, index] == (reflections == 5)
+        assert abs(actual_intensities[0, index] - intensity) < custom_geometry_numpy.TOLERANCE
+        for bounce in range(reflections):
+            assert np.allclose(hit_points[bounce, 0, index], [float(ray_array[bounce + 1].p1.x),
+                                                              float(ray_array[bounce + 1].p1.y)])
+
+
+@pytest.mark.parametrize(
+    ['right_angle', 'right_length_coef', 'left_angle', 'left_length_coef', 'right_end', 'left_end'],
+    [
+        [90, 2, 30, 1, [20, -80], [-20 - 40 * np.cos(np.pi / 6), -20]],
+        [135, 1, -45, 1.5, [20 + 40 * np.sqrt(0.5), -40 * np.sqrt(0.5)], [-20 - 60 * np.sqrt(0.5), 60 * np.sqrt(0.5)]],
+        [210, 1, 165, 1, [20 + 40 * np.cos(np.pi / 6), 20], [-20 + 40 * np.cos(np.pi / 12), -40 * np.sin(np.pi / 12)]],
+    ]
+)
+def test_two_connected_segments(make_lamp, right_angle: int, right_length_coef: float, left_angle: int,
+                                left_length_coef: float, right_end: List[float], left_end: List[float]):
+    random.seed(7)
+    _, [ind] = make_lamp(number_of_rays=8, base_slope=0, cosine_error="yes", configuration="two connected")
+    ind.right_angle, ind.right_length_coef = right_angle, right_length_coef
+    ind.left_angle, ind.left_length_coef = left_angle, left_length_coef
+    ind.update_segments()
+    assert not np.allclose(ind.right_segment_array[1], right_end)
+    ind.segments_dirty = True
+    ind.update_segments()
+    assert np.allclose(ind.right_segment_array, [[20, 0], right_end])
+    assert np.allclose(ind.left_segment_array, [[-20, 0], left_end])
+    assert np.allclose(custom_geometry_numpy.to_array(ind.right_segment), ind.right_segment_array)
+    mutate_angle(ind)
+    assert ind.segments_dirty
+
+
+@pytest.mark.parametrize(
+    ['right_angle', 'left_angle', 'base_slope'],
+    [
+        [210, 165, 90],
+        [170, 100, 90],
+        [240, 120, 90],
+        [135, -45, 0],
+        [150, 60, 0],
+        # Segments cross each other or left segment is between LED and right segment
+        [100, 120, 90],
+        [120, 150, 90],
+        [60, 150, 30],
+    ]
+)
+def test_backends_agree_two_connected(make_lamp, right_angle: int, left_angle: int, base_slope: int):
+    fitness = {}
+    fitness_array = {}
+    for backend in ["sympy", "numpy"]:
+        random.seed(4)
+        env, [ind] = make_lamp(number_of_rays=6, base_slope=base_slope, cosine_error="yes",
+                               configuration="two connected", backend=backend)
+        ind.right_angle, ind.left_angle = right_angle, left_angle
+        ind.segments_dirty = True
+        ind.update_segments()
+        fitness[backend] = evaluate(ind, env)
+        fitness_array[backend] = ind.fitness_array
+    assert abs(fitness["sympy"] - fitness["numpy"]) < custom_geometry_numpy.TOLERANCE
+    assert np.allclose(fitness_array["sympy"], fitness_array["numpy"], atol=custom_geometry_numpy.TOLERANCE)
+
+
+def trace_one_individual(origins: np.ndarray, directions: np.ndarray, intensities: np.ndarray, segments: np.ndarray,
+                         last_reflection: np.ndarray) -> Tuple[np.ndarray, ...]:
+    hit_points, directions, intensities, terminated, no_of_reflections, hit_segments = \
+        custom_geometry_numpy.trace_population(origins[None], directions[None], intensities[None], segments[None],
+                                               last_reflection[None], np.ones((1, len(origins)), dtype=bool), 0.9, 20)
+    return hit_points[:, 0], directions[0], intensities[0], terminated[0], no_of_reflections[0], hit_segments[:, 0]
+
+
+@pytest.mark.parametrize(
+    ['number_of_rays', 'number_of_segments', 'seed'],
+    [
+        [50, 1, 0],
+        [200, 20, 1],
+        [200, 300, 2],
+    ]
+)
+def test_trace_rays_bvh(number_of_rays: int, number_of_segments: int, seed: int):
+    rng = np.random.default_rng(seed)
+    segments = rng.integers(-400, 400, size=(number_of_segments, 2, 2)).astype(float)
+    # Axis-parallel segments have flat boxes
+    segments[0, 1, 1] = segments[0, 0, 1]
+    angles = rng.uniform(0, 2 * np.pi, number_of_rays)
+    directions = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    directions[0] = [1, 0]
+    origins = np.zeros((number_of_rays, 2))
+    intensities = np.ones(number_of_rays)
+    last_reflection = np.full(number_of_rays, -1)
+    expected = trace_one_individual(origins, directions, intensities, segments, last_reflection)
+    bvh = custom_geometry_numpy.SegmentBVH(segments)
+    actual = custom_geometry_numpy.trace_rays_bvh(origins, directions, intensities, bvh, last_reflection, 0.9, 20)
+    for actual_part, expected_part in zip(actual, expected):
+        assert np.allclose(actual_part, expected_part, equal_nan=True)
+
+    segments[-1] += 500
+    updated = bvh.update(segments)
+    assert not np.allclose(bvh.segments, segments)
+    assert np.allclose(updated.levels[0], custom_geometry_numpy.SegmentBVH(segments).levels[0])
+    actual = custom_geometry_numpy.trace_rays_bvh(origins, directions, intensities, updated, last_reflection, 0.9, 20)
+    expected = trace_one_individual(origins, directions, intensities, segments, last_reflection)
+    for actual_part, expected_part in zip(actual, expected):
+        assert np.allclose(actual_part, expected_part, equal_nan=True)
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'cosine_error', 'number_of_led'],
+    [
+        ["two connected", "no", 1],
+        ["multiple free", "yes", 3],
+    ]
+)
+def test_criteria(make_lamp, configuration: str, cosine_error: str, number_of_led: int):
+    random.seed(10)
+    env, [ind] = make_lamp(ray_distribution="random", cosine_error=cosine_error, configuration=configuration,
+                           number_of_led=number_of_led, backend="sympy")
+    evaluate(ind, env)
+    road_intersections = custom_geometry.compute_intersections(ind.original_rays, env.road)
+    road_intersections = custom_geometry.recalculate_intersections(road_intersections, env.led_offsets, 24, "shift",
+                                                                   env.road_start, env.road_end)
+    segments_intensity = compute_segments_intensity(road_intersections, 4, env.road_start, env.road_length,
+                                                    cosine_error)
+    values, actual_segments_intensity = criteria(ind.original_rays, road_intersections,
+                                                 ind.ray_fan.total_intensity, number_of_led, 4, env.road_start,
+                                                 env.road_length, cosine_error)
+    expected = [efficiency(ind.original_rays), illuminance_uniformity(segments_intensity),
+                obtrusive_light_elimination(ind.original_rays, road_intersections, number_of_led),
+                light_pollution(ind.original_rays)]
+    assert np.allclose(values, expected)
+    assert np.allclose(actual_segments_intensity, segments_intensity)
+
+
+@pytest.mark.parametrize(
+    ['intersections', 'led_offsets', 'modification', 'expected'],
+    [
+        [[(Rational(10), 0.5, 0.25), (Rational(95), 0.2, 0.1)], [0, 24], "mirror",
+         [(10, 0.5, 0.25), (95, 0.2, 0.1)]],
+        [[(Rational(-40), 0.5, 0.25), (Rational(-150), 0.2, 0.1)], [0, 24], "mirror",
+         [(-40, 0.5, 0.25), (16, 0.5, 0.25), (-150, 0.2, 0.1)]],
+        [[(Rational(10), 0.5, 0.25), (Rational(80), 0.2, 0.1)], [0, 24, 48], "shift",
+         [(10, 0.5, 0.25), (34, 0.5, 0.25), (58, 0.5, 0.25), (80, 0.2, 0.1)]],
+        [[(Rational(10), 0.5, 0.25), (Rational(80), 0.2, 0.1)], [0, -15, 35], "shift",
+         [(10, 0.5, 0.25), (45, 0.5, 0.25), (80, 0.2, 0.1), (65, 0.2, 0.1)]],
+        [[], [0, 24], "shift", []],
+    ]
+)
+def test_recalculate_intersections(intersections: List[Tuple[Rational, float, float]], led_offsets: List[float],
+                                   modification: str, expected: List[Tuple[float, float, float]]):
+    recalculated = custom_geometry.recalculate_intersections(intersections, led_offsets, 24, modification, 0, 100)
+    assert np.allclose(recalculated, np.array(expected, dtype=float).reshape(-1, 3))
+
+
+@pytest.mark.parametrize(
+    ['ray', 'expected_x'],
+    [
+        [Ray(Point(0, 0), Point(1, -2)), Rational(5)],
+        [Ray(Point(3, 1), Point(2, -1)), Rational(-5, 2)],
+        [Ray(Point(20, -5), Point(30, -15)), Rational(25)],
+        [Ray(Point(0, 0), Point(1, 2)), None],
+        [Ray(Point(0, 0), Point(1, 0)), None],
+        [Ray(Point(0, 0), Point(-3, -1)), None],
+    ]
+)
+def test_horizontal_road_intersection(ray: Ray, expected_x: Rational, backend: str):
+    road = Segment(Point(-5, -10), Point(25, -10))
+    expected = road.intersection(ray)
+    assert (expected[0].x if expected else None) == expected_x
+    if backend == "sympy":
+        actual = custom_geometry.horizontal_road_intersection(ray, road.p1.y, road.p1.x, road.p2.x)
+        if expected_x is None:
+            assert actual is None
+        else:
+            assert actual[0] == expected_x
+            assert abs(actual[1] - float(sin(ray.angle_between(road)))) < custom_geometry_numpy.TOLERANCE
+    else:
+        ray = custom_geometry_numpy.to_array(ray)
+        direction = (ray[1] - ray[0]) / np.hypot(*(ray[1] - ray[0]))
+        x, reduction = custom_geometry_numpy.road_hits(ray[0], direction, custom_geometry_numpy.to_array(road))
+        if expected_x is None:
+            assert np.isnan(x)
+        else:
+            assert abs(x - float(expected_x)) < custom_geometry_numpy.TOLERANCE
+            assert abs(reduction - float(sin(Ray(Point(0, 0), Point(*direction)).angle_between(road)))) < \
+                custom_geometry_numpy.TOLERANCE
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'seed'],
+    [
+        ["multiple free", 5],
+        ["multiple free", 6],
+        ["two connected", 5],
+        ["two connected", 7],
+    ]
+)
+def test_backends_agree_importance(make_lamp, configuration: str, seed: int):
+    fitness = {}
+    for backend in ["sympy", "numpy"]:
+        random.seed(seed)
+        env, [ind] = make_lamp(ray_distribution="importance", cosine_error="yes", configuration=configuration,
+                               backend=backend)
+        fitness[backend] = evaluate(ind, env)
+    assert abs(fitness["sympy"] - fitness["numpy"]) < custom_geometry_numpy.TOLERANCE
@@ -0,0 +1,24 @@
+import random
+
+import numpy as np
+import pytest
+
+from custom_ray import halton_sequence, sample_ray_fan, sobol_sequence
+
+
+def test_low_discrepancy_sequences():
+    assert sobol_sequence(7, 2).tolist() == [[0.5, 0.5], [0.75, 0.25], [0.25, 0.75], [0.375, 0.375],
+                                             [0.875, 0.875], [0.625, 0.125], [0.125, 0.625]]
+    assert np.allclose(halton_sequence(6, 3), [1/3, 2/3, 1/9, 4/9, 7/9, 2/9])
+
+
+@pytest.mark.parametrize('distribution', ["stratified", "sobol", "halton", "importance"])
+def test_sample_ray_fan(distribution: str):
+    random.seed(0)
+    fan = sample_ray_fan(256, distribution, 15)
+    assert len(fan.angles) == 256
+    assert np.all((fan.angles >= 195) & (fan.angles <= 375))
+    # Total intensity estimates the same Lambertian integral as uniform fan
+    assert abs(fan.total_intensity - sample_ray_fan(256, "uniform", 15).total_intensity) < 0.01 * 256
+    if distribution == "importance":
+        assert np.allclose(fan.intensities, 2 / np.pi)
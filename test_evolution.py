@@ -0,0 +1,189 @@
+import random
+from types import SimpleNamespace
+from typing import List
+
+import numpy as np
+import pytest
+from deap import base, tools
+
+import custom_geometry_numpy
+from component import Component
+from custom_operators import shift_one_segment, rotate_one_segment, resize_one_segment
+from evolution import evaluate, evaluate_population, evolution, replace_population, select_parents
+
+# Parameters of short evolution runs, environment is given by each test
+EVOLUTION_PARAMETERS = dict(number_of_rays=10, ray_distribution="random", angle_lower_bound=90, angle_upper_bound=180,
+                            length_lower_bound=1, length_upper_bound=3, no_of_reflective_segments=4,
+                            distance_limit=400, length_limit=300, population_size=4, number_of_generations=4,
+                            xover_prob=0.4, mut_angle_prob=0.4, mut_length_prob=0.4, shift_segment_prob=0.4,
+                            rotate_segment_prob=0.4, resize_segment_prob=0.4, tilt_base_prob=0.4, base_length=40,
+                            base_slope=90, base_angle_limit_min=45, base_angle_limit_max=135)
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'criterion', 'number_of_led', 'modification'],
+    [
+        ["two connected", "weighted sum", 2, "mirror"],
+        ["multiple free", "weighted sum", 3, "shift"],
+        ["multiple free", "obtrusive light", 1, "shift"],
+    ]
+)
+def test_evaluate_population(make_lamp, configuration: str, criterion: str, number_of_led: int, modification: str):
+    random.seed(4)
+    env, population = make_lamp(3, number_of_rays=8, road_sections=8, criterion=criterion, cosine_error="yes",
+                                configuration=configuration, number_of_led=number_of_led, separating_distance=300,
+                                modification=modification)
+    expected = [evaluate(ind, env) for ind in population]
+    expected_segments_intensity = [ind.segments_intensity for ind in population]
+    actual = evaluate_population(population, env)
+    assert np.allclose(actual, expected, atol=custom_geometry_numpy.TOLERANCE)
+    for ind, segments_intensity in zip(population, expected_segments_intensity):
+        assert np.allclose(ind.segments_intensity, segments_intensity, atol=custom_geometry_numpy.TOLERANCE)
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'backend'],
+    [
+        ["two connected", "sympy"],
+        ["multiple free", "numpy"],
+    ]
+)
+def test_clone(make_lamp, configuration: str, backend: str):
+    random.seed(6)
+    env, [ind] = make_lamp(number_of_rays=8, cosine_error="yes", configuration=configuration, backend=backend)
+    expected = evaluate(ind, env)
+    clone = ind.clone()
+    assert clone.genotype(configuration) == ind.genotype(configuration)
+    assert clone.fitness_array == ind.fitness_array and clone.fitness_array is not ind.fitness_array
+    assert np.array_equal(clone.rays.path, ind.rays.path) and clone.rays is not ind.rays
+    assert abs(evaluate(clone, env) - expected) < custom_geometry_numpy.TOLERANCE
+    if configuration == "multiple free":
+        clone.reflective_segments[0] = clone.reflective_segments[1]
+        assert ind.reflective_segments[0] != ind.reflective_segments[1]
+
+
+def test_evaluate_population_bvh(make_lamp, monkeypatch):
+    random.seed(8)
+    env, population = make_lamp(3, number_of_rays=20, no_of_reflective_segments=12, road_sections=8,
+                                cosine_error="yes", number_of_led=2, separating_distance=300)
+    expected = evaluate_population(population, env)
+    expected_rays = [ind.rays.copy() for ind in population]
+    monkeypatch.setattr(custom_geometry_numpy, "BVH_MIN_SEGMENTS", 1)
+    actual = evaluate_population(population, env)
+    assert np.allclose(actual, expected, atol=custom_geometry_numpy.TOLERANCE)
+    for ind, rays in zip(population, expected_rays):
+        assert ind.segment_bvh is not None
+        assert np.allclose(ind.rays.path, rays.path)
+
+
+@pytest.mark.parametrize(
+    ['mutation', 'bvh_min_segments'],
+    [
+        [lambda segments: shift_one_segment(segments, "x"), 64],
+        [rotate_one_segment, 64],
+        [resize_one_segment, 1],
+    ]
+)
+def test_incremental_retrace(make_lamp, mutation, bvh_min_segments: int, monkeypatch):
+    monkeypatch.setattr(custom_geometry_numpy, "BVH_MIN_SEGMENTS", bvh_min_segments)
+    random.seed(9)
+    env, population = make_lamp(4, number_of_rays=100, no_of_reflective_segments=20, road_sections=8,
+                                cosine_error="yes")
+    evaluate_population(population, env)
+    mutants = [ind.clone() for ind in population]
+    for mutant in mutants:
+        mutant.reflective_segments = mutation(mutant.reflective_segments)
+    fresh = [mutant.clone() for mutant in mutants]
+    for ind in fresh:
+        ind.rays.segments = None
+    actual = evaluate_population(mutants, env)
+    expected = evaluate_population(fresh, env)
+    assert np.allclose(actual, expected)
+    for mutant, ind in zip(mutants, fresh):
+        assert np.array_equal(mutant.rays.path_offsets, ind.rays.path_offsets)
+        assert np.allclose(mutant.rays.path, ind.rays.path)
+        assert np.array_equal(mutant.rays.hit_segments, ind.rays.hit_segments)
+        assert np.allclose(mutant.rays.intensities, ind.rays.intensities)
+
+
+@pytest.mark.parametrize(
+    ['algorithm', 'mu', 'expected'],
+    [
+        ["generational", 4, [4, 0]],
+        ["steady state", 4, [5, 3, 4, 0]],
+        ["mu+lambda", 4, [5, 4, 3, 2]],
+        ["mu,lambda", 2, [4, 0]],
+    ]
+)
+def test_replace_population(algorithm: str, mu: int, expected: List[float]):
+    pop = [SimpleNamespace(fitness=fitness) for fitness in [1, 5, 3, 2]]
+    offspring = [SimpleNamespace(fitness=fitness) for fitness in [4, 0]]
+    next_pop = replace_population(base.Toolbox(), pop, offspring, algorithm, mu, "weighted sum")
+    assert [ind.fitness for ind in next_pop] == expected
+
+
+@pytest.mark.parametrize(
+    ['count', 'population_size'],
+    [
+        [2, 4],
+        [4, 4],
+        [6, 4],
+        [6, 6],
+        [7, 7],
+        [2, 10],
+        [10, 10],
+        [3, 3],
+    ]
+)
+def test_select_parents(make_lamp, count: int, population_size: int):
+    random.seed(4)
+    toolbox = base.Toolbox()
+    toolbox.register("select", tools.selNSGA2)
+    toolbox.register("clone", Component.clone)
+    env, pop = make_lamp(population_size, criterion="nsgaii", configuration="two connected")
+    for ind, fitness in zip(pop, evaluate_population(pop, env)):
+        ind.fitness = fitness
+    pop = toolbox.select(pop, len(pop))
+    parents = select_parents(toolbox, pop, count, "nsgaii")
+    assert len(parents) == count
+    assert all(parent not in pop for parent in parents)
+
+
+def test_evolution_nsgaii_population_size(make_lamp, tmp_path, monkeypatch):
+    # Population size is not a multiple of four
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "stats").mkdir()
+    (tmp_path / "img").mkdir()
+    random.seed(6)
+    env, _ = make_lamp(0, criterion="nsgaii")
+    hof = evolution(env=env, **{**EVOLUTION_PARAMETERS, "population_size": 6, "number_of_generations": 3},
+                    render_policy="none")
+    assert len(hof) > 0
+
+
+@pytest.mark.parametrize(
+    ['configuration', 'criterion', 'algorithm'],
+    [
+        ["two connected", "weighted sum", "generational"],
+        ["multiple free", "nsgaii", "steady state"],
+    ]
+)
+def test_checkpoint_resume(make_lamp, tmp_path, monkeypatch, configuration: str, criterion: str, algorithm: str):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "stats").mkdir()
+    (tmp_path / "img").mkdir()
+    env, _ = make_lamp(0, criterion=criterion, configuration=configuration)
+    parameters = dict(env=env, **EVOLUTION_PARAMETERS, algorithm=algorithm, checkpoint_interval=2)
+    random.seed(5)
+    expected_hof = evolution(**parameters)
+    expected_random = random.random()
+
+    # Interrupted run leaves checkpoint of the second generation
+    random.seed(5)
+    evolution(**{**parameters, "number_of_generations": 2})
+    random.seed(1)
+    hof = evolution(**parameters, resume=True)
+
+    assert [ind.genotype(configuration) for ind in hof] == [ind.genotype(configuration) for ind in expected_hof]
+    assert [ind.fitness for ind in hof] == [ind.fitness for ind in expected_hof]
+    assert random.random() == expected_random
@@ -0,0 +1,26 @@
+import random
+
+import numpy as np
+
+from evolution import evaluate
+from fitness_cache import FitnessCache
+
+
+def test_evaluate_with_cache(make_lamp):
+    random.seed(5)
+    env, [ind] = make_lamp(number_of_rays=8, road_sections=8)
+    cache = FitnessCache(10)
+    expected = evaluate(ind, env, cache)
+    expected_fitness_array = list(ind.fitness_array)
+    expected_path = ind.rays.path.copy()
+    # Changes of the evaluated individual do not reach the cached result
+    ind.fitness_array[0] = None
+    ind.rays.path[:] = np.nan
+    actual = evaluate(ind, env, cache)
+    assert actual == expected
+    assert ind.fitness_array == expected_fitness_array
+    assert np.array_equal(ind.rays.path, expected_path)
+    ind.fitness_array[0] = None
+    assert evaluate(ind, env, cache) == expected
+    assert ind.fitness_array == expected_fitness_array
+    assert (cache.hits, cache.misses) == (2, 1)
@@ -0,0 +1,22 @@
+import pytest
+
+from islands import Migration
+
+
+@pytest.mark.parametrize(
+    ['topology', 'number_of_islands'],
+    [
+        ["ring", 2],
+        ["ring", 5],
+        ["random", 3],
+        ["random", 6],
+    ]
+)
+def test_migration_target(topology: str, number_of_islands: int):
+    inboxes = [None] * number_of_islands
+    for generation in range(10):
+        targets = [Migration(index, inboxes, topology, 1, 1, 7).target(generation)
+                   for index in range(number_of_islands)]
+        # Every island sends migrants to another island and receives exactly one group of migrants
+        assert sorted(targets) == list(range(number_of_islands))
+        assert all(target != index for index, target in enumerate(targets))
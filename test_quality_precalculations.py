@@ -51,6 +51,30 @@ def test_compute_segments_intensity(intersections_on: List[Tuple[Rational, float
         assert abs(a - e) < 0.0001
 
 
+@pytest.mark.parametrize(
+    ['road_intersections', 'road_sections', 'road_start', 'road_length', 'cosine_error', 'expected'],
+    [
+        [[(Rational(180000, 31), 0.22, 0.1), (Rational(21, 10), 0.5, 0.4), (Rational(400), 0.89, 0.3)], 4, 0, 8000,
+         "no", [1.39, 0, 0.22, 0]],
+        [[(Rational(180000, 31), 0.22, 0.1), (Rational(21, 10), 0.5, 0.4), (Rational(400), 0.89, 0.3)], 4, 0, 8000,
+         "yes", [0.7, 0, 0.1, 0]],
+        [[(Rational(-5), 1, 1), (Rational(100), 0.5, 0.5), (Rational(8100), 0.3, 0.3)], 8, 100, 8000, "no",
+         [0.5, 0, 0, 0, 0, 0, 0, 0]],
+        [[(Rational(3), 0.5, 0.5), (Rational(9999, 10), 0.25, 0.25)], 1000, 0, 1000, "no",
+         [0] * 3 + [0.5] + [0] * 995 + [0.25]],
+        [[], 8, 100, 19000, "no", [0] * 8]
+    ]
+)
+def test_compute_segments_intensity_binning(road_intersections: List[Tuple[Rational, float, float]],
+                                            road_sections: int, road_start: int, road_length: int,
+                                            cosine_error: str, expected: List[float]):
+    actual = compute_segments_intensity(road_intersections=road_intersections, road_sections=road_sections,
+                                        road_start=road_start, road_length=road_length, cosine_error=cosine_error)
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert abs(a - e) < 0.0001
+
+
 @pytest.mark.parametrize(
     ['segments_intensity', 'expected'],
     [